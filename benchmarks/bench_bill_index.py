@@ -0,0 +1,78 @@
+"""Build a bill index of synthetic bills and time near-duplicate lookups.
+
+Usage:
+    python -m benchmarks.bench_bill_index [--bills 200000] [--lookups 2000] [--path /tmp/bill_index.sqlite3]
+
+Bills draw 8-40 lines from a catalogue of 5000 priced items with random
+quantities. Resubmissions are copies with OCR noise (mangled names, a
+misread amount, a line missed); new bills are fresh draws. The report
+gives the build rate, index size, lookup latency (p50/p99) and how many
+resubmissions were found and new bills wrongly matched. Use --bills
+1000000 for the million-bill figure (the build takes about fifteen minutes).
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.cache.bill_index import BillSignatureIndex
+
+CATALOGUE = [(f"Item {index} {random.Random(index).choice(['Tab', 'Cap', 'Inj', 'Syrup', 'Test'])}",
+              round(random.Random(-index).lognormvariate(4, 1), 2)) for index in range(5000)]
+
+
+def synthetic_bill(rng: random.Random):
+    return [{"item_name": name, "item_amount": round(rate * quantity, 2)}
+            for (name, rate), quantity in zip(rng.sample(CATALOGUE, rng.randint(8, 40)),
+                                              (rng.randint(1, 5) for _ in range(40)))]
+
+
+def resubmission(bill, rng: random.Random):
+    copy = [dict(item) for item in bill]
+    for item in rng.sample(copy, max(1, len(copy) // 10)):
+        item["item_name"] = item["item_name"].upper().replace(" ", "  ", 1) + "."
+    copy[rng.randrange(len(copy))]["item_amount"] += 1.0
+    if rng.random() < 0.5:
+        del copy[rng.randrange(len(copy))]
+    return copy
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bills", type=int, default=200000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--path", default=os.path.join(tempfile.mkdtemp(), "bill_index.sqlite3"))
+    args = parser.parse_args()
+
+    rng = random.Random(9)
+    index = BillSignatureIndex(args.path)
+    sampled = []
+    started = time.perf_counter()
+    for start in range(0, args.bills, 10000):
+        chunk = [synthetic_bill(rng) for _ in range(min(10000, args.bills - start))]
+        index.add_many((f"bill-{start + offset}", bill, bill[:10], None, None) for offset, bill in enumerate(chunk))
+        sampled.extend(rng.sample(chunk, min(len(chunk), args.lookups // max(1, args.bills // 10000))))
+    build_seconds = time.perf_counter() - started
+    stats = index.stats()
+    print(f"built {stats['bills']} bills in {build_seconds:.1f} s ({stats['bills'] / build_seconds:.0f} bills/s), "
+          f"{stats['size_bytes'] / 1e6:.0f} MB")
+
+    for label, queries in [("resubmissions", [resubmission(bill, rng) for bill in sampled[:args.lookups]]),
+                           ("new bills", [synthetic_bill(rng) for _ in range(args.lookups)])]:
+        timings, matched = [], 0
+        for query in queries:
+            lookup_started = time.perf_counter()
+            matched += index.lookup(query) is not None
+            timings.append((time.perf_counter() - lookup_started) * 1000)
+        print(f"{label:>14}: matched {matched}/{len(queries)}, lookup p50 {statistics.median(timings):.3f} ms, "
+              f"p99 {percentile(timings, 0.99):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Time line-item duplicate removal with the blocked index against pairwise scans.
+
+Usage:
+    python -m benchmarks.bench_dedup [--sizes 10 100 1000 10000] [--legacy-max 1000] [--duplicate-rate 0.15]
+
+Bills are synthetic: pharmacy and procedure lines with varied amounts, of
+which --duplicate-rate are repeated with OCR-style noise (case, a dropped
+or swapped character, a rounding difference in the amount). The legacy
+baseline compares every item against every kept item with SequenceMatcher,
+as ReconciliationEngine did before; it is skipped above --legacy-max items
+because it grows quadratically. Both must keep exactly the same items.
+"""
+import argparse
+import random
+import time
+from difflib import SequenceMatcher
+
+from src.reconciliation.dedup import RAPIDFUZZ_AVAILABLE, remove_duplicates
+
+PRODUCTS = ["Paracetamol 500mg Tab", "Amoxicillin 250mg Cap", "Pantoprazole 40mg Inj", "Ondansetron 4mg Tab",
+            "Normal Saline 500ml", "Ceftriaxone 1g Inj", "Metformin 500mg Tab", "Dolo 650 Tab",
+            "Consultation Fee", "Room Charges General Ward", "CBC Blood Test", "X-Ray Chest PA View",
+            "Nursing Charges", "IV Cannula 20G", "Disposable Syringe 5ml", "Surgical Gloves"]
+
+
+def noisy(name: str, rng: random.Random) -> str:
+    choice = rng.random()
+    if choice < 0.3:
+        return name.upper()
+    position = rng.randrange(len(name))
+    if choice < 0.6:
+        return name[:position] + name[position + 1:]
+    if choice < 0.8 and position + 1 < len(name):
+        return name[:position] + name[position + 1] + name[position] + name[position + 2:]
+    return name
+
+
+def synthetic_items(count: int, duplicate_rate: float, seed: int = 7):
+    rng = random.Random(seed)
+    items = []
+    while len(items) < count:
+        if items and rng.random() < duplicate_rate:
+            original = rng.choice(items)
+            items.append({"item_name": noisy(original["item_name"], rng),
+                          "item_amount": round(original["item_amount"] * rng.uniform(0.99, 1.01), 2)})
+        else:
+            items.append({"item_name": f"{rng.choice(PRODUCTS)} (Batch {rng.randrange(10 ** 4)})",
+                          "item_amount": round(rng.lognormvariate(5, 1.5), 2)})
+    return items
+
+
+def legacy_remove_duplicates(line_items):
+    unique_items = []
+    for item in line_items:
+        for existing in unique_items:
+            name_similarity = SequenceMatcher(None, item['item_name'].lower(), existing['item_name'].lower()).ratio()
+            max_amount = max(abs(item['item_amount']), abs(existing['item_amount']))
+            if max_amount > 0:
+                amount_similarity = 1 - abs(item['item_amount'] - existing['item_amount']) / max_amount
+            else:
+                amount_similarity = 1.0
+            if name_similarity > 0.9 and amount_similarity > 0.95:
+                break
+        else:
+            unique_items.append(item)
+    return unique_items
+
+
+def timed(function, items):
+    started = time.perf_counter()
+    result = function(items)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--legacy-max", type=int, default=1000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.15)
+    args = parser.parse_args()
+
+    print(f"rapidfuzz prefilter: {'on' if RAPIDFUZZ_AVAILABLE else 'not installed'}")
+    for size in args.sizes:
+        items = synthetic_items(size, args.duplicate_rate)
+        kept, blocked_seconds = timed(remove_duplicates, items)
+        line = f"{size:>6} items: blocked {blocked_seconds * 1000:9.1f} ms, {size - len(kept)} duplicates removed"
+        if size <= args.legacy_max:
+            legacy_kept, legacy_seconds = timed(legacy_remove_duplicates, items)
+            if [id(item) for item in legacy_kept] != [id(item) for item in kept]:
+                raise SystemExit(f"Blocked and pairwise results differ at {size} items")
+            line += f"; pairwise {legacy_seconds * 1000:9.1f} ms ({legacy_seconds / blocked_seconds:.0f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Time the discrepancy explainer on large bills with planted gaps.
+
+Usage:
+    python -m benchmarks.bench_explainer [--items 500] [--bills 50] [--budget-ms 50]
+
+Each bill gets --items line items. Its printed total is off by a planted
+set of 1 to 4 line items (counted but not billed), by the tax line, or by
+an amount no four lines reach (the worst case: every size is searched
+in full). The explainer has to find a set no larger than the planted one
+within its time budget; the report gives the median and worst time.
+"""
+import argparse
+import logging
+import random
+import statistics
+import time
+
+from src.reconciliation.explainer import DiscrepancyExplainer
+
+
+def planted_bill(items: int, planted: int, rng: random.Random):
+    line_items = [{"item_name": f"Line {index}", "item_amount": round(rng.lognormvariate(4, 1.2), 2)}
+                  for index in range(items)]
+    calculated = sum(item["item_amount"] for item in line_items)
+    totals = {"Tax": round(calculated * 0.05, 2)}
+    if planted == 0:
+        # Beyond any 4 lines, so every size is searched in full
+        gap = -sum(sorted(item["item_amount"] for item in line_items)[-4:]) - 100
+    elif planted == 5:
+        gap = totals["Tax"]
+    else:
+        gap = -sum(item["item_amount"] for item in rng.sample(line_items, planted))
+    totals["Total"] = round(calculated + gap, 2)
+    result = {"line_items": line_items, "removed_duplicates": [], "extracted_total": totals["Total"],
+              "is_reconciled": False}
+    return result, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--bills", type=int, default=50)
+    parser.add_argument("--budget-ms", type=float, default=50)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    rng = random.Random(5)
+    explainer = DiscrepancyExplainer(time_budget=args.budget_ms / 1000)
+    labels = {0: "no match", 5: "tax line"}
+    for planted in [1, 2, 3, 4, 5, 0]:
+        timings, found = [], 0
+        for _ in range(args.bills):
+            result, totals = planted_bill(args.items, planted, rng)
+            started = time.perf_counter()
+            candidates = explainer.explain(result, totals)
+            timings.append((time.perf_counter() - started) * 1000)
+            if candidates and len(candidates[0]["lines"]) <= (1 if planted == 5 else planted):
+                found += 1
+        label = labels.get(planted, f"{planted} extra lines")
+        print(f"{label:>15}: median {statistics.median(timings):6.1f} ms, worst {max(timings):6.1f} ms, "
+              f"explained {found}/{args.bills}")
+
+
+if __name__ == "__main__":
+    main()
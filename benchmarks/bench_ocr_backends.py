@@ -0,0 +1,59 @@
+"""Compare per-page OCR latency of the pytesseract and tesserocr backends.
+
+Usage:
+    python -m benchmarks.bench_ocr_backends [--pages 5] [--tessdata /usr/share/tesseract-ocr/5/tessdata]
+
+Each page runs the three `_robust_ocr` configurations sequentially, as one
+worker would. The first tesserocr page includes the one-off engine load and
+is reported separately. Backends that cannot run here are skipped.
+"""
+import argparse
+import time
+
+from benchmarks.bench_enhancement import synthetic_bill
+from src.extraction.ocr_backends import create_ocr_backend
+from src.extraction.tesseract_extractor import OCR_CONFIGS
+
+
+def time_pages(backend, pages, configs):
+    latencies = []
+    for page in pages:
+        start = time.perf_counter()
+        for config in configs:
+            backend.image_to_string(page, config=config)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=2260)
+    parser.add_argument("--tessdata", default=None)
+    args = parser.parse_args()
+
+    pages = [synthetic_bill(args.width, args.height, "L", seed=seed) for seed in range(args.pages)]
+    configs = list(OCR_CONFIGS.values())
+
+    for name in ("pytesseract", "tesserocr"):
+        try:
+            backend = create_ocr_backend(name, tessdata_path=args.tessdata)
+        except Exception as e:
+            print(f"{name:12s} skipped: {e}")
+            continue
+        try:
+            latencies = time_pages(backend, pages, configs)
+        except Exception as e:
+            print(f"{name:12s} skipped: {e}")
+            continue
+        finally:
+            backend.close()
+
+        warm = latencies[1:] or latencies
+        print(f"{name:12s} first page {latencies[0] * 1000:8.1f} ms   "
+              f"per page {sum(warm) / len(warm) * 1000:8.1f} ms  ({len(configs)} passes each)")
+
+
+if __name__ == "__main__":
+    main()
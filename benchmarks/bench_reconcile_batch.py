@@ -0,0 +1,89 @@
+"""Time columnar batch reconciliation against reconciling bills one at a time.
+
+Usage:
+    python -m benchmarks.bench_reconcile_batch [--bills 1000000] [--items 20] [--scalar-max 20000] [--cents]
+
+Bills are synthetic, with distinct item names (so duplicate removal keeps
+every item) and printed totals that are right, slightly off or missing.
+The batch path reconciles all of them from BillColumns; the per-bill
+baseline runs ReconciliationEngine.reconcile_extraction on the first
+--scalar-max bills and its time is extrapolated. Totals and verdicts of
+the bills both paths see must agree.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from src.reconciliation.columnar import BillColumns, bill_columns
+from src.reconciliation.validator import ReconciliationEngine
+
+
+def synthetic_columns(bills: int, items: int, seed: int = 11) -> BillColumns:
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(1, 2 * items, bills)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    quantity = rng.integers(1, 6, offsets[-1]).astype(np.float64)
+    rate = np.round(rng.lognormal(4, 1, offsets[-1]), 2)
+    amount = np.round(rate * quantity, 2)
+    # Every 50th item is misread, so its rate x quantity no longer matches
+    amount[::50] *= 3
+    totals = np.bincount(np.repeat(np.arange(bills), counts), weights=amount, minlength=bills)
+    totals = np.round(totals * rng.choice([1.0, 1.005, 1.2, 0.0], bills, p=[0.7, 0.1, 0.1, 0.1]), 2)
+    return BillColumns(amount, offsets, totals, rate, quantity)
+
+
+def as_extractions(columns: BillColumns, bills: int):
+    rng = np.random.default_rng(0)
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    extractions = []
+    for bill in range(bills):
+        start, end = columns.offsets[bill], columns.offsets[bill + 1]
+        names = ["".join(letters[row]) for row in rng.integers(0, 26, (end - start, 12))]
+        line_items = [{"item_name": name, "item_amount": float(columns.amount[index]),
+                       "item_rate": float(columns.rate[index]), "item_quantity": float(columns.quantity[index])}
+                      for name, index in zip(names, range(start, end))]
+        total = float(columns.extracted_total[bill])
+        extractions.append({"line_items": line_items, "totals": {"Total": total} if total else {}})
+    return extractions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bills", type=int, default=1000000)
+    parser.add_argument("--items", type=int, default=20, help="mean line items per bill")
+    parser.add_argument("--scalar-max", type=int, default=20000)
+    parser.add_argument("--cents", action="store_true", help="reconcile int64 cents instead of float64")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    engine = ReconciliationEngine()
+    columns = synthetic_columns(args.bills, args.items)
+    sample = as_extractions(columns, min(args.scalar_max, args.bills))
+    if args.cents:
+        columns = bill_columns(as_extractions(columns, args.bills), cents=True)
+
+    started = time.perf_counter()
+    batch = engine.reconcile_batch(columns)
+    batch_seconds = time.perf_counter() - started
+    items = int(columns.offsets[-1])
+    print(f"batch: {args.bills} bills, {items} items in {batch_seconds:.2f} s "
+          f"({batch.is_reconciled.mean():.1%} reconciled, {np.count_nonzero(batch.inconsistent_items)} bills "
+          f"with rate x quantity mismatches)")
+
+    started = time.perf_counter()
+    results = [engine.reconcile_extraction(extraction, extraction["totals"]) for extraction in sample]
+    scalar_seconds = time.perf_counter() - started
+    scale = 100 if args.cents else 1
+    for bill, result in enumerate(results):
+        if (result["is_reconciled"] != batch.is_reconciled[bill]
+                or abs(result["calculated_total"] * scale - batch.calculated_total[bill]) > 0.5 * scale / 100):
+            raise SystemExit(f"Batch and per-bill results differ for bill {bill}")
+    estimate = scalar_seconds / len(sample) * args.bills
+    print(f"per bill: {len(sample)} bills in {scalar_seconds:.2f} s, ~{estimate:.0f} s for all "
+          f"({estimate / batch_seconds:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Measure cold-start import time and memory of the app entry points.
+
+Usage:
+    python -m benchmarks.bench_startup [--targets app:app src.api.main:app] [--repeat 5] [--top 8] [--gunicorn]
+
+Each run imports the target in a fresh `python -X importtime` interpreter,
+as a gunicorn worker does without --preload, and reports the median wall
+time, peak RSS and the slowest top-level imports. It also lists which
+optional backend SDKs were loaded; with the lazy extractor registry none
+should be loaded until a request selects that backend. --gunicorn also
+times how long a single gunicorn worker takes to start accepting
+connections (uvicorn workers for ASGI apps; skipped if not installed).
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["boto3", "botocore", "azure.ai.formrecognizer", "pytesseract", "tesserocr", "pymupdf",
+                 "numpy", "PIL.Image", "rapidfuzz"]
+
+PROBE = """
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+module_name, _, attr = sys.argv[1].partition(":")
+app = getattr(importlib.import_module(module_name), attr or "app")
+print(json.dumps({
+    "import_ms": (time.perf_counter() - started) * 1000,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "asgi": not hasattr(app, "wsgi_app"),
+    "loaded": [name for name in sys.argv[2:] if name in sys.modules],
+}))
+"""
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def probe(target: str):
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE, target, *HEAVY_MODULES],
+                             capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"})
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    top_level = {}
+    for match in IMPORTTIME_LINE.finditer(process.stderr):
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 1:  # imported directly by the entry point
+            top_level[name] = cumulative / 1000
+    result["top_level"] = top_level
+    return result
+
+
+def gunicorn_boot_seconds(target: str, asgi: bool, timeout: float = 60.0) -> float:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    command = ["gunicorn", "--workers", "1", "--bind", f"127.0.0.1:{port}", target]
+    if asgi:
+        command[1:1] = ["--worker-class", "uvicorn.workers.UvicornWorker"]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("gunicorn did not start listening")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=["app:app", "src.api.main:app"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--gunicorn", action="store_true")
+    args = parser.parse_args()
+
+    for target in args.targets:
+        try:
+            runs = [probe(target) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print(f"{target}: import failed ({e})")
+            continue
+        import_ms = statistics.median(run["import_ms"] for run in runs)
+        rss = statistics.median(run["max_rss_mb"] for run in runs)
+        print(f"{target}: import {import_ms:.0f} ms (median of {args.repeat}), peak RSS {rss:.1f} MB")
+        print(f"  backend SDKs loaded: {', '.join(runs[0]['loaded']) or 'none'}")
+        slowest = sorted(runs[0]["top_level"].items(), key=lambda entry: -entry[1])[:args.top]
+        for name, cumulative_ms in slowest:
+            print(f"  {cumulative_ms:8.1f} ms  {name}")
+
+        if args.gunicorn:
+            if shutil.which("gunicorn") is None:
+                print("  gunicorn: not installed, skipped")
+                continue
+            try:
+                boot = gunicorn_boot_seconds(target, runs[0]["asgi"])
+                print(f"  gunicorn worker ready in {boot * 1000:.0f} ms")
+            except RuntimeError as e:
+                print(f"  gunicorn: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Time Textract response parsing with the block index against linear Id scans.
+
+Usage:
+    python -m benchmarks.bench_textract_parser [--sizes 1000 10000 50000] [--legacy-max 10000]
+
+Responses are synthetic AnalyzeDocument output: item tables (CELL blocks
+with WORD children) plus KEY_VALUE_SET totals. The legacy baseline runs the
+same parser over an index that resolves every child Id with
+`next(b for b in blocks if b['Id'] == id)`, as AWSTextractExtractor did
+before; it is skipped above --legacy-max blocks because it grows
+quadratically. Both must produce identical results.
+"""
+import argparse
+import time
+
+from src.extraction.textract_parser import TextractBlockIndex, TextractResponseParser
+
+
+def synthetic_response(target_blocks: int) -> dict:
+    """A Textract-like response with roughly `target_blocks` blocks"""
+    blocks = []
+    counter = iter(range(10 ** 9))
+
+    def new_block(block_type, **fields):
+        block = {"Id": f"b{next(counter)}", "BlockType": block_type, **fields}
+        blocks.append(block)
+        return block
+
+    def words(*texts):
+        return [{"Type": "CHILD", "Ids": [new_block("WORD", Text=text)["Id"] for text in texts]}]
+
+    while len(blocks) < target_blocks:
+        table = new_block("TABLE", Relationships=[{"Type": "CHILD", "Ids": []}])
+        for row in range(1, 41):
+            if row == 1:
+                texts = ["Item", "Qty", "Rate", "Amount"]
+            else:
+                texts = [f"Medicine {row} Tab", "2", f"{row}.50", f"{2 * row + 1}.00"]
+            for column, text in enumerate(texts, start=1):
+                cell = new_block("CELL", RowIndex=row, ColumnIndex=column, Relationships=words(*text.split()))
+                table["Relationships"][0]["Ids"].append(cell["Id"])
+        value = new_block("KEY_VALUE_SET", EntityTypes=["VALUE"], Relationships=words("1234.00"))
+        new_block("KEY_VALUE_SET", EntityTypes=["KEY"],
+                  Relationships=words("Total", "Amount") + [{"Type": "VALUE", "Ids": [value["Id"]]}])
+    return {"Blocks": blocks}
+
+
+class LinearBlockIndex(TextractBlockIndex):
+    """Baseline: the pre-index lookups, scanning every block per child Id"""
+
+    def __init__(self, blocks):
+        super().__init__()
+        self.blocks = list(blocks)
+
+    def of_type(self, block_type):
+        return [block for block in self.blocks if block["BlockType"] == block_type]
+
+    def related_blocks(self, block, relationship_type="CHILD", block_type=None):
+        found = []
+        for relationship in block.get("Relationships", []):
+            if relationship["Type"] == relationship_type:
+                for related_id in relationship["Ids"]:
+                    related = next((b for b in self.blocks if b["Id"] == related_id), None)
+                    if related and (block_type is None or related["BlockType"] == block_type):
+                        found.append(related)
+        return found
+
+
+def parse_legacy(response):
+    return TextractResponseParser().parse_index(LinearBlockIndex(response.get("Blocks", [])))
+
+
+def best_of(parse, response, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = parse(response)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--legacy-max", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        response = synthetic_response(size)
+        indexed_time, result = best_of(TextractResponseParser().parse, response, args.repeat)
+        line = (f"{len(response['Blocks']):6d} blocks  indexed {indexed_time * 1000:9.1f} ms"
+                f"  ({len(result['line_items'])} items)")
+        if size <= args.legacy_max:
+            legacy_time, legacy = best_of(parse_legacy, response, 1)
+            assert legacy == result
+            line += f"  legacy {legacy_time * 1000:10.1f} ms  ({legacy_time / indexed_time:.0f}x)"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,26 @@ class Settings:
     AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
     AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
     AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+    # "sync", "async" (StartDocumentAnalysis via S3) or "auto" (async for PDFs when a bucket is set)
+    TEXTRACT_MODE = os.getenv("TEXTRACT_MODE", "auto")
+    TEXTRACT_S3_BUCKET = os.getenv("TEXTRACT_S3_BUCKET")
+    # Override for local testing, e.g. the stub in src/stubs/textract_stub.py
+    TEXTRACT_ENDPOINT_URL = os.getenv("TEXTRACT_ENDPOINT_URL")
+    
+    # Hedge slow Azure requests to Textract (needs both configured)
+    CLOUD_HEDGING = os.getenv("CLOUD_HEDGING", "False").lower() == "true"
+    HEDGE_DELAY_PERCENTILE = float(os.getenv("HEDGE_DELAY_PERCENTILE", "95"))
+    HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+    
+    # Content-addressed cache of documents, preprocessed pages and OCR text
+    # (src/cache/document_cache.py); unset disables it
+    DOCUMENT_CACHE_DIR = os.getenv("DOCUMENT_CACHE_DIR")
+    DOCUMENT_CACHE_MAX_SIZE_MB = int(os.getenv("DOCUMENT_CACHE_MAX_SIZE_MB", "512"))
+    
+    # Near-duplicate index of processed bills (src/cache/bill_index.py); unset disables it
+    BILL_INDEX_PATH = os.getenv("BILL_INDEX_PATH")
+    # Serve a likely resubmission from the index after its first page instead of extracting it all
+    BILL_INDEX_SHORT_CIRCUIT = os.getenv("BILL_INDEX_SHORT_CIRCUIT", "False").lower() == "true"
     
     # LLM APIs
     ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
@@ -24,17 +44,39 @@ class Settings:
     REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "30"))
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     
+    # Extractor backends to use, cheapest first (see src/extraction/registry.py).
+    # Unset: Tesseract plus every cloud backend whose credentials are present.
+    EXTRACTORS = os.getenv("EXTRACTORS")
+    
+    # Settings each backend cannot run without
+    REQUIRED_SETTINGS = {
+        "azure": ("AZURE_FORM_RECOGNIZER_ENDPOINT", "AZURE_FORM_RECOGNIZER_KEY"),
+        "azure_async": ("AZURE_FORM_RECOGNIZER_ENDPOINT", "AZURE_FORM_RECOGNIZER_KEY"),
+        "textract": ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"),
+    }
+    
     @property
     def use_mock(self):
         """Use mock extractor if no Azure credentials"""
         return not (self.AZURE_FORM_RECOGNIZER_ENDPOINT and self.AZURE_FORM_RECOGNIZER_KEY)
     
+    @property
+    def enabled_extractors(self):
+        """Backend names in cascade order"""
+        if self.EXTRACTORS:
+            return [name.strip() for name in self.EXTRACTORS.split(",") if name.strip()]
+        enabled = ["tesseract"]
+        for name in ("azure", "textract"):
+            if all(getattr(self, setting) for setting in self.REQUIRED_SETTINGS[name]):
+                enabled.append(name)
+        return enabled
+    
     def validate(self):
-        """Validate required settings"""
-        if not self.AZURE_FORM_RECOGNIZER_ENDPOINT:
-            raise ValueError("AZURE_FORM_RECOGNIZER_ENDPOINT is required")
-        if not self.AZURE_FORM_RECOGNIZER_KEY:
-            raise ValueError("AZURE_FORM_RECOGNIZER_KEY is required")
+        """Validate required settings of the enabled backends only"""
+        for name in self.enabled_extractors:
+            for setting in self.REQUIRED_SETTINGS.get(name, ()):
+                if not getattr(self, setting):
+                    raise ValueError(f"{setting} is required for the {name} extractor")
 
 settings = Settings()
 settings.validate()
\ No newline at end of file
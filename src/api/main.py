@@ -1,8 +1,13 @@
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, Dict, Any
 import logging
+import time
+from config.settings import settings
+from src.extraction.circuit_breaker import breaker_states
+from src.extraction.hedging import hedge_metrics
 from src.extraction.pipeline import BillExtractionPipeline
 
 logger = logging.getLogger(__name__)
@@ -35,6 +40,8 @@ class BillResponse(BaseModel):
     is_success: bool
     data: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    # Per-stage timings (ms), page count and answering extractor
+    metadata: Optional[Dict[str, Any]] = None
 
 @app.get("/")
 async def root():
@@ -46,7 +53,14 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "bill-extraction-api"}
+    breakers = breaker_states()
+    degraded = any(breaker["state"] != "closed" for breaker in breakers.values())
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "service": "bill-extraction-api",
+        "circuit_breakers": breakers,
+        "hedges": hedge_metrics()
+    }
 
 @app.post("/extract-bill-data", response_model=BillResponse)
 async def extract_bill_data(request: BillRequest):
@@ -55,10 +69,13 @@ async def extract_bill_data(request: BillRequest):
     
     - **document**: Publicly accessible URL of the bill document (image/PDF)
     """
+    deadline = time.monotonic() + settings.REQUEST_TIMEOUT
     try:
         logger.info(f"Processing bill extraction request for: {request.document}")
         
-        result = pipeline.process_document(str(request.document))
+        # The pipeline blocks on downloads, OCR and extractor polling; keep it off the event loop.
+        # Extractors that can (the async Azure client, hedged cloud calls) give up at the deadline.
+        result = await run_in_threadpool(pipeline.process_document, str(request.document), deadline=deadline)
         
         if not result["is_success"]:
             raise HTTPException(
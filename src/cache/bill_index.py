@@ -0,0 +1,299 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Signature kinds: the whole bill, and its first page only (for lookups before the rest is extracted)
+BILL, FIRST_PAGE = 0, 1
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_NOT_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercased letters and digits only, so OCR spacing and punctuation don't matter"""
+    return _NOT_ALPHANUMERIC.sub("", str(name).lower())
+
+
+def bill_features(line_items: Iterable[Dict[str, Any]]) -> List[str]:
+    """The set MinHash is taken over: each item's amount, and its name with its amount.
+
+    Repeated amounts are numbered, so a bill with the same line twice
+    differs from one with it once.
+    """
+    features = set()
+    seen: Dict[int, int] = {}
+    for item in line_items:
+        cents = int(round(float(item["item_amount"]) * 100))
+        seen[cents] = seen.get(cents, 0) + 1
+        features.add(f"a:{cents}:{seen[cents]}")
+        features.add(f"i:{normalize_name(item.get('item_name', ''))}:{cents}")
+    return sorted(features)
+
+
+class BillSignatureIndex:
+    """Persistent near-duplicate index of reconciled bills (MinHash + LSH).
+
+    Each bill gets a `num_perm`-value MinHash signature of its features
+    (see bill_features), split into `bands` bands; a lookup fetches every
+    stored signature that shares a whole band with the query (one indexed
+    query), then keeps the best one whose estimated Jaccard similarity is
+    at least `threshold`. With the defaults (60 values, 20 bands of 3) a
+    bill with similarity 0.5 is found with probability 0.93 (0.99 at 0.6),
+    and one with 0.2 becomes a candidate with probability 0.15. Short
+    circuiting on a first-page match needs `short_circuit_threshold` and
+    whole-document evidence (see first_page_match).
+
+    Signatures live in SQLite (WAL) at `path`, so all workers share the
+    index and it survives restarts; each thread keeps its own connection.
+    A bill takes about 1.5 KB (both signatures and their band keys).
+    """
+
+    def __init__(self, path: str, num_perm: int = 60, bands: int = 20, threshold: float = 0.5,
+                 short_circuit: bool = False, short_circuit_threshold: float = 0.8,
+                 short_circuit_min_items: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.path = path
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        # Serve a match's stored result instead of extracting the rest of the document
+        self.short_circuit = short_circuit
+        self.short_circuit_threshold = short_circuit_threshold
+        self.short_circuit_min_items = short_circuit_min_items
+        self.seed = seed
+        generator = np.random.RandomState(seed)
+        self._a = generator.randint(1, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = generator.randint(0, _MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._init_index()
+
+    def __getstate__(self):
+        # Batch worker processes open their own connections
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _init_index(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bills (
+                    id INTEGER PRIMARY KEY,
+                    document_key TEXT NOT NULL UNIQUE,
+                    source_url TEXT,
+                    item_count INTEGER NOT NULL,
+                    result TEXT,
+                    created REAL NOT NULL,
+                    page_count INTEGER,
+                    printed_total REAL
+                )
+            """)
+            # Indexes built before page_count/printed_total were stored
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(bills)")}
+            for column, column_type in (("page_count", "INTEGER"), ("printed_total", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE bills ADD COLUMN {column} {column_type}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    id INTEGER PRIMARY KEY,
+                    bill_id INTEGER NOT NULL,
+                    kind INTEGER NOT NULL,
+                    signature BLOB NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS lsh (
+                    key INTEGER NOT NULL,
+                    signature_id INTEGER NOT NULL,
+                    PRIMARY KEY (key, signature_id)
+                ) WITHOUT ROWID
+            """)
+            layout = json.dumps({"num_perm": self.num_perm, "bands": self.bands, "seed": self.seed})
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('layout', ?)", (layout,))
+            stored = conn.execute("SELECT value FROM meta WHERE key = 'layout'").fetchone()[0]
+        if stored != layout:
+            raise ValueError(f"Bill index {self.path} was built with {stored}, not {layout}")
+
+    def signature(self, line_items: Iterable[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """MinHash signature (uint32 values) of a bill's items; None for a bill without items"""
+        features = bill_features(line_items)
+        if not features:
+            return None
+        # crc32 rather than hash(), which is salted per process; the index outlives processes
+        hashes = np.array([zlib.crc32(feature.encode()) for feature in features], dtype=np.uint64)
+        # Wrapping uint64 arithmetic, as in the usual numpy MinHash; the permutations only need to be fixed
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        return (permuted & np.uint64(_MAX_HASH)).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray, kind: int) -> List[int]:
+        # 32-bit keys keep the table small; a colliding key only adds a candidate that fails verification
+        return [zlib.crc32(bytes([kind, band]) + signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                for band in range(self.bands)]
+
+    def lookup(self, line_items: Iterable[Dict[str, Any]], kind: int = BILL,
+               threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """The most similar indexed bill at or above the threshold, or None"""
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.signature(line_items)
+        if signature is None:
+            return None
+        keys = self._band_keys(signature, kind)
+        try:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT DISTINCT s.bill_id, s.signature FROM lsh JOIN signatures s ON s.id = lsh.signature_id "
+                f"WHERE lsh.key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+            best_id, best_similarity = None, 0.0
+            stored_values = signature.astype(np.uint16)
+            for bill_id, stored in rows:
+                similarity = float(np.mean(np.frombuffer(stored, dtype=np.uint16) == stored_values))
+                if similarity >= threshold and similarity > best_similarity:
+                    best_id, best_similarity = bill_id, similarity
+            if best_id is None:
+                return None
+            document_key, source_url, result, created, page_count, printed_total = conn.execute(
+                "SELECT document_key, source_url, result, created, page_count, printed_total FROM bills WHERE id = ?",
+                (best_id,)
+            ).fetchone()
+        except Exception as e:
+            logger.warning(f"Bill index lookup failed: {e}")
+            return None
+        return {
+            "document_key": document_key,
+            "source_url": source_url,
+            "similarity": round(best_similarity, 3),
+            "result": json.loads(result) if result else None,
+            "created": created,
+            "page_count": page_count,
+            "printed_total": printed_total
+        }
+
+    def first_page_match(self, first_page_items: List[Dict[str, Any]], page_count: int,
+                         printed_total: Optional[float] = None) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Look a document up by its first page; returns (match, whether its result may be served)
+
+        A first page alone is weak evidence: a page with one common line
+        matches every bill that starts with it. So the stored result may
+        only be served when the page has at least `short_circuit_min_items`
+        items, the indexed bill has the same page count, and a total
+        printed on the first page equals the bill's printed total. Any
+        other match is only a hint.
+        """
+        match = self.lookup(first_page_items, FIRST_PAGE, self.short_circuit_threshold)
+        if match is None or not match["result"]:
+            return match, False
+        if len(first_page_items) < self.short_circuit_min_items:
+            return match, False
+        if match["page_count"] != page_count:
+            return match, False
+        if printed_total and not (match["printed_total"] and
+                                  math.isclose(printed_total, match["printed_total"], rel_tol=1e-3, abs_tol=0.01)):
+            return match, False
+        return match, True
+
+    def add(self, document_key: str, line_items: List[Dict[str, Any]],
+            first_page_items: Optional[List[Dict[str, Any]]] = None, result: Optional[Dict[str, Any]] = None,
+            source_url: Optional[str] = None, page_count: Optional[int] = None,
+            printed_total: Optional[float] = None) -> bool:
+        """Index a reconciled bill (once per document_key); returns whether it was added
+
+        `page_count` and `printed_total` are the evidence first_page_match
+        checks before serving this bill's result for another document.
+        """
+        return self.add_many([(document_key, line_items, first_page_items, result, source_url,
+                               page_count, printed_total)]) == 1
+
+    def add_many(self, bills: Iterable[Tuple]) -> int:
+        """Index (document_key, line_items, first_page_items, result, source_url[, page_count, printed_total])
+        tuples in one transaction"""
+        added = 0
+        now = time.time()
+        lsh_rows: List[Tuple[int, int]] = []
+        try:
+            conn = self._connection()
+            with conn:
+                for document_key, line_items, first_page_items, result, source_url, *evidence in bills:
+                    page_count, printed_total = (*evidence, None, None)[:2]
+                    signature = self.signature(line_items)
+                    if signature is None:
+                        continue
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO bills "
+                        "(document_key, source_url, item_count, result, created, page_count, printed_total) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (document_key, source_url, len(line_items),
+                         json.dumps(result, default=str) if result is not None else None, now,
+                         page_count, printed_total)
+                    )
+                    if not cursor.rowcount:
+                        continue
+                    lsh_rows.extend(self._insert_signature(conn, cursor.lastrowid, BILL, signature))
+                    first_page = self.signature(first_page_items or [])
+                    if first_page is not None:
+                        lsh_rows.extend(self._insert_signature(conn, cursor.lastrowid, FIRST_PAGE, first_page))
+                    added += 1
+                conn.executemany("INSERT OR IGNORE INTO lsh (key, signature_id) VALUES (?, ?)", lsh_rows)
+        except Exception as e:
+            logger.warning(f"Bill index write failed: {e}")
+            return 0
+        return added
+
+    def _insert_signature(self, conn: sqlite3.Connection, bill_id: int, kind: int,
+                          signature: np.ndarray) -> List[Tuple[int, int]]:
+        """Store a signature; returns its (band key, signature id) rows for the lsh table"""
+        # The low 16 bits of each value are enough to estimate similarity (b-bit MinHash), at half the size
+        signature_id = conn.execute(
+            "INSERT INTO signatures (bill_id, kind, signature) VALUES (?, ?, ?)",
+            (bill_id, kind, signature.astype(np.uint16).tobytes())
+        ).lastrowid
+        return [(key, signature_id) for key in self._band_keys(signature, kind)]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._connection()
+        bills = conn.execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+        wal_path = self.path + "-wal"
+        return {
+            "bills": bills,
+            "size_bytes": os.path.getsize(self.path) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0),
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "threshold": self.threshold
+        }
+
+
+def create_bill_index(path: Optional[str] = None, **kwargs) -> BillSignatureIndex:
+    """Create a BillSignatureIndex, defaulting to a file under the system temp dir"""
+    path = path or os.path.join(tempfile.gettempdir(), "bill-extraction-cache", "bill_index.sqlite3")
+    return BillSignatureIndex(path, **kwargs)
@@ -0,0 +1,301 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Optional, Tuple, Dict, Any
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever preprocessing or OCR changes in a way that invalidates derived artifacts
+PIPELINE_VERSION = "1"
+
+
+def settings_key(**settings) -> str:
+    """Short hash of the settings a derived artifact was produced with"""
+    encoded = json.dumps(settings, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+class DocumentCache:
+    """Content-addressed on-disk cache for documents and derived artifacts.
+
+    Artifacts are keyed by the SHA-256 of the document bytes. Derived
+    artifacts (preprocessed image, OCR text) also carry the pipeline version
+    and the producer's `variant` (a settings_key of e.g. its enhancement mode,
+    target DPI or OCR mode) in their key, so neither a pipeline change nor a
+    differently configured processor sharing the directory is served another's
+    results. A separate URL -> hash index lets a resubmitted URL skip the
+    download entirely.
+    """
+
+    RAW = "raw"
+    PREPROCESSED = "preprocessed"
+    OCR_TEXT = "ocr_text"
+
+    def __init__(self, cache_dir: str, max_size_mb: int = 512,
+                 ttl_seconds: int = 7 * 24 * 3600, url_ttl_seconds: int = 24 * 3600,
+                 pipeline_version: str = PIPELINE_VERSION):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.index_path = os.path.join(cache_dir, "index.sqlite3")
+        self.max_size = max_size_mb * 1024 * 1024
+        self.ttl_seconds = ttl_seconds
+        self.url_ttl_seconds = url_ttl_seconds
+        self.pipeline_version = pipeline_version
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._init_index()
+
+    def _init_index(self):
+        """Create index tables if they don't exist"""
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL,
+                    metadata TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS urls (
+                    url TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation keeps this safe across
+        # threads and gunicorn workers sharing the same cache directory
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def hash_content(content) -> str:
+        """SHA-256 hex digest of document bytes"""
+        return hashlib.sha256(content).hexdigest()
+
+    def _key(self, content_hash: str, kind: str, variant: str = "") -> str:
+        if kind == self.RAW:
+            return f"{kind}:{content_hash}"
+        if variant:
+            return f"{kind}:{self.pipeline_version}:{variant}:{content_hash}"
+        return f"{kind}:{self.pipeline_version}:{content_hash}"
+
+    def _path_for(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    # ------------------------------------------------------------------
+    # Generic entries
+    # ------------------------------------------------------------------
+
+    def get(self, content_hash: str, kind: str, variant: str = "") -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        """Return (data, metadata) for an artifact, or None on miss/expiry"""
+        key = self._key(content_hash, kind, variant)
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT path, created, metadata FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+
+                path, created, metadata = row
+                if now - created > self.ttl_seconds:
+                    self._delete_entry(conn, key, path)
+                    return None
+
+                try:
+                    with open(path, "rb") as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    return None
+
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+
+            return data, json.loads(metadata) if metadata else {}
+        except Exception as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+
+    def put(self, content_hash: str, kind: str, data: bytes,
+            metadata: Optional[Dict[str, Any]] = None, variant: str = "") -> bool:
+        """Store an artifact and evict least recently used entries if over budget"""
+        if len(data) > self.max_size:
+            return False
+
+        key = self._key(content_hash, kind, variant)
+        path = self._path_for(key)
+        now = time.time()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write atomically so concurrent readers never see partial files
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, path, size, created, accessed, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, path, len(data), now, now, json.dumps(metadata, default=str) if metadata else None)
+                )
+                self._evict(conn)
+            return True
+        except Exception as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+            return False
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries, then least recently used ones until under max_size"""
+        now = time.time()
+        expired = conn.execute(
+            "SELECT key, path FROM entries WHERE created < ?", (now - self.ttl_seconds,)
+        ).fetchall()
+        for key, path in expired:
+            self._delete_entry(conn, key, path)
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size:
+            return
+
+        for key, path, size in conn.execute(
+            "SELECT key, path, size FROM entries ORDER BY accessed ASC"
+        ).fetchall():
+            self._delete_entry(conn, key, path)
+            total -= size
+            if total <= self.max_size:
+                break
+
+    def _delete_entry(self, conn: sqlite3.Connection, key: str, path: str):
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # ------------------------------------------------------------------
+    # URL index
+    # ------------------------------------------------------------------
+
+    def lookup_url(self, url: str) -> Optional[str]:
+        """Return the content hash last seen for a URL"""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT content_hash, created FROM urls WHERE url = ?", (url,)
+                ).fetchone()
+                if row is None:
+                    return None
+                content_hash, created = row
+                if time.time() - created > self.url_ttl_seconds:
+                    conn.execute("DELETE FROM urls WHERE url = ?", (url,))
+                    return None
+                return content_hash
+        except Exception as e:
+            logger.warning(f"Cache URL lookup failed: {e}")
+            return None
+
+    def index_url(self, url: str, content_hash: str):
+        """Remember which document a URL resolved to"""
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO urls (url, content_hash, created) VALUES (?, ?, ?)",
+                    (url, content_hash, time.time())
+                )
+        except Exception as e:
+            logger.warning(f"Cache URL index failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Typed artifacts
+    # ------------------------------------------------------------------
+
+    def get_document(self, content_hash: str) -> Optional[bytes]:
+        entry = self.get(content_hash, self.RAW)
+        return entry[0] if entry else None
+
+    def put_document(self, content, url: Optional[str] = None,
+                     content_hash: Optional[str] = None) -> str:
+        """Store raw document bytes (and the URL that served them); returns the hash"""
+        content_hash = content_hash or self.hash_content(content)
+        self.put(content_hash, self.RAW, bytes(content))
+        if url:
+            self.index_url(url, content_hash)
+        return content_hash
+
+    def get_document_for_url(self, url: str) -> Optional[bytes]:
+        content_hash = self.lookup_url(url)
+        if not content_hash:
+            return None
+        return self.get_document(content_hash)
+
+    def get_preprocessed(self, content_hash: str,
+                         variant: str = "") -> Optional[Tuple[Image.Image, Dict[str, Any]]]:
+        entry = self.get(content_hash, self.PREPROCESSED, variant)
+        if not entry:
+            return None
+        data, metadata = entry
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.load()
+            return image, metadata
+        except Exception as e:
+            logger.warning(f"Cached preprocessed image unreadable: {e}")
+            return None
+
+    def put_preprocessed(self, content_hash: str, image: Image.Image, metadata: Dict[str, Any],
+                         variant: str = ""):
+        buffer = io.BytesIO()
+        # PNG keeps the enhanced pixels exact; low compression keeps writes cheap
+        image.save(buffer, format="PNG", compress_level=1)
+        self.put(content_hash, self.PREPROCESSED, buffer.getvalue(), metadata, variant)
+
+    def get_text(self, content_hash: str, variant: str = "") -> Optional[str]:
+        entry = self.get(content_hash, self.OCR_TEXT, variant)
+        return entry[0].decode("utf-8") if entry else None
+
+    def put_text(self, content_hash: str, text: str, variant: str = ""):
+        self.put(content_hash, self.OCR_TEXT, text.encode("utf-8"), variant=variant)
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry counts and total size, for health/debug endpoints"""
+        with self._connect() as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            urls = conn.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+        return {
+            "entries": count,
+            "size_bytes": total,
+            "max_size_bytes": self.max_size,
+            "indexed_urls": urls,
+            "pipeline_version": self.pipeline_version
+        }
+
+
+def create_document_cache(cache_dir: Optional[str] = None, max_size_mb: int = 512) -> DocumentCache:
+    """Create a DocumentCache, defaulting to a directory under the system temp dir"""
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "bill-extraction-cache")
+    return DocumentCache(cache_dir, max_size_mb=max_size_mb)
@@ -1,175 +1,119 @@
+import asyncio
+import functools
 import boto3
+from botocore.config import Config
 from config.settings import settings
+from src.extraction.textract_async import TextractJobRunner, run_blocking
+from src.extraction.textract_parser import TextractResponseParser
+from src.preprocessing.decoded_document import DecodedDocument, DocumentInput
 import logging
-from typing import List, Dict, Any
-import re
+from typing import Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
 class AWSTextractExtractor:
-    def __init__(self):
+    MODES = ("sync", "async", "auto")
+    
+    def __init__(self, mode: Optional[str] = None, s3_bucket: Optional[str] = None,
+                 endpoint_url: Optional[str] = None, **job_options):
         if not settings.AWS_ACCESS_KEY_ID or not settings.AWS_SECRET_ACCESS_KEY:
             raise ValueError("AWS credentials not configured")
         
-        self.client = boto3.client(
-            'textract',
+        self.mode = mode or settings.TEXTRACT_MODE
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown Textract mode: {self.mode}")
+        s3_bucket = s3_bucket or settings.TEXTRACT_S3_BUCKET
+        if self.mode == "async" and not s3_bucket:
+            raise ValueError("TEXTRACT_S3_BUCKET is required for asynchronous Textract jobs")
+        
+        client_options = dict(
             aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
             aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
+            region_name=settings.AWS_REGION,
+            endpoint_url=endpoint_url or settings.TEXTRACT_ENDPOINT_URL
         )
+        self.client = boto3.client('textract', **client_options)
+        # Block parsing lives in textract_parser (Id-indexed, no boto3 needed)
+        self.parser = TextractResponseParser()
+        
+        # Multi-page documents go through StartDocumentAnalysis, which reads from S3
+        self.job_runner = None
+        if s3_bucket and self.mode != "sync":
+            s3_client = boto3.client('s3', config=Config(s3={'addressing_style': 'path'}), **client_options)
+            self.job_runner = TextractJobRunner(self.client, s3_client, s3_bucket, **job_options)
     
-    def analyze_document(self, document_content: bytes) -> Dict[str, Any]:
+    def analyze_document(self, document_content: DocumentInput) -> Dict[str, Any]:
         """Analyze document using AWS Textract"""
         try:
-            response = self.client.analyze_document(
-                Document={'Bytes': document_content},
-                FeatureTypes=['TABLES', 'FORMS']
-            )
-            
-            return self._parse_response(response)
+            return self.analyze_document_strict(document_content)
         except Exception as e:
             logger.error(f"AWS Textract analysis failed: {e}")
             return {"line_items": [], "totals": {}, "confidence": 0.0}
     
-    def _parse_response(self, response: Dict) -> Dict[str, Any]:
-        """Parse AWS Textract response"""
-        line_items = []
-        blocks = response.get('Blocks', [])
-        
-        # Extract tables for line items
-        tables = [block for block in blocks if block['BlockType'] == 'TABLE']
-        
-        for table in tables:
-            line_items.extend(self._extract_line_items_from_table(table, blocks))
+    def analyze_document_strict(self, document_content: DocumentInput) -> Dict[str, Any]:
+        """Like analyze_document, but raises (e.g. ThrottlingException) instead of returning no items"""
+        document = DecodedDocument.ensure(document_content)
+        if self._use_async_job(document):
+            return run_blocking(self._run_job(document))
         
-        # Extract forms for additional data
-        forms = [block for block in blocks if block['BlockType'] == 'KEY_VALUE_SET']
-        totals = self._extract_totals_from_forms(forms, blocks)
+        response = self.client.analyze_document(
+            Document={'Bytes': document.tobytes()},
+            FeatureTypes=['TABLES', 'FORMS']
+        )
         
-        return {
-            "line_items": line_items,
-            "totals": totals,
-            "confidence": 0.85
-        }
+        return self._parse_response(response)
     
-    def _extract_line_items_from_table(self, table: Dict, blocks: List[Dict]) -> List[Dict]:
-        """Extract line items from table structure"""
-        line_items = []
-        
+    async def analyze_document_async(self, document_content: DocumentInput) -> Dict[str, Any]:
+        """analyze_document for event loops (used by HedgedExtractor)"""
         try:
-            # Get all cells in this table
-            table_cells = []
-            for relationship in table.get('Relationships', []):
-                if relationship['Type'] == 'CHILD':
-                    for cell_id in relationship['Ids']:
-                        cell_block = next((b for b in blocks if b['Id'] == cell_id), None)
-                        if cell_block and cell_block['BlockType'] == 'CELL':
-                            table_cells.append(cell_block)
-            
-            # Group cells by row
-            rows = {}
-            for cell in table_cells:
-                row_index = cell.get('RowIndex', 0)
-                if row_index not in rows:
-                    rows[row_index] = []
-                rows[row_index].append(cell)
-            
-            # Convert rows to line items (skip header row)
-            for row_index, row_cells in sorted(rows.items()):
-                if row_index > 1:  # Skip header
-                    line_item = self._parse_table_row(row_cells, blocks)
-                    if line_item:
-                        line_items.append(line_item)
-                        
+            return await self.analyze_document_strict_async(document_content)
         except Exception as e:
-            logger.warning(f"Error extracting line items from table: {e}")
+            logger.error(f"AWS Textract analysis failed: {e}")
+            return {"line_items": [], "totals": {}, "confidence": 0.0}
+    
+    async def analyze_document_strict_async(self, document_content: DocumentInput) -> Dict[str, Any]:
+        """Like analyze_document_strict, but awaits the Textract job
+        
+        Cancelling it stops polling the job and deletes its S3 input. A
+        single-page document is one AnalyzeDocument call on a thread, which
+        cannot be interrupted once sent.
+        """
+        document = DecodedDocument.ensure(document_content)
+        if self._use_async_job(document):
+            return await self._run_job(document)
         
-        return line_items
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, functools.partial(
+            self.client.analyze_document,
+            Document={'Bytes': document.tobytes()},
+            FeatureTypes=['TABLES', 'FORMS']
+        ))
+        return self._parse_response(response)
     
-    def _parse_table_row(self, row_cells: List[Dict], blocks: List[Dict]) -> Dict:
-        """Parse a table row into a line item"""
+    async def analyze_document_job(self, document_content: DocumentInput) -> Dict[str, Any]:
+        """Analyze a (multi-page) document with an asynchronous Textract job
+        
+        Await this directly from an event loop; analyze_document() runs it
+        to completion for synchronous callers.
+        """
         try:
-            description = ""
-            quantity = 1.0
-            rate = 0.0
-            amount = 0.0
-            
-            for cell in row_cells:
-                cell_text = self._get_cell_text(cell, blocks)
-                if not cell_text:
-                    continue
-                    
-                # Simple heuristic-based parsing
-                if not description and len(cell_text) > 2 and not self._looks_like_number(cell_text):
-                    description = cell_text
-                elif self._looks_like_amount(cell_text):
-                    parsed_amount = self._parse_amount(cell_text)
-                    if amount == 0.0:
-                        amount = parsed_amount
-                    else:
-                        rate = parsed_amount
-            
-            if amount > 0 and description:
-                return {
-                    "item_name": description,
-                    "item_quantity": quantity,
-                    "item_rate": rate if rate > 0 else amount,
-                    "item_amount": amount,
-                    "confidence": 0.8
-                }
+            return await self._run_job(DecodedDocument.ensure(document_content))
         except Exception as e:
-            logger.warning(f"Failed to parse table row: {e}")
-        
-        return None
-    
-    def _get_cell_text(self, cell: Dict, blocks: List[Dict]) -> str:
-        """Extract text from cell"""
-        text = ""
-        relationships = cell.get('Relationships', [])
-        for relationship in relationships:
-            if relationship['Type'] == 'CHILD':
-                for child_id in relationship['Ids']:
-                    child_block = next((b for b in blocks if b['Id'] == child_id), None)
-                    if child_block and child_block['BlockType'] == 'WORD':
-                        text += child_block.get('Text', '') + " "
-        return text.strip()
-    
-    def _looks_like_number(self, text: str) -> bool:
-        """Check if text looks like a number"""
-        return bool(re.match(r'^[\d.,]+$', text.strip()))
+            logger.error(f"AWS Textract job failed: {e}")
+            return {"line_items": [], "totals": {}, "confidence": 0.0}
     
-    def _looks_like_amount(self, text: str) -> bool:
-        """Check if text looks like a monetary amount"""
-        return bool(re.match(r'^[\$€£]?[\d,]+\.?\d*$', text.strip()))
+    async def _run_job(self, document: DecodedDocument) -> Dict[str, Any]:
+        job = await self.job_runner.run(document.tobytes())
+        result = self.parser.parse_index(job["index"])
+        result["textract_job"] = job["job"]
+        return result
     
-    def _parse_amount(self, text: str) -> float:
-        """Parse amount string to float"""
-        try:
-            cleaned = re.sub(r'[^\d.]', '', text)
-            return float(cleaned) if cleaned else 0.0
-        except ValueError:
-            return 0.0
+    def _use_async_job(self, document: DecodedDocument) -> bool:
+        if self.job_runner is None:
+            return False
+        # The synchronous API only accepts single-page documents
+        return self.mode == "async" or document.is_pdf
     
-    def _extract_totals_from_forms(self, forms: List[Dict], blocks: List[Dict]) -> Dict:
-        """Extract totals from form fields"""
-        totals = {}
-        
-        try:
-            for form in forms:
-                if form.get('EntityTypes', []) and 'KEY' in form.get('EntityTypes', []):
-                    key_text = self._get_cell_text(form, blocks).lower()
-                    if any(total_keyword in key_text for total_keyword in ['total', 'amount', 'balance']):
-                        # Find corresponding value
-                        for relationship in form.get('Relationships', []):
-                            if relationship['Type'] == 'VALUE':
-                                for value_id in relationship['Ids']:
-                                    value_block = next((b for b in blocks if b['Id'] == value_id), None)
-                                    if value_block:
-                                        value_text = self._get_cell_text(value_block, blocks)
-                                        amount = self._parse_amount(value_text)
-                                        if amount > 0:
-                                            totals['Total'] = amount
-        except Exception as e:
-            logger.warning(f"Error extracting totals from forms: {e}")
-        
-        return totals
\ No newline at end of file
+    def _parse_response(self, response: Dict) -> Dict[str, Any]:
+        """Parse AWS Textract response"""
+        return self.parser.parse(response)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiohttp
+from azure.ai.formrecognizer.aio import DocumentAnalysisClient
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import AioHttpTransport
+
+from src.extraction.azure_parser import AzureInvoiceParser
+from src.preprocessing.decoded_document import DocumentInput, document_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAzureFormRecognizerExtractor:
+    """Form Recognizer extractor on the SDK's aio client.
+
+    The analyze request and every status poll are awaited, so a request
+    waiting on Azure does not block the event loop. Each event loop gets one
+    client over a shared aiohttp session (bounded connection pool with
+    keep-alive). `analyze_document_async` enforces a deadline: when it
+    passes, the in-flight poll is cancelled and a failed result returned.
+
+    Synchronous callers use `analyze_document`, which runs the coroutine on
+    a background loop owned by the extractor, so they share its pool too.
+
+    A loop's client and session are closed by `aclose()`, or at the latest
+    when the loop shuts down its async generators (as asyncio.run and
+    uvicorn do before closing it).
+    """
+
+    def __init__(self, endpoint: Optional[str] = None, key: Optional[str] = None,
+                 model_id: str = "prebuilt-invoice", polling_interval: float = 1.0,
+                 timeout: float = 60.0, max_connections: int = 20):
+        if endpoint is None or key is None:
+            from config.settings import settings
+            endpoint = endpoint or settings.AZURE_FORM_RECOGNIZER_ENDPOINT
+            key = key or settings.AZURE_FORM_RECOGNIZER_KEY
+        if not endpoint or not key:
+            raise ValueError("Azure Form Recognizer credentials not configured")
+
+        self.endpoint = endpoint
+        self.credential = AzureKeyCredential(key)
+        self.model_id = model_id
+        self.polling_interval = polling_interval
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.parser = AzureInvoiceParser()
+        # loop -> (client, session, holder); see _client
+        self._clients: Dict[asyncio.AbstractEventLoop, Tuple[Any, Any, Any]] = {}
+        self._background_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    async def _client(self) -> DocumentAnalysisClient:
+        """The client for the running loop (aiohttp sessions are bound to one loop)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for closed in [other for other in self._clients if other.is_closed()]:
+                # Closed without shutting down its async generators; nothing can be awaited there any more
+                logger.warning("Event loop closed before its Azure client; its connections were not closed")
+                del self._clients[closed]
+            entry = self._clients.get(loop)
+        if entry is None:
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections))
+            transport = AioHttpTransport(session=session, session_owner=False)
+            client = DocumentAnalysisClient(self.endpoint, self.credential, transport=transport)
+            # The loop finalizes live async generators at shutdown, which closes the client on that loop
+            holder = self._hold(loop, client, session)
+            await holder.asend(None)
+            entry = (client, session, holder)
+            with self._lock:
+                self._clients[loop] = entry
+        return entry[0]
+
+    async def _hold(self, loop: asyncio.AbstractEventLoop, client, session) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._clients.pop(loop, None)
+            await client.close()
+            await session.close()
+
+    async def analyze_document_async(self, document_content: DocumentInput,
+                                     deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Analyze a document without blocking the event loop
+
+        `deadline` is a time.monotonic() timestamp (e.g. request start plus
+        the request timeout); the tighter of it and `timeout` applies.
+        """
+        try:
+            return await self.analyze_document_strict_async(document_content, deadline)
+        except asyncio.TimeoutError:
+            logger.error("Azure Form Recognizer analysis exceeded its deadline")
+            return {"line_items": [], "totals": {}, "confidence": 0.0, "error": "deadline exceeded"}
+        except Exception as e:
+            logger.error(f"Azure Form Recognizer analysis failed: {e}")
+            return {"line_items": [], "totals": {}, "confidence": 0.0}
+
+    async def analyze_document_strict_async(self, document_content: DocumentInput,
+                                            deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Like analyze_document_async, but raises (TimeoutError, HTTP 429, ...) instead"""
+        timeout = self.timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            raise asyncio.TimeoutError()
+        result = await asyncio.wait_for(self._analyze(document_bytes(document_content)), timeout)
+        return self.parser.parse(result)
+
+    async def _analyze(self, content: bytes):
+        client = await self._client()
+        poller = await client.begin_analyze_document(
+            self.model_id, content, polling_interval=self.polling_interval
+        )
+        return await poller.result()
+
+    def analyze_document(self, document_content: DocumentInput,
+                         deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Blocking facade for synchronous callers such as BillExtractionPipeline"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.analyze_document_async(document_content, deadline), self._get_background_loop()
+        )
+        return future.result()
+
+    def analyze_document_strict(self, document_content: DocumentInput,
+                                deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Blocking, raising variant (used by ScheduledExtractor)"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.analyze_document_strict_async(document_content, deadline), self._get_background_loop()
+        )
+        return future.result()
+
+    def _get_background_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._background_loop is None:
+                self._background_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._background_loop.run_forever, daemon=True,
+                                 name="azure-aio").start()
+            return self._background_loop
+
+    async def aclose(self):
+        """Close the client and connection pool of the running loop"""
+        with self._lock:
+            entry = self._clients.get(asyncio.get_running_loop())
+        if entry is not None:
+            await entry[2].aclose()
+
+    def close(self):
+        """Close the background loop's client and stop the loop"""
+        with self._lock:
+            loop, self._background_loop = self._background_loop, None
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def create_async_azure_extractor(**kwargs) -> AsyncAzureFormRecognizerExtractor:
+    return AsyncAzureFormRecognizerExtractor(**kwargs)
@@ -0,0 +1,121 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def field_number(field) -> Optional[float]:
+    """Numeric value of a DocumentField, unwrapping currency fields.
+
+    prebuilt-invoice returns UnitPrice, Amount and the totals as
+    CurrencyValue objects (amount + symbol), which float() rejects.
+    """
+    value = getattr(field, 'value', None)
+    if value is None:
+        return None
+    value = getattr(value, 'amount', value)
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+class AzureInvoiceParser:
+    """Turns a Form Recognizer prebuilt-invoice AnalyzeResult into line items and totals"""
+
+    # Field names used by prebuilt-invoice, then older/custom-model spellings
+    TOTAL_FIELDS = {
+        'Total': ('InvoiceTotal', 'Total'),
+        'Subtotal': ('SubTotal', 'Subtotal'),
+        'Tax': ('TotalTax',),
+    }
+
+    def parse(self, result) -> Dict[str, Any]:
+        """Parse Azure Form Recognizer result"""
+        line_items = []
+        totals = {}
+        confidence_scores = []
+
+        # Extract line items from invoices
+        for document in getattr(result, 'documents', None) or []:
+            line_items.extend(self._extract_line_items_from_document(document))
+            totals.update(self._extract_totals_from_document(document))
+            if getattr(document, 'confidence', None) is not None:
+                confidence_scores.append(document.confidence)
+
+        # Calculate average confidence
+        avg_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.8
+
+        return {
+            "line_items": line_items,
+            "totals": totals,
+            "confidence": avg_confidence
+        }
+
+    def _extract_line_items_from_document(self, document) -> List[Dict]:
+        """Extract line items from document"""
+        line_items = []
+
+        try:
+            # Look for items table in invoice
+            items_field = getattr(document, 'fields', {}).get('Items')
+            items = getattr(items_field, 'value', None)
+            if isinstance(items, list):
+                for item in items:
+                    line_item = self._parse_invoice_item(item)
+                    if line_item:
+                        line_items.append(line_item)
+        except Exception as e:
+            logger.warning(f"Error extracting line items: {e}")
+
+        return line_items
+
+    def _parse_invoice_item(self, item) -> Optional[Dict]:
+        """Parse individual invoice line item"""
+        try:
+            item_value = getattr(item, 'value', None) or {}
+
+            desc_field = item_value.get('Description')
+            description = getattr(desc_field, 'value', None) or ""
+            quantity = field_number(item_value.get('Quantity')) or 1.0
+            unit_price = field_number(item_value.get('UnitPrice')) or 0.0
+            amount = field_number(item_value.get('Amount')) or 0.0
+
+            # If amount is 0 but we have unit price and quantity, calculate it
+            if amount == 0 and unit_price > 0:
+                amount = unit_price * quantity
+
+            if description and amount > 0:
+                return {
+                    "item_name": str(description),
+                    "item_quantity": quantity,
+                    "item_rate": unit_price,
+                    "item_amount": amount,
+                    "confidence": getattr(item, 'confidence', None) or 0.9
+                }
+
+        except Exception as e:
+            logger.warning(f"Failed to parse invoice item: {e}")
+
+        return None
+
+    def _extract_totals_from_document(self, document) -> Dict:
+        """Extract totals from document"""
+        totals = {}
+
+        try:
+            fields = getattr(document, 'fields', None) or {}
+            for name, candidates in self.TOTAL_FIELDS.items():
+                for candidate in candidates:
+                    value = field_number(fields.get(candidate))
+                    if value is not None:
+                        totals[name] = value
+                        break
+        except Exception as e:
+            logger.warning(f"Error extracting totals: {e}")
+
+        return totals
+
+
+def create_azure_invoice_parser() -> AzureInvoiceParser:
+    return AzureInvoiceParser()
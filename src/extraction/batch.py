@@ -0,0 +1,138 @@
+import functools
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from src.extraction.stages import PipelineContext
+
+logger = logging.getLogger(__name__)
+
+_NO_MORE_URLS = object()
+
+# Pipeline of a batch worker process, built once by _init_worker
+_worker_pipeline = None
+
+
+def _init_worker(pipeline_factory):
+    global _worker_pipeline
+    _worker_pipeline = pipeline_factory()
+
+
+def _process_in_worker(document_url: str, content: bytes, io_durations: Dict[str, float]) -> Dict[str, Any]:
+    return _worker_pipeline.process_fetched(document_url, content, io_durations)
+
+
+class BatchRunner:
+    """Drives BillExtractionPipeline.process_batch.
+
+    Each stage group has its own concurrency limit: the I/O stages (fetch,
+    validate) run on `concurrency` threads, and the remaining stages on
+    either `cpu_workers` processes or, when the pipeline's extractor calls
+    cloud providers, `cloud_concurrency` threads of this process. Cloud
+    extraction stays here because every process has its own ProviderLimiter,
+    circuit breakers and hedge budget: N worker processes would send N times
+    the provider quota. (Local OCR tiers of such a cascade then run on those
+    threads too; Tesseract does its work outside the GIL.)
+
+    The URL iterable is consumed only while fewer than `max_in_flight`
+    documents are between "fetch started" and "result yielded"; that bound
+    is the backpressure that keeps memory flat, since every in-flight
+    document holds its downloaded bytes.
+    """
+
+    CPU_EXECUTORS = ("process", "thread")
+
+    def __init__(self, pipeline, concurrency: int = 8, cpu_workers: Optional[int] = None,
+                 cpu_executor: str = "process", max_in_flight: Optional[int] = None,
+                 cloud_concurrency: Optional[int] = None):
+        if cpu_executor not in self.CPU_EXECUTORS:
+            raise ValueError(f"Unknown CPU executor: {cpu_executor}")
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.calls_cloud = bool(getattr(pipeline.extractor, "calls_cloud", False))
+        if self.calls_cloud:
+            # Cloud calls wait on the provider, not the CPU; the provider limiters bound them further
+            self.cpu_workers = cloud_concurrency or concurrency
+            self.cpu_executor = "thread"
+        else:
+            self.cpu_workers = cpu_workers or os.cpu_count() or 1
+            self.cpu_executor = cpu_executor
+        self.max_in_flight = max_in_flight or concurrency + 2 * self.cpu_workers
+        self.io_stages = [stage for stage in pipeline.stages if stage.io_bound]
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "peak_in_flight": 0}
+
+    def _cpu_pool(self) -> Executor:
+        if self.cpu_executor == "thread":
+            prefix = "batch-cloud" if self.calls_cloud else "batch-cpu"
+            return ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix=prefix)
+        factory = functools.partial(type(self.pipeline), **self.pipeline.init_kwargs)
+        return ProcessPoolExecutor(max_workers=self.cpu_workers, initializer=_init_worker, initargs=(factory,))
+
+    def _submit_cpu(self, pool: Executor, document_url: str, content: bytes, io_durations: Dict[str, float]):
+        if self.cpu_executor == "thread":
+            return pool.submit(self.pipeline.process_fetched, document_url, content, io_durations)
+        return pool.submit(_process_in_worker, document_url, content, io_durations)
+
+    def _run_io_stages(self, document_url: str):
+        """(content, stage durations) of the fetched document, or the error response"""
+        context = PipelineContext(document_url)
+        error = self.pipeline._run_stages(context, self.io_stages)
+        if error is not None:
+            return error
+        return context.document.tobytes(), dict(context.timings.durations)
+
+    def run(self, document_urls: Iterable[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        urls = iter(document_urls)
+        cpu_pool = self._cpu_pool()
+        if self.cpu_executor == "process":
+            # Start the workers before any I/O thread exists (fork copies a single-threaded parent)
+            cpu_pool.submit(os.getpid).result()
+        io_pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-io")
+        pending = {}  # future -> (stage, url, started)
+        in_flight = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and in_flight < self.max_in_flight:
+                    document_url = next(urls, _NO_MORE_URLS)
+                    if document_url is _NO_MORE_URLS:
+                        exhausted = True
+                        break
+                    pending[io_pool.submit(self._run_io_stages, document_url)] = ("io", document_url,
+                                                                                  time.perf_counter())
+                    in_flight += 1
+                    self.stats["submitted"] += 1
+                    self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], in_flight)
+                if not pending:
+                    return
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, document_url, started = pending.pop(future)
+                    result = self._result(future, document_url)
+                    if stage == "io" and isinstance(result, tuple):
+                        content, io_durations = result
+                        pending[self._submit_cpu(cpu_pool, document_url, content, io_durations)] = (
+                            "cpu", document_url, started)
+                        continue
+
+                    in_flight -= 1
+                    self.stats["completed" if result.get("is_success") else "failed"] += 1
+                    if result.get("metadata") is not None:
+                        # End to end, including time queued for a worker
+                        result["metadata"]["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    yield document_url, result
+        finally:
+            io_pool.shutdown(wait=False, cancel_futures=True)
+            cpu_pool.shutdown(wait=False, cancel_futures=True)
+            logger.info(f"Batch finished: {self.stats}")
+
+    def _result(self, future, document_url: str):
+        try:
+            return future.result()
+        except Exception as e:
+            # A crashed worker process, or an error outside the stages
+            logger.error(f"Batch processing of {document_url} failed: {e}")
+            return self.pipeline._error_response(f"Processing error: {str(e)}")
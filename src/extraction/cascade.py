@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.extraction import deadlines
+from src.extraction.circuit_breaker import create_breaker_extractor
+from src.extraction.registry import create_extractor
+from src.reconciliation.validator import ReconciliationEngine
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeTier(NamedTuple):
+    name: str
+    extractor: Any
+    # Relative cost per document (local OCR is free, cloud calls are billed)
+    cost: float = 0.0
+
+
+class ExtractorCascade:
+    """Runs extractors cheapest first, escalating only when a result is not good enough.
+
+    A tier's result is accepted when it has line items, is not a fallback or
+    error result, reconciles against its own totals and reaches
+    `confidence_threshold`. Otherwise the next tier is tried; if no tier is
+    accepted the best attempt (reconciled first, then most confident) wins.
+    Every result carries a "cascade" entry with the answering tier and the
+    time each attempted tier took.
+
+    Tiers wrapped in a BreakerExtractor are routed by health: they are
+    tried in order of cost divided by breaker health, so a degraded
+    backend drops behind a pricier healthy one and a tripped one is only
+    reached (and rejected in milliseconds) when nothing else answered.
+    """
+
+    def __init__(self, tiers: List[CascadeTier], confidence_threshold: Optional[float] = None,
+                 reconciliation_engine: Optional[ReconciliationEngine] = None):
+        if not tiers:
+            raise ValueError("An extractor cascade needs at least one tier")
+        if confidence_threshold is None:
+            from config.settings import settings
+            confidence_threshold = settings.CONFIDENCE_THRESHOLD
+        self.tiers = list(tiers)
+        self.confidence_threshold = confidence_threshold
+        self.reconciliation_engine = reconciliation_engine or ReconciliationEngine()
+        self._stats = {tier.name: {"attempts": 0, "answered": 0, "time": 0.0} for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    @property
+    def calls_cloud(self) -> bool:
+        """Whether any tier is billed, i.e. calls a cloud provider under a shared quota"""
+        return any(tier.cost > 0 for tier in self.tiers)
+
+    def analyze_document(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Cascade over a whole document with each tier's analyze_document"""
+        extraction_result, _ = self.run(
+            lambda extractor: deadlines.analyze(extractor.analyze_document, document_content, deadline), deadline
+        )
+        return extraction_result
+
+    def run(self, extract: Callable[[Any], Dict[str, Any]], deadline: Optional[float] = None,
+            should_stop: Optional[Callable[[], bool]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Run `extract(extractor)` tier by tier; returns (extraction, reconciliation)
+
+        BillExtractionPipeline passes its page-by-page extraction here so a
+        whole multi-page document is escalated, not individual pages. Once
+        `deadline` has passed, or `should_stop()` is true (the caller already
+        has its answer), no further tier is tried.
+        """
+        attempts = []
+        best = None
+        for tier in self.route():
+            if attempts and deadlines.expired(deadline):
+                logger.info(f"Request deadline passed, not escalating to {tier.name}")
+                break
+            if attempts and should_stop is not None and should_stop():
+                logger.info(f"Cascade stopped by the caller, not escalating to {tier.name}")
+                break
+            started = time.perf_counter()
+            try:
+                extraction_result = extract(tier.extractor)
+            except Exception as e:
+                logger.error(f"Cascade tier {tier.name} failed: {e}")
+                extraction_result = {"line_items": [], "totals": {}, "confidence": 0.0, "error": str(e)}
+            reconciliation_result = self.reconciliation_engine.reconcile_extraction(
+                extraction_result, extraction_result.get("totals", {})
+            )
+            elapsed = time.perf_counter() - started
+
+            accepted, reason = self._accept(extraction_result, reconciliation_result)
+            attempts.append({
+                "tier": tier.name,
+                "elapsed": round(elapsed, 4),
+                "confidence": extraction_result.get("confidence", 0.0),
+                "is_reconciled": reconciliation_result["is_reconciled"],
+                "accepted": accepted,
+                "reason": reason
+            })
+            self._record(tier.name, elapsed)
+
+            candidate = (tier, extraction_result, reconciliation_result)
+            if accepted:
+                best = candidate
+                break
+            if extraction_result.get("line_items") and (best is None or self._rank(candidate) > self._rank(best)):
+                best = candidate
+            logger.info(f"Cascade tier {tier.name} not accepted ({reason}), escalating")
+
+        if best is None:
+            best = candidate
+        tier, extraction_result, reconciliation_result = best
+        with self._lock:
+            self._stats[tier.name]["answered"] += 1
+        extraction_result["cascade"] = {
+            "tier": tier.name,
+            "escalations": len(attempts) - 1,
+            "elapsed": round(sum(attempt["elapsed"] for attempt in attempts), 4),
+            "attempts": attempts
+        }
+        return extraction_result, reconciliation_result
+
+    def route(self) -> List[CascadeTier]:
+        """Tiers in the order to try them now (stable for equal effective cost)"""
+        def effective_cost(tier: CascadeTier) -> float:
+            breaker = getattr(tier.extractor, "breaker", None)
+            if breaker is None:
+                return tier.cost
+            health = breaker.health()
+            return tier.cost / health if health > 0 else float("inf")
+
+        return sorted(self.tiers, key=effective_cost)
+
+    def _accept(self, extraction_result: Dict, reconciliation_result: Dict) -> Tuple[bool, str]:
+        if extraction_result.get("circuit_open"):
+            return False, "circuit open"
+        if extraction_result.get("error"):
+            return False, "error"
+        if extraction_result.get("fallback"):
+            return False, "fallback result"
+        if not extraction_result.get("line_items"):
+            return False, "no line items"
+        if not reconciliation_result["is_reconciled"]:
+            return False, "not reconciled"
+        if extraction_result.get("confidence", 0.0) < self.confidence_threshold:
+            return False, "low confidence"
+        return True, "accepted"
+
+    @staticmethod
+    def _rank(candidate) -> Tuple[bool, bool, float]:
+        _, extraction_result, reconciliation_result = candidate
+        return (not extraction_result.get("fallback"), reconciliation_result["is_reconciled"],
+                extraction_result.get("confidence", 0.0))
+
+    def _record(self, tier_name: str, elapsed: float):
+        with self._lock:
+            stats = self._stats[tier_name]
+            stats["attempts"] += 1
+            stats["time"] += elapsed
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per tier: attempts, documents answered, mean time per attempt"""
+        with self._lock:
+            return {
+                name: {
+                    "attempts": stats["attempts"],
+                    "answered": stats["answered"],
+                    "mean_time": round(stats["time"] / stats["attempts"], 4) if stats["attempts"] else 0.0
+                }
+                for name, stats in self._stats.items()
+            }
+
+
+# Relative cost per document of each registry backend
+TIER_COSTS = {"mock": 0.0, "tesseract": 0.0, "azure": 1.0, "azure_async": 1.0, "textract": 1.5}
+# Quota shared by backends that call the same cloud service
+SCHEDULER_PROVIDERS = {"azure": "azure", "azure_async": "azure", "textract": "textract"}
+# Awaitable equivalents, used when hedging so a cancelled loser really stops
+ASYNC_BACKENDS = {"azure": "azure_async"}
+
+
+def default_tiers(cache=None, scheduled: bool = True, hedge: Optional[bool] = None) -> List[CascadeTier]:
+    """One tier per backend enabled in settings (EXTRACTORS), cheapest first
+
+    Backends are created through the extractor registry, so only enabled
+    ones are imported. With `hedge` (default settings.CLOUD_HEDGING) the
+    first two cloud backends form one tier: the first, hedged to the
+    second when it is slow. Hedged Azure uses the aio client, so the losing
+    request is cancelled instead of left running on a thread.
+    """
+    from config.settings import settings
+
+    if hedge is None:
+        hedge = settings.CLOUD_HEDGING
+    # Every backend sits behind its circuit breaker, so a degraded one is skipped fast
+    breaker_options = dict(slow_call_seconds=settings.REQUEST_TIMEOUT / 2)
+    tiers = []
+    for name in settings.enabled_extractors:
+        backend = ASYNC_BACKENDS.get(name, name) if hedge else name
+        try:
+            extractor = create_extractor(backend, cache=cache) if name == "tesseract" else create_extractor(backend)
+        except Exception as e:
+            logger.warning(f"Skipping {name} cascade tier: {e}")
+            continue
+        if scheduled and name in SCHEDULER_PROVIDERS:
+            from src.extraction.scheduler import ScheduledExtractor
+            extractor = ScheduledExtractor(extractor, SCHEDULER_PROVIDERS[name])
+        tiers.append(CascadeTier(name, create_breaker_extractor(extractor, name, **breaker_options),
+                                 TIER_COSTS.get(name, 1.0)))
+
+    cloud = [tier for tier in tiers if tier.name in SCHEDULER_PROVIDERS]
+    if hedge and len(cloud) >= 2:
+        from src.extraction.hedging import HedgedExtractor
+        primary, secondary = cloud[0], cloud[1]
+        hedged = HedgedExtractor(primary.extractor, secondary.extractor, primary.name, secondary.name,
+                                 delay_percentile=settings.HEDGE_DELAY_PERCENTILE,
+                                 max_hedge_ratio=settings.HEDGE_MAX_RATIO)
+        tiers = [tier for tier in tiers if tier not in (primary, secondary)]
+        tiers.append(CascadeTier(f"{primary.name}+{secondary.name}", hedged, primary.cost))
+    return tiers
+
+
+def create_extractor_cascade(cache=None, **kwargs) -> ExtractorCascade:
+    return ExtractorCascade(default_tiers(cache), **kwargs)
@@ -0,0 +1,215 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from src.extraction import deadlines
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """The backend's breaker is open; the call was not attempted"""
+
+
+class CircuitBreaker:
+    """Per-backend breaker over a sliding window of recent calls.
+
+    Opens when, over the last `window` calls (at least `min_calls`), the
+    share of failures reaches `failure_rate_threshold` or the share of calls
+    slower than `slow_call_seconds` reaches `slow_call_rate_threshold`. An
+    open breaker rejects calls immediately; after `open_seconds` it lets
+    `half_open_probes` trial calls through and closes again only if they
+    all succeed.
+    """
+
+    def __init__(self, name: str, failure_rate_threshold: float = 0.5, slow_call_seconds: Optional[float] = None,
+                 slow_call_rate_threshold: float = 0.5, window: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._calls = deque(maxlen=window)  # (failed, slow)
+        self._opened_at = 0.0
+        self._probes_started = 0
+        self._probes_passed = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through now (claims a probe slot when half-open)"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes_started < self.half_open_probes:
+                self._probes_started += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record(self, success: bool, elapsed: float):
+        with self._lock:
+            slow = self.slow_call_seconds is not None and elapsed > self.slow_call_seconds
+            if self.state == HALF_OPEN:
+                if not success or slow:
+                    self._transition(OPEN)
+                else:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.half_open_probes:
+                        self._transition(CLOSED)
+                return
+            if self.state == OPEN:
+                return  # a call admitted before the breaker opened
+            self._calls.append((not success, slow))
+            if len(self._calls) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._transition(OPEN)
+
+    def release(self):
+        """An admitted call was cancelled before it finished: free its probe slot, record nothing"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes_started > self._probes_passed:
+                self._probes_started -= 1
+
+    def _rates(self):
+        calls = len(self._calls) or 1
+        return (sum(failed for failed, _ in self._calls) / calls,
+                sum(slow for _, slow in self._calls) / calls)
+
+    def _transition(self, state: str):
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        self._probes_started = 0
+        self._probes_passed = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        elif state == CLOSED:
+            self._calls.clear()
+
+    def health(self) -> float:
+        """0 when open, otherwise 1 minus the recent failure rate (at least 0.1)"""
+        with self._lock:
+            if self.state == OPEN:
+                return 0.0
+            failure_rate, _ = self._rates()
+        return max(0.1, 1.0 - failure_rate)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            failure_rate, slow_rate = self._rates()
+            snapshot = {
+                "state": self.state,
+                "calls": len(self._calls),
+                "failure_rate": round(failure_rate, 3),
+                "slow_call_rate": round(slow_rate, 3),
+                "rejected": self._rejected
+            }
+            if self.state == OPEN:
+                snapshot["retry_in"] = round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1)
+        return snapshot
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, **options) -> CircuitBreaker:
+    """The process-wide breaker for backend `name`; options only apply on first use"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, **options)
+        return _breakers[name]
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of every breaker, for the /health endpoint"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+class BreakerExtractor:
+    """Wraps an extractor's analyze_document in a circuit breaker.
+
+    Raised exceptions (from `analyze_document_strict` where the extractor
+    has one) and results carrying an "error" count as failures; a blank
+    page that yields no items does not. While the breaker is open the call
+    returns at once with "circuit_open": True, so callers fail over instead
+    of waiting out a timeout. A cancelled async call counts as neither.
+    """
+
+    def __init__(self, extractor, name: str, breaker: Optional[CircuitBreaker] = None):
+        self.extractor = extractor
+        self.name = name
+        self.breaker = breaker or get_circuit_breaker(name)
+
+    def analyze_document(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        try:
+            return self.analyze_document_strict(document_content, deadline)
+        except Exception as e:
+            return self._failed(e)
+
+    async def analyze_document_async(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        try:
+            return await self.analyze_document_strict_async(document_content, deadline)
+        except Exception as e:
+            return self._failed(e)
+
+    def _failed(self, error: Exception) -> Dict[str, Any]:
+        if isinstance(error, CircuitOpenError):
+            return {"line_items": [], "totals": {}, "confidence": 0.0, "error": str(error), "circuit_open": True}
+        logger.error(f"{self.name} extraction failed: {error}")
+        return {"line_items": [], "totals": {}, "confidence": 0.0, "error": str(error)}
+
+    def analyze_document_strict(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open")
+        analyze = getattr(self.extractor, "analyze_document_strict", None) or self.extractor.analyze_document
+        started = time.monotonic()
+        try:
+            result = deadlines.analyze(analyze, document_content, deadline)
+        except Exception:
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        self.breaker.record(not result.get("error"), time.monotonic() - started)
+        return result
+
+    async def analyze_document_strict_async(self, document_content,
+                                            deadline: Optional[float] = None) -> Dict[str, Any]:
+        analyze = (getattr(self.extractor, "analyze_document_strict_async", None)
+                   or getattr(self.extractor, "analyze_document_async", None))
+        if analyze is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(
+                self.analyze_document_strict, document_content, deadline
+            ))
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} circuit open")
+        started = time.monotonic()
+        try:
+            result = await deadlines.analyze(analyze, document_content, deadline)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        self.breaker.record(not result.get("error"), time.monotonic() - started)
+        return result
+
+
+def create_breaker_extractor(extractor, name: str, **options) -> BreakerExtractor:
+    return BreakerExtractor(extractor, name, get_circuit_breaker(name, **options))
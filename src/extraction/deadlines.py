@@ -0,0 +1,33 @@
+import functools
+import inspect
+import time
+from typing import Any, Callable, Optional
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until a time.monotonic() deadline; None without one"""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+@functools.lru_cache(maxsize=None)
+def _takes_deadline(function: Callable) -> bool:
+    try:
+        return "deadline" in inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def analyze(method: Callable, document_content, deadline: Optional[float] = None) -> Any:
+    """Call an extractor's analyze method, handing it `deadline` if it takes one.
+
+    Wrappers (breaker, scheduler, hedge, cascade) forward the request
+    deadline this way, so it reaches the extractors that can honour it and
+    extractors without a `deadline` parameter keep working unchanged.
+    """
+    if deadline is not None and _takes_deadline(getattr(method, "__func__", method)):
+        return method(document_content, deadline=deadline)
+    return method(document_content)
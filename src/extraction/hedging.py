@@ -0,0 +1,217 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from src.extraction import deadlines
+
+logger = logging.getLogger(__name__)
+
+
+class HedgedExtractor:
+    """Sends a document to a primary cloud extractor and, if it is slow, to a secondary too.
+
+    The hedge fires once the primary has been running longer than the
+    `delay_percentile` of its recent latencies (`initial_delay` until
+    `min_samples` are known). The first usable answer wins and the other
+    request is cancelled. At most `max_hedge_ratio` of all requests are
+    hedged, so a slow provider cannot double the cloud bill. A primary
+    that fails outright fails over to the secondary regardless of the cap.
+
+    Extractors with `analyze_document_async` are awaited (and cancelled for
+    real); others run on a thread pool, where a losing call is abandoned
+    rather than interrupted. The breaker and scheduler wrappers, the async
+    Azure extractor and Textract all have one, so default_tiers builds a
+    hedge whose loser stops polling and frees its quota slot.
+
+    Live hedges report their metrics through hedge_metrics() (/health).
+    """
+
+    def __init__(self, primary, secondary, primary_name: str = "azure", secondary_name: str = "textract",
+                 delay_percentile: float = 95.0, initial_delay: float = 2.0, min_delay: float = 0.05,
+                 max_hedge_ratio: float = 0.1, window: int = 500, min_samples: int = 20, max_workers: int = 16):
+        self.extractors = {primary_name: primary, secondary_name: secondary}
+        self.name = f"{primary_name}+{secondary_name}"
+        self.primary_name = primary_name
+        self.secondary_name = secondary_name
+        self.delay_percentile = delay_percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._metrics = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0, "failovers": 0,
+                         "latency_saved": 0.0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+        self._background_loop: Optional[asyncio.AbstractEventLoop] = None
+        with _hedges_lock:
+            _hedges.add(self)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the primary before hedging"""
+        with self._lock:
+            samples = list(self._latencies)
+        if len(samples) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, float(np.percentile(samples, self.delay_percentile)))
+
+    def _take_hedge_budget(self) -> bool:
+        with self._lock:
+            if self._metrics["hedged"] + 1 > self.max_hedge_ratio * self._metrics["requests"]:
+                self._metrics["budget_denied"] += 1
+                return False
+            self._metrics["hedged"] += 1
+            return True
+
+    async def _call(self, name: str, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        extractor = self.extractors[name]
+        try:
+            if hasattr(extractor, "analyze_document_async"):
+                return await deadlines.analyze(extractor.analyze_document_async, document_content, deadline)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(
+                deadlines.analyze, extractor.analyze_document, document_content, deadline
+            ))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"{name} extraction failed: {e}")
+            return {"line_items": [], "totals": {}, "confidence": 0.0, "error": str(e)}
+
+    @staticmethod
+    def _usable(result: Dict[str, Any]) -> bool:
+        return bool(result.get("line_items")) and not result.get("error")
+
+    async def analyze_document_async(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Analyze with the primary, hedging to the secondary when it is slow"""
+        with self._lock:
+            self._metrics["requests"] += 1
+        started = time.monotonic()
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._call(self.primary_name, document_content, deadline))
+        tasks = {primary: self.primary_name}
+        # The primary's own latency, if it finishes (rather than being cancelled)
+        primary_latency = []
+
+        def primary_done(task):
+            if not task.cancelled():
+                primary_latency.append(time.monotonic() - started)
+
+        primary.add_done_callback(primary_done)
+
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        primary_failed = bool(done) and not self._usable(next(iter(done)).result())
+        hedged = False
+        if primary_failed:
+            with self._lock:
+                self._metrics["failovers"] += 1
+        elif not done:
+            hedged = self._take_hedge_budget()
+        if primary_failed or hedged:
+            tasks[asyncio.ensure_future(self._call(self.secondary_name, document_content, deadline))] = \
+                self.secondary_name
+
+        winner, result = None, None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # Keep the primary's answer if neither is usable
+                    if result is None or tasks[task] == self.primary_name:
+                        winner, result = tasks[task], task.result()
+                    if self._usable(task.result()):
+                        winner, result = tasks[task], task.result()
+                        pending = set()
+                        break
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        elapsed = time.monotonic() - started
+        self._record(primary_latency[0] if primary_latency else None,
+                     primary.done() and not primary.cancelled() and self._usable(primary.result()),
+                     hedged and winner == self.secondary_name, elapsed, delay)
+        result = dict(result)
+        result["hedge"] = {"winner": winner, "hedged": hedged, "failover": primary_failed,
+                           "delay": round(delay, 4), "elapsed": round(elapsed, 4)}
+        return result
+
+    def _record(self, primary_latency: Optional[float], primary_usable: bool, hedge_won: bool,
+                elapsed: float, delay: float):
+        """Update the primary's latency window and the hedge metrics
+
+        Only the primary's own timings go in the window: a failed primary
+        and a failover (secondary time on top of the failure) say nothing
+        about how long a good primary answer takes.
+        """
+        with self._lock:
+            if hedge_won:
+                self._metrics["hedge_wins"] += 1
+            if hedge_won and primary_latency is None:
+                # The cancelled primary would have taken at least `elapsed`; estimate
+                # it from the primary latencies that were slow enough to be hedged
+                tail = [latency for latency in self._latencies if latency > delay]
+                estimate = max(elapsed, sum(tail) / len(tail)) if tail else elapsed
+                self._metrics["latency_saved"] += estimate - elapsed
+                # Censored sample: keeps the percentile from drifting down as slow primaries are cut off
+                self._latencies.append(elapsed)
+            elif primary_latency is not None and primary_usable:
+                self._latencies.append(primary_latency)
+
+    def analyze_document(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Blocking facade for synchronous callers such as the extractor cascade"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.analyze_document_async(document_content, deadline), self._get_background_loop()
+        )
+        return future.result()
+
+    def _get_background_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._background_loop is None:
+                self._background_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._background_loop.run_forever, daemon=True,
+                                 name="hedge-loop").start()
+            return self._background_loop
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        requests = metrics["requests"]
+        metrics["hedge_rate"] = round(metrics["hedged"] / requests, 4) if requests else 0.0
+        metrics["latency_saved"] = round(metrics["latency_saved"], 4)
+        metrics["hedge_delay"] = round(self.hedge_delay(), 4)
+        return metrics
+
+    def close(self):
+        with _hedges_lock:
+            _hedges.discard(self)
+        with self._lock:
+            loop, self._background_loop = self._background_loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hedges: "weakref.WeakSet[HedgedExtractor]" = weakref.WeakSet()
+_hedges_lock = threading.Lock()
+
+
+def hedge_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metrics of every live hedge (hedge_rate, latency_saved, ...), for the /health endpoint"""
+    with _hedges_lock:
+        hedges = list(_hedges)
+    return {hedge.name: hedge.metrics() for hedge in hedges}
+
+
+def create_hedged_extractor(primary, secondary, **kwargs) -> HedgedExtractor:
+    return HedgedExtractor(primary, secondary, **kwargs)
@@ -1,13 +1,16 @@
 import logging
 from typing import List, Dict, Any
 import random
+import time
 
 logger = logging.getLogger(__name__)
 
 class MockExtractor:
     """Mock extractor for testing without real API keys"""
     
-    def __init__(self):
+    def __init__(self, latency: float = 0.0):
+        # Simulated processing time per call, in seconds
+        self.latency = latency
         self.sample_items = [
             {"item_name": "Livi 300ng Tab", "item_rate": 22.0, "item_quantity": 14, "item_amount": 308.0},
             {"item_name": "Meinuro", "item_rate": 17.72, "item_quantity": 7, "item_amount": 124.84},
@@ -17,12 +20,12 @@ class MockExtractor:
             {"item_name": "Lab Test Basic", "item_rate": 200.0, "item_quantity": 1, "item_amount": 200.0}
         ]
     
-    def analyze_document(self, document_content: bytes) -> Dict[str, Any]:
+    def analyze_document(self, document_content: Any) -> Dict[str, Any]:
         """Mock document analysis"""
         try:
             # Simulate processing time
-            import time
-            time.sleep(1)
+            if self.latency:
+                time.sleep(self.latency)
             
             # Randomly select 3-6 items
             num_items = random.randint(3, 6)
@@ -0,0 +1,217 @@
+import logging
+import os
+import shlex
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytesseract
+from PIL import Image
+
+from src.extraction.ocr_layout import parse_tsv
+
+logger = logging.getLogger(__name__)
+
+# tesserocr is optional; without it every OCR call goes through pytesseract
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    tesserocr = None
+    TESSEROCR_AVAILABLE = False
+
+
+def parse_tesseract_config(config: str) -> Tuple[Optional[int], Optional[int], Optional[str], Dict[str, str]]:
+    """Split a tesseract CLI config string into (oem, psm, lang, variables).
+
+    Tokenized with shlex exactly like pytesseract does, so both backends see
+    the same options; tokens the CLI would not treat as options are ignored.
+    """
+    oem = psm = lang = None
+    variables: Dict[str, str] = {}
+    tokens = shlex.split(config)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        value = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token == "--oem" and value is not None:
+            oem = int(value)
+        elif token == "--psm" and value is not None:
+            psm = int(value)
+        elif token == "-l" and value is not None:
+            lang = value
+        elif token == "-c" and value and "=" in value:
+            key, _, variable = value.partition("=")
+            variables[key] = variable
+        else:
+            logger.debug(f"Ignoring tesseract config token: {token}")
+            index += 1
+            continue
+        index += 2
+    return oem, psm, lang, variables
+
+
+class OCRBackend(ABC):
+    """Runs one Tesseract pass over an image with a CLI-style config string"""
+
+    name = "base"
+
+    def __init__(self, lang: str = "eng"):
+        self.lang = lang
+        # Survives pickling, so process pool workers can tell backends apart (see worker_backend)
+        self.backend_id = uuid.uuid4().hex
+
+    @abstractmethod
+    def image_to_string(self, image: Image.Image, config: str = "") -> str:
+        """Recognized text of the image"""
+
+    @abstractmethod
+    def image_to_data(self, image: Image.Image, config: str = "") -> Dict[str, List[Any]]:
+        """Word-level output (boxes, confidences, line numbers) as pytesseract's Output.DICT"""
+
+    def close(self):
+        """Release engine resources held by this backend"""
+        with _worker_backends_lock:
+            _worker_backends.pop(self.backend_id, None)
+
+
+class PytesseractBackend(OCRBackend):
+    """Shells out to the tesseract binary; one process and model load per call"""
+
+    name = "pytesseract"
+
+    def image_to_string(self, image: Image.Image, config: str = "") -> str:
+        return pytesseract.image_to_string(image, lang=self.lang, config=config)
+
+    def image_to_data(self, image: Image.Image, config: str = "") -> Dict[str, List[Any]]:
+        return pytesseract.image_to_data(image, lang=self.lang, config=config,
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrBackend(OCRBackend):
+    """Persistent in-process engine via the tesserocr binding.
+
+    Each worker thread keeps its own initialized TessBaseAPI per
+    (language, OEM), so language data is loaded once per worker instead of
+    once per call, and images are passed as in-memory buffers instead of
+    temp files. `-c` variables are restored after every call so one
+    config's whitelist cannot leak into the next pass. The backend tracks
+    every engine it created, whichever thread did, and `close` ends them
+    all.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, lang: str = "eng", tessdata_path: Optional[str] = None):
+        if not TESSEROCR_AVAILABLE:
+            raise RuntimeError("tesserocr is not installed (pip install tesserocr)")
+        super().__init__(lang)
+        self.tessdata_path = tessdata_path or os.environ.get("TESSDATA_PREFIX")
+        self._local = threading.local()
+        self._engines: List[Any] = []
+        self._engines_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Engines are per worker; a process pool re-creates them on first use
+        state = self.__dict__.copy()
+        for name in ("_local", "_engines", "_engines_lock"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._engines = []
+        self._engines_lock = threading.Lock()
+
+    def _engine_kwargs(self, lang: str, oem: Optional[int]) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {"lang": lang}
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path.rstrip("/") + "/"
+        if oem is not None:
+            kwargs["oem"] = oem
+        return kwargs
+
+    def check(self):
+        """Load and immediately end an engine; raises if the language data cannot be loaded"""
+        tesserocr.PyTessBaseAPI(**self._engine_kwargs(self.lang, None)).End()
+
+    def _api(self, lang: str, oem: Optional[int]):
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        key = (lang, oem)
+        if key not in apis:
+            apis[key] = tesserocr.PyTessBaseAPI(**self._engine_kwargs(lang, oem))
+            with self._engines_lock:
+                self._engines.append(apis[key])
+            logger.debug(f"Initialized Tesseract engine for {key} in {threading.current_thread().name}")
+        return apis[key]
+
+    def image_to_string(self, image: Image.Image, config: str = "") -> str:
+        return self._recognize(image, config, lambda api: api.GetUTF8Text())
+
+    def image_to_data(self, image: Image.Image, config: str = "") -> Dict[str, List[Any]]:
+        return parse_tsv(self._recognize(image, config, lambda api: api.GetTSVText(0)), header=False)
+
+    def _recognize(self, image: Image.Image, config: str, read_result):
+        oem, psm, lang, variables = parse_tesseract_config(config)
+        api = self._api(lang or self.lang, oem)
+
+        defaults = {key: api.GetVariableAsString(key) for key in variables}
+        try:
+            for key, value in variables.items():
+                api.SetVariable(key, value)
+            api.SetPageSegMode(psm if psm is not None else tesserocr.PSM.AUTO)
+            api.SetImage(image)
+            return read_result(api)
+        finally:
+            for key, value in defaults.items():
+                api.SetVariable(key, value or "")
+            api.Clear()
+
+    def close(self):
+        """End every engine this backend created, in any thread"""
+        with self._engines_lock:
+            engines, self._engines = self._engines, []
+            self._local = threading.local()
+        for api in engines:
+            api.End()
+        super().close()
+
+
+_worker_backends: Dict[str, OCRBackend] = {}
+_worker_backends_lock = threading.Lock()
+
+
+def worker_backend(backend: OCRBackend) -> OCRBackend:
+    """The long-lived instance in this process of the same backend as `backend`.
+
+    Backends submitted to a process pool arrive as fresh unpickled copies;
+    mapping each copy to the first one seen with its `backend_id` keeps
+    engines loaded across calls. Different backends never share an
+    instance, even with the same language and tessdata.
+    """
+    with _worker_backends_lock:
+        return _worker_backends.setdefault(backend.backend_id, backend)
+
+
+def create_ocr_backend(name: str = "auto", lang: str = "eng", tessdata_path: Optional[str] = None) -> OCRBackend:
+    """Create an OCR backend; "auto" prefers tesserocr when its language data loads"""
+    if name == "pytesseract":
+        return PytesseractBackend(lang=lang)
+    if name == "tesserocr":
+        return TesserocrBackend(lang=lang, tessdata_path=tessdata_path)
+    if name != "auto":
+        raise ValueError(f"Unknown OCR backend: {name}")
+
+    if TESSEROCR_AVAILABLE:
+        backend = TesserocrBackend(lang=lang, tessdata_path=tessdata_path)
+        try:
+            # Probe with a throwaway engine; the OCR workers load their own
+            backend.check()
+            return backend
+        except Exception as e:
+            logger.warning(f"tesserocr unavailable, falling back to pytesseract: {e}")
+    return PytesseractBackend(lang=lang)
@@ -0,0 +1,141 @@
+import logging
+import re
+from typing import Any, Dict, List, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+_NUMBER = re.compile(r'^[₹$]?\d[\d,]*\.?\d*$')
+
+
+class OCRWord(NamedTuple):
+    text: str
+    left: int
+    top: int
+    width: int
+    height: int
+    conf: float  # 0-100, as reported by Tesseract
+
+    @property
+    def right(self) -> int:
+        return self.left + self.width
+
+    @property
+    def is_number(self) -> bool:
+        return bool(_NUMBER.match(self.text))
+
+
+class OCRLayout:
+    """Word-level OCR result: text, boxes and confidences grouped into lines.
+
+    Built from one Tesseract `image_to_data` pass (or a PDF text layer), so
+    plain text, line grouping, table detection and confidence all come from
+    the same result instead of separate OCR runs.
+    """
+
+    def __init__(self, lines: List[List[OCRWord]], source: str = "ocr"):
+        self.lines = [line for line in lines if line]
+        self.source = source
+
+    @classmethod
+    def from_tesseract_data(cls, data: Dict[str, List[Any]]) -> "OCRLayout":
+        """Group `image_to_data` output (pytesseract Output.DICT layout) into lines"""
+        lines: Dict[tuple, List[OCRWord]] = {}
+        for index, text in enumerate(data.get("text", [])):
+            text = str(text).strip()
+            conf = float(data["conf"][index])
+            # Non-word levels (page, block, line) carry conf -1 and no text
+            if not text or conf < 0:
+                continue
+            key = (data["page_num"][index], data["block_num"][index],
+                   data["par_num"][index], data["line_num"][index])
+            lines.setdefault(key, []).append(OCRWord(
+                text, int(data["left"][index]), int(data["top"][index]),
+                int(data["width"][index]), int(data["height"][index]), conf
+            ))
+        return cls(list(lines.values()))
+
+    @classmethod
+    def from_text_layer(cls, text_layer) -> "OCRLayout":
+        """Layout of a PDF text layer; embedded text is exact, so confidence is 100"""
+        lines = [
+            [OCRWord(text, int(x0), int(y0), int(x1 - x0), int(y1 - y0), 100.0)
+             for x0, y0, x1, y1, text in row]
+            for row in text_layer.rows()
+        ]
+        return cls(lines, source="pdf_text_layer")
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.line_text(index) for index in range(len(self.lines)))
+
+    def line_text(self, index: int) -> str:
+        return " ".join(word.text for word in self.lines[index])
+
+    def line_confidence(self, index: int) -> float:
+        """Mean word confidence of a line, scaled to 0-1"""
+        words = self.lines[index]
+        return sum(word.conf for word in words) / (100.0 * len(words)) if words else 0.0
+
+    @property
+    def mean_confidence(self) -> float:
+        words = [word for line in self.lines for word in line]
+        return sum(word.conf for word in words) / (100.0 * len(words)) if words else 0.0
+
+    def table_lines(self, min_rows: int = 3) -> List[int]:
+        """Indices of lines that belong to a table of right-aligned number columns.
+
+        Amount columns are found by clustering the right edges of numeric
+        words; a column needs numbers from at least `min_rows` lines, and a
+        table line has numbers in at least two columns.
+        """
+        numeric = [(index, word) for index, line in enumerate(self.lines) for word in line if word.is_number]
+        if not numeric:
+            return []
+        heights = sorted(word.height for _, word in numeric)
+        tolerance = max(heights[len(heights) // 2], 1)
+
+        # Greedy 1-D clustering of right edges
+        columns: List[List[tuple]] = []
+        for index, word in sorted(numeric, key=lambda entry: entry[1].right):
+            if columns and word.right - columns[-1][-1][1].right <= tolerance:
+                columns[-1].append((index, word))
+            else:
+                columns.append([(index, word)])
+
+        hits: Dict[int, int] = {}
+        for column in columns:
+            rows = {index for index, _ in column}
+            if len(rows) >= min_rows:
+                for index in rows:
+                    hits[index] = hits.get(index, 0) + 1
+        return sorted(index for index, count in hits.items() if count >= 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "line_count": len(self.lines),
+            "word_count": sum(len(line) for line in self.lines),
+            "mean_confidence": round(self.mean_confidence, 4),
+            "table_lines": len(self.table_lines())
+        }
+
+
+def parse_tsv(tsv: str, header: bool = True) -> Dict[str, List[Any]]:
+    """Parse Tesseract TSV output into the pytesseract Output.DICT layout"""
+    columns = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+               "left", "top", "width", "height", "conf", "text"]
+    data: Dict[str, List[Any]] = {column: [] for column in columns}
+    rows = tsv.splitlines()[1 if header else 0:]
+    for row in rows:
+        fields = row.split("\t")
+        if len(fields) < len(columns) - 1:
+            continue
+        fields += [""] * (len(columns) - len(fields))
+        for column, value in zip(columns, fields):
+            if column == "text":
+                data[column].append(value)
+            elif column == "conf":
+                data[column].append(float(value))
+            else:
+                data[column].append(int(value))
+    return data
@@ -1,66 +1,178 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
 import logging
-from src.extraction.mock_extractor import MockExtractor
+import time
+from src.extraction.batch import BatchRunner
+from src.extraction.cascade import create_extractor_cascade
+from src.extraction.registry import create_extractor
+from src.extraction.stages import (
+    ExplainStage, ExtractStage, FetchStage, FormatStage, PipelineContext, PipelineStage, PreprocessStage,
+    ReconcileStage, ResubmissionStage, StageError, ValidateStage, extract_pages, format_success_response
+)
+from src.cache.bill_index import BillSignatureIndex, create_bill_index
+from src.cache.document_cache import DocumentCache, create_document_cache
+from src.preprocessing.decoded_document import DecodedDocument
+from src.preprocessing.document_processor import DocumentProcessor
 from src.reconciliation.validator import ReconciliationEngine
 
 logger = logging.getLogger(__name__)
 
 class BillExtractionPipeline:
-    def __init__(self, use_mock: bool = True):
+    def __init__(self, use_mock: bool = True, document_processor: Optional[DocumentProcessor] = None,
+                 extractor: Optional[Any] = None, mock_latency: float = 0.0,
+                 stages: Optional[List[PipelineStage]] = None, bill_index: Optional[BillSignatureIndex] = None,
+                 cache: Optional[DocumentCache] = None):
+        from config.settings import settings
+        
+        self.use_mock = use_mock
+        # Batch worker processes rebuild the pipeline from these
+        self.init_kwargs = dict(use_mock=use_mock, document_processor=document_processor, extractor=extractor,
+                                mock_latency=mock_latency, stages=stages, bill_index=bill_index, cache=cache)
         self.reconciliation_engine = ReconciliationEngine()
-        self.extractor = MockExtractor()
-        logger.info("Using mock extractor for bill extraction")
         
-    def process_document(self, document_url: str) -> Dict[str, Any]:
-        """Process document and extract bill data"""
+        # Resubmitted documents skip download, preprocessing and OCR
+        if cache is None and settings.DOCUMENT_CACHE_DIR:
+            cache = create_document_cache(settings.DOCUMENT_CACHE_DIR, settings.DOCUMENT_CACHE_MAX_SIZE_MB)
+        self.cache = cache
+        self.document_processor = document_processor or DocumentProcessor(cache=cache)
+        
+        if bill_index is None:
+            if settings.BILL_INDEX_PATH:
+                bill_index = create_bill_index(settings.BILL_INDEX_PATH,
+                                               short_circuit=settings.BILL_INDEX_SHORT_CIRCUIT)
+        self.bill_index = bill_index
+        
+        if extractor is not None:
+            self.extractor = extractor
+        elif use_mock:
+            self.extractor = create_extractor("mock", latency=mock_latency)
+            logger.info("Using mock extractor for bill extraction")
+        else:
+            self.extractor = create_extractor_cascade(cache=cache, reconciliation_engine=self.reconciliation_engine)
+            tiers = ", ".join(tier.name for tier in self.extractor.tiers)
+            logger.info(f"Using extractor cascade for bill extraction: {tiers}")
+        
+        self.stages = stages or self.build_stages()
+    
+    def build_stages(self) -> List[PipelineStage]:
+        """fetch -> validate -> preprocess -> extract -> reconcile -> explain -> format (-> resubmission
+        with a bill index); override to plug in stages"""
+        stages = [
+            FetchStage(self.document_processor),
+            ValidateStage(self.document_processor),
+            PreprocessStage(self.document_processor),
+            ExtractStage(self.extractor, self.reconciliation_engine, self.bill_index),
+            ReconcileStage(self.reconciliation_engine),
+            ExplainStage(),
+            FormatStage()
+        ]
+        if self.bill_index is not None:
+            stages.append(ResubmissionStage(self.bill_index))
+        return stages
+    
+    def process_document(self, document_url: str, on_page: Optional[Callable[[Dict[str, Any]], None]] = None,
+                         deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Process document and extract bill data
+        
+        Every stage runs in a timing span; per-stage durations are logged and
+        returned in the response "metadata", and a failure names its stage.
+        `on_page` receives each page's partial reconciliation (kept items,
+        running total) while later pages are still being extracted; an
+        extractor cascade streams them per tier, marked provisional.
+        `deadline` (a time.monotonic() timestamp) is handed to the
+        extractors that can honour it, and stops cascade escalation.
+        """
+        logger.info(f"Processing document: {document_url}")
+        context = PipelineContext(document_url)
+        context.on_page = on_page
+        context.deadline = deadline
+        return self._run_stages(context, self.stages) or self._success_response(context)
+    
+    def process_fetched(self, document_url: str, content: bytes,
+                        io_durations: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Run the CPU stages on an already fetched and validated document (batch workers)"""
+        context = PipelineContext(document_url)
+        context.document = DecodedDocument(content, source_url=document_url)
+        context.timings.durations.update(io_durations or {})
+        stages = [stage for stage in self.stages if not stage.io_bound]
+        return self._run_stages(context, stages) or self._success_response(context)
+    
+    def process_batch(self, document_urls: Iterable[str], concurrency: int = 8,
+                      cpu_workers: Optional[int] = None, cpu_executor: str = "process",
+                      max_in_flight: Optional[int] = None,
+                      cloud_concurrency: Optional[int] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Process many documents, yielding (url, result) pairs as they complete
+        
+        I/O stages (fetch, validate) run on `concurrency` threads; the CPU
+        stages (preprocess, extract, reconcile, format) on `cpu_workers`
+        processes, each with its own copy of this pipeline (threads with
+        `cpu_executor="thread"`). A cascade with cloud tiers runs those
+        stages on `cloud_concurrency` threads of this process instead, so the
+        provider quotas, breakers and hedge budget are shared. URLs are
+        pulled lazily and at most `max_in_flight` documents are fetched but
+        not yet finished, so memory stays flat for any batch size.
+        """
+        runner = BatchRunner(self, concurrency, cpu_workers, cpu_executor, max_in_flight, cloud_concurrency)
+        return runner.run(document_urls)
+    
+    def _run_stages(self, context: PipelineContext, stages: List[PipelineStage]) -> Optional[Dict[str, Any]]:
+        """Run `stages` in timing spans; returns the error response of a failed stage, else None"""
+        stage_name = None
         try:
-            logger.info(f"Processing document: {document_url}")
-            
-            # Use mock extractor directly
-            extraction_result = self.extractor.analyze_document(b"mock")
-            
-            # Reconcile and validate
-            reconciliation_result = self.reconciliation_engine.reconcile_extraction(
-                extraction_result, 
-                extraction_result.get('totals', {})
-            )
-            
-            return self._format_success_response(reconciliation_result)
-            
+            for stage in stages:
+                stage_name = stage.name
+                with context.timings.span(stage.name):
+                    stage.run(context)
+                if context.done:
+                    break
+        except StageError as e:
+            logger.error(f"Pipeline {e.stage} stage failed: {e}")
+            return self._error_response(str(e), self._metadata(context, failed_stage=e.stage))
         except Exception as e:
-            logger.error(f"Pipeline processing failed: {e}")
-            return self._error_response(f"Processing error: {str(e)}")
+            logger.error(f"Pipeline {stage_name} stage failed: {e}")
+            return self._error_response(f"Processing error in {stage_name} stage: {str(e)}",
+                                        self._metadata(context, failed_stage=stage_name))
+        return None
+    
+    def _success_response(self, context: PipelineContext) -> Dict[str, Any]:
+        response = context.response
+        response["metadata"] = self._metadata(context)
+        return response
+    
+    def _metadata(self, context: PipelineContext, failed_stage: Optional[str] = None) -> Dict[str, Any]:
+        timings = context.timings.as_ms()
+        total_ms = round((time.perf_counter() - context.started) * 1000, 1)
+        logger.info("Pipeline stages: " + " ".join(f"{name}={ms}ms" for name, ms in timings.items())
+                    + f" total={total_ms}ms")
+        metadata = {"stage_timings_ms": timings, "total_ms": total_ms}
+        if failed_stage:
+            metadata["failed_stage"] = failed_stage
+        extraction_result = context.extraction_result or {}
+        if "page_count" in extraction_result:
+            metadata["page_count"] = extraction_result["page_count"]
+        if "cascade" in extraction_result:
+            metadata["extractor"] = extraction_result["cascade"]["tier"]
+        elif context.extraction_result is not None:
+            metadata["extractor"] = type(self.extractor).__name__
+        if context.resubmission is not None:
+            metadata["resubmission_of"] = {key: context.resubmission[key]
+                                           for key in ("document_key", "source_url", "similarity", "first_page_only")
+                                           if key in context.resubmission}
+        if (context.reconciliation_result or {}).get("discrepancy_candidates"):
+            metadata["discrepancy_candidates"] = context.reconciliation_result["discrepancy_candidates"]
+        return metadata
+    
+    def extract_pages(self, document, extractor: Optional[Any] = None) -> Dict[str, Any]:
+        """Extract line items page by page, holding only one page in memory at a time"""
+        return extract_pages(self.document_processor.iter_pages(document), extractor or self.extractor)
     
     def _format_success_response(self, reconciliation_result: Dict) -> Dict[str, Any]:
         """Format successful response"""
-        line_items = reconciliation_result['line_items']
-        
-        formatted_items = []
-        for item in line_items:
-            formatted_items.append({
-                "item_name": item["item_name"],
-                "item_amount": round(float(item["item_amount"]), 2),
-                "item_rate": round(float(item.get("item_rate", item["item_amount"])), 2),
-                "item_quantity": float(item.get("item_quantity", 1.0))
-            })
-        
-        pagewise_line_items = [{
-            "page_no": "1",
-            "bill_items": formatted_items
-        }]
-        
-        return {
-            "is_success": True,
-            "data": {
-                "pagewise_line_items": pagewise_line_items,
-                "total_item_count": len(formatted_items),
-                "reconciled_amount": round(float(reconciliation_result['reconciled_amount']), 2)
-            }
-        }
+        return format_success_response(reconciliation_result)
     
-    def _error_response(self, error_message: str) -> Dict[str, Any]:
+    def _error_response(self, error_message: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         return {
             "is_success": False,
             "error": error_message,
-            "data": None
+            "data": None,
+            "metadata": metadata
         }
@@ -0,0 +1,48 @@
+import importlib
+import logging
+import threading
+from typing import Any, Dict, List, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# name -> (module, class). Modules are imported the first time a backend is
+# selected, so boto3, the Azure SDK or Tesseract bindings are only loaded
+# by processes that actually use them.
+EXTRACTOR_BACKENDS: Dict[str, Tuple[str, str]] = {
+    "mock": ("src.extraction.mock_extractor", "MockExtractor"),
+    "tesseract": ("src.extraction.tesseract_extractor", "TesseractExtractor"),
+    "azure": ("src.extraction.azure_extractor", "AzureFormRecognizerExtractor"),
+    "azure_async": ("src.extraction.azure_async_extractor", "AsyncAzureFormRecognizerExtractor"),
+    "textract": ("src.extraction.aws_extractor", "AWSTextractExtractor"),
+}
+
+_loaded: Dict[str, Type] = {}
+_lock = threading.Lock()
+
+
+def get_extractor_class(name: str) -> Type:
+    """The extractor class for backend `name`, importing its module on first use"""
+    if name not in EXTRACTOR_BACKENDS:
+        raise ValueError(f"Unknown extractor backend: {name}")
+    with _lock:
+        if name not in _loaded:
+            module_name, class_name = EXTRACTOR_BACKENDS[name]
+            _loaded[name] = getattr(importlib.import_module(module_name), class_name)
+            logger.info(f"Loaded {name} extractor backend")
+        return _loaded[name]
+
+
+def create_extractor(name: str, **kwargs) -> Any:
+    return get_extractor_class(name)(**kwargs)
+
+
+def enabled_extractors() -> List[str]:
+    """Backends enabled in settings (EXTRACTORS), cheapest first"""
+    from config.settings import settings
+    return settings.enabled_extractors
+
+
+def loaded_backends() -> List[str]:
+    """Backends whose modules have been imported in this process"""
+    with _lock:
+        return sorted(_loaded)
@@ -0,0 +1,349 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.extraction import deadlines
+
+logger = logging.getLogger(__name__)
+
+# Provider quotas (requests/second, burst, concurrent requests). Azure S0
+# allows 15 analyze TPS; Textract's AnalyzeDocument default is region-
+# dependent, 10 TPS in the larger regions. Override per deployment.
+PROVIDER_DEFAULTS = {
+    "azure": {"rate": 15.0, "burst": 15, "max_concurrency": 15},
+    "textract": {"rate": 10.0, "burst": 10, "max_concurrency": 10},
+}
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException",
+    "TooManyRequestsException", "RequestLimitExceeded", "SlowDown",
+}
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """True for provider throttling (botocore ClientError codes, HTTP 429)"""
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    return getattr(response, "status_code", None) == 429
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Server-suggested delay from a Retry-After header, if any"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        # botocore ClientError: a parsed response dict, headers lowercased
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders") or {}
+        value = headers.get("retry-after")
+    else:
+        headers = getattr(response, "headers", None) or {}
+        value = headers.get("Retry-After")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ThrottledError(RuntimeError):
+    """A document still throttled after all retries"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose refill rate can be changed at runtime"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take one token if one is available; returns 0, or the seconds until one will be"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the time waited"""
+        started = time.monotonic()
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return time.monotonic() - started
+            time.sleep(wait)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+
+class ProviderLimiter:
+    """Quota state for one provider: token bucket, concurrency cap and AIMD rate.
+
+    Throttling halves the request rate (down to `min_rate`); every success
+    adds back `increase_step`, so the rate settles just under the quota the
+    provider actually grants. Shared by every extractor of the provider.
+    """
+
+    def __init__(self, provider: str, rate: float, burst: int, max_concurrency: int,
+                 min_rate: float = 0.5, decrease_factor: float = 0.5, increase_step: Optional[float] = None):
+        self.provider = provider
+        # As configured, to check later get_provider_limiter calls against
+        self.options = dict(rate=rate, burst=burst, max_concurrency=max_concurrency, min_rate=min_rate,
+                            decrease_factor=decrease_factor, increase_step=increase_step)
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.decrease_factor = decrease_factor
+        self.increase_step = increase_step if increase_step is not None else rate * 0.05
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._metrics = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "throttled": 0,
+                         "retries": 0, "queued": 0, "in_flight": 0, "admitted": 0, "wait_time": 0.0}
+
+    def _count(self, **changes):
+        with self._lock:
+            for name, change in changes.items():
+                self._metrics[name] += change
+
+    def enter(self):
+        """Block until a concurrency slot and a rate token are both available"""
+        self._count(queued=1)
+        started = time.monotonic()
+        self._slots.acquire()
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self._slots.release()
+            raise
+        finally:
+            self._count(queued=-1, wait_time=time.monotonic() - started)
+        self._count(in_flight=1, admitted=1)
+
+    async def enter_async(self, poll_interval: float = 0.01):
+        """enter() for coroutines: waits without blocking the loop, and can be cancelled"""
+        self._count(queued=1)
+        started = time.monotonic()
+        try:
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(poll_interval)
+            try:
+                wait = self.bucket.try_acquire()
+                while wait > 0:
+                    await asyncio.sleep(wait)
+                    wait = self.bucket.try_acquire()
+            except BaseException:
+                self._slots.release()
+                raise
+        finally:
+            self._count(queued=-1, wait_time=time.monotonic() - started)
+        self._count(in_flight=1, admitted=1)
+
+    def exit(self):
+        self._count(in_flight=-1)
+        self._slots.release()
+
+    def on_success(self):
+        with self._lock:
+            rate = min(self.max_rate, self.bucket.rate + self.increase_step)
+        self.bucket.set_rate(rate)
+
+    def on_throttle(self):
+        with self._lock:
+            self._metrics["throttled"] += 1
+            rate = max(self.min_rate, self.bucket.rate * self.decrease_factor)
+        self.bucket.set_rate(rate)
+        logger.warning(f"{self.provider} throttled; request rate lowered to {rate:.2f}/s")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        admitted = metrics.pop("admitted")
+        metrics["queue_depth"] = metrics.pop("queued")
+        metrics["mean_wait"] = round(metrics.pop("wait_time") / admitted, 4) if admitted else 0.0
+        metrics["current_rate"] = round(self.bucket.rate, 3)
+        metrics["max_rate"] = self.max_rate
+        metrics["max_concurrency"] = self.max_concurrency
+        return metrics
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_provider_limiter(provider: str, **overrides) -> ProviderLimiter:
+    """The process-wide limiter for `provider`, created with `overrides` on first use.
+
+    Every extractor of a provider must share one quota, so later calls
+    whose overrides disagree with the existing limiter raise ValueError
+    instead of being silently ignored.
+    """
+    with _limiters_lock:
+        if provider not in _limiters:
+            options = {**PROVIDER_DEFAULTS.get(provider, {"rate": 5.0, "burst": 5, "max_concurrency": 5}),
+                       **overrides}
+            _limiters[provider] = ProviderLimiter(provider, **options)
+            return _limiters[provider]
+        limiter = _limiters[provider]
+        conflicting = {name: value for name, value in overrides.items() if limiter.options.get(name) != value}
+        if conflicting:
+            raise ValueError(f"The {provider} limiter already exists with {limiter.options}; "
+                             f"cannot apply {conflicting}")
+        return limiter
+
+
+class ScheduledExtractor:
+    """Drop-in extractor wrapper that keeps requests within a provider's quota.
+
+    Calls the wrapped extractor's `analyze_document_strict` (which raises
+    instead of returning an empty result) so throttling can be told apart
+    from real failures. Throttled calls are retried with jittered
+    exponential backoff, honouring Retry-After; documents that still fail
+    are reported with an "error" key and counted, never dropped silently.
+
+    The async variants await extractors that have them, so cancelling the
+    caller (a hedge loser) stops the request and frees its slot at once.
+    """
+
+    def __init__(self, extractor, provider: str, limiter: Optional[ProviderLimiter] = None,
+                 max_retries: int = 5, backoff_base: float = 1.0, max_backoff: float = 30.0):
+        self.extractor = extractor
+        self.provider = provider
+        self.limiter = limiter or get_provider_limiter(provider)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+
+    def analyze_document(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        try:
+            return self.analyze_document_strict(document_content, deadline)
+        except Exception as e:
+            return self._failed(e)
+
+    async def analyze_document_async(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        try:
+            return await self.analyze_document_strict_async(document_content, deadline)
+        except Exception as e:
+            return self._failed(e)
+
+    def _failed(self, error: Exception) -> Dict[str, Any]:
+        logger.error(f"{self.provider} extraction failed: {error}")
+        return {"line_items": [], "totals": {}, "confidence": 0.0, "error": str(error),
+                "throttled": isinstance(error, ThrottledError)}
+
+    def analyze_document_strict(self, document_content, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Analyze under the quota, retrying throttled calls; raises on failure
+
+        No retry is started that would only begin after `deadline`.
+        """
+        analyze = getattr(self.extractor, "analyze_document_strict", None) or self.extractor.analyze_document
+        self.limiter._count(submitted=1)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.enter()
+            try:
+                result = deadlines.analyze(analyze, document_content, deadline)
+            except Exception as e:
+                if not is_throttling_error(e):
+                    self.limiter._count(failed=1)
+                    raise
+                self.limiter.on_throttle()
+                error = e
+            else:
+                self.limiter.on_success()
+                self.limiter._count(completed=1)
+                return result
+            finally:
+                self.limiter.exit()
+
+            delay = self._backoff(attempt, error, deadline)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        self.limiter._count(failed=1)
+        raise ThrottledError(f"{self.provider} still throttling after {attempt} retries") from error
+
+    async def analyze_document_strict_async(self, document_content,
+                                            deadline: Optional[float] = None) -> Dict[str, Any]:
+        """analyze_document_strict for event loops
+
+        Extractors without an async variant run the whole scheduled call on
+        a thread, which keeps its slot until the provider call returns.
+        """
+        analyze = (getattr(self.extractor, "analyze_document_strict_async", None)
+                   or getattr(self.extractor, "analyze_document_async", None))
+        if analyze is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, functools.partial(
+                self.analyze_document_strict, document_content, deadline
+            ))
+        self.limiter._count(submitted=1)
+        try:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.enter_async()
+                try:
+                    result = await deadlines.analyze(analyze, document_content, deadline)
+                except Exception as e:
+                    if not is_throttling_error(e):
+                        self.limiter._count(failed=1)
+                        raise
+                    self.limiter.on_throttle()
+                    error = e
+                else:
+                    self.limiter.on_success()
+                    self.limiter._count(completed=1)
+                    return result
+                finally:
+                    self.limiter.exit()
+
+                delay = self._backoff(attempt, error, deadline)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.limiter._count(cancelled=1)
+            raise
+
+        self.limiter._count(failed=1)
+        raise ThrottledError(f"{self.provider} still throttling after {attempt} retries") from error
+
+    def _backoff(self, attempt: int, error: Exception, deadline: Optional[float]) -> Optional[float]:
+        """Delay before retrying a throttled call, or None to give up"""
+        if attempt >= self.max_retries:
+            return None
+        delay = min(self.max_backoff, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+        delay = max(delay, retry_after(error) or 0.0)
+        if deadline is not None and deadlines.remaining(deadline) <= delay:
+            return None
+        self.limiter._count(retries=1)
+        return delay
+
+    def analyze_many(self, documents: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Backfill helper: analyze documents concurrently up to the provider's cap, in input order"""
+        with ThreadPoolExecutor(max_workers=self.limiter.max_concurrency,
+                                thread_name_prefix=f"{self.provider}-scheduler") as pool:
+            return list(pool.map(self.analyze_document, documents))
+
+    def metrics(self) -> Dict[str, Any]:
+        return self.limiter.metrics()
+
+
+def create_scheduled_extractor(extractor, provider: str, **kwargs) -> ScheduledExtractor:
+    return ScheduledExtractor(extractor, provider, **kwargs)
@@ -0,0 +1,375 @@
+import functools
+import logging
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.cache.bill_index import BillSignatureIndex
+from src.extraction import deadlines
+from src.extraction.cascade import ExtractorCascade
+from src.preprocessing.pages import DocumentPage, count_pages
+from src.reconciliation.explainer import DiscrepancyExplainer
+from src.reconciliation.session import STREAMING_MAX_CANDIDATES, ReconciliationSession
+from src.reconciliation.validator import ReconciliationEngine
+
+logger = logging.getLogger(__name__)
+
+
+class StageError(Exception):
+    """A stage could not produce its output; `stage` names the one that failed"""
+
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+
+
+class StageTimings:
+    """Exclusive wall time per stage: time spent in a nested span (e.g. page
+    rasterization while the extract stage pulls pages) is charged to the
+    nested stage only, so the durations add up to the request time."""
+
+    def __init__(self):
+        self.durations: Dict[str, float] = {}
+        self._children: List[float] = []
+
+    @contextmanager
+    def span(self, name: str):
+        started = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._children.pop()
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed - nested
+            if self._children:
+                self._children[-1] += elapsed
+
+    def as_ms(self) -> Dict[str, float]:
+        return {name: round(seconds * 1000, 1) for name, seconds in self.durations.items()}
+
+
+class PipelineContext:
+    """State handed from stage to stage for one document"""
+
+    def __init__(self, document_url: str):
+        self.document_url = document_url
+        self.started = time.perf_counter()
+        self.document = None
+        # Callable returning a fresh page iterator (the cascade may walk the pages more than once)
+        self.pages: Optional[Callable[[], Iterator[Any]]] = None
+        self.extraction_result: Optional[Dict[str, Any]] = None
+        self.reconciliation_result: Optional[Dict[str, Any]] = None
+        # Reconciles pages as they are extracted; `on_page` receives each page's partial result
+        self.session: Optional[ReconciliationSession] = None
+        self.on_page: Optional[Callable[[Dict[str, Any]], None]] = None
+        # time.monotonic() by which the request must be answered (see deadlines.py)
+        self.deadline: Optional[float] = None
+        # Indexed bill this document looks like a resubmission of
+        self.resubmission: Optional[Dict[str, Any]] = None
+        # Set by a stage that produced the response itself; the remaining stages are skipped
+        self.done = False
+        self.response: Optional[Dict[str, Any]] = None
+        self.timings = StageTimings()
+
+
+class PipelineStage(ABC):
+    """One step of BillExtractionPipeline; reads and fills the context"""
+
+    name = "stage"
+    # Batch processing runs I/O stages (downloads, header checks) on threads
+    # and the rest on worker processes
+    io_bound = False
+
+    @abstractmethod
+    def run(self, context: PipelineContext):
+        """Run this step for one document, raising StageError when it cannot"""
+
+
+class FetchStage(PipelineStage):
+    name = "fetch"
+    io_bound = True
+
+    def __init__(self, document_processor):
+        self.document_processor = document_processor
+
+    def run(self, context: PipelineContext):
+        context.document = self.document_processor.fetch_document(context.document_url)
+        if context.document is None:
+            raise StageError(self.name, "Could not download a valid document")
+
+
+class ValidateStage(PipelineStage):
+    name = "validate"
+    io_bound = True
+
+    def __init__(self, document_processor):
+        self.document_processor = document_processor
+
+    def run(self, context: PipelineContext):
+        if not self.document_processor.validate_document(context.document):
+            raise StageError(self.name, "Could not download a valid document")
+
+
+class PreprocessStage(PipelineStage):
+    """Splits the document into pages.
+
+    Pages stay lazy and are produced one at a time while the extract stage
+    consumes them; producing a page (rasterizing a PDF page, decoding a
+    TIFF frame) is timed as preprocessing. Single images are left for the
+    extractor to decode, so it can still use a reduced JPEG draft.
+    """
+
+    name = "preprocess"
+
+    def __init__(self, document_processor):
+        self.document_processor = document_processor
+
+    def run(self, context: PipelineContext):
+        context.pages = lambda: self._timed_pages(context)
+
+    def _timed_pages(self, context: PipelineContext) -> Iterator[Any]:
+        pages = self.document_processor.iter_pages(context.document)
+        while True:
+            with context.timings.span(self.name):
+                page = next(pages, None)
+                if isinstance(page, DocumentPage) and page.text_layer is None:
+                    page.decode()
+            if page is None:
+                return
+            yield page
+
+
+def extract_pages(pages: Iterator[Any], extractor,
+                  on_page: Optional[Callable[[str, List[Dict], Dict], Any]] = None,
+                  deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Extract line items page by page, holding only one page in memory at a time;
+    `on_page(page_no, line_items, totals)` is called as each page is done and
+    stops the extraction by returning True. `deadline` is handed to extractors
+    that take one."""
+    line_items: List[Dict[str, Any]] = []
+    totals: Dict[str, Any] = {}
+    confidences: List[float] = []
+    page_count = 0
+    fallback = False
+    errors: List[str] = []
+    circuit_open = False
+
+    for page in pages:
+        page_count += 1
+        page_result = deadlines.analyze(extractor.analyze_document, page, deadline)
+        fallback = fallback or bool(page_result.get("fallback"))
+        circuit_open = circuit_open or bool(page_result.get("circuit_open"))
+        if page_result.get("error"):
+            errors.append(f"page {getattr(page, 'page_no', 1)}: {page_result['error']}")
+        page_no = str(getattr(page, "page_no", 1))
+        for item in page_result.get("line_items", []):
+            item["page_no"] = page_no
+            line_items.append(item)
+        # Grand totals are printed last, so later pages override earlier ones
+        totals.update(page_result.get("totals", {}))
+        stop = on_page is not None and on_page(page_no, page_result.get("line_items", []),
+                                               page_result.get("totals", {}))
+        if page_result.get("line_items"):
+            confidences.append(page_result.get("confidence", 0.0))
+
+        if hasattr(page, "release"):
+            page.release()
+        if stop:
+            break
+
+    logger.info(f"Extracted {len(line_items)} items from {page_count} pages")
+    result = {
+        "line_items": line_items,
+        "totals": totals,
+        "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+        "page_count": page_count,
+        "fallback": fallback
+    }
+    # A failed page makes the document result partial (the cascade escalates on this)
+    if errors:
+        result["error"] = "; ".join(errors)
+        result["circuit_open"] = circuit_open
+    return result
+
+
+class ExtractStage(PipelineStage):
+    """Runs the extractor over the pages.
+
+    With a reconciliation engine, each page is reconciled in a session as
+    soon as it is extracted and its partial result handed to
+    `context.on_page`; with a short-circuiting bill index, a first page that
+    matches an indexed bill, backed by whole-document evidence (see
+    BillSignatureIndex.first_page_match), ends the run with that bill's
+    stored response. A weaker match is only flagged.
+    An ExtractorCascade instead reconciles each tier it tries, and its
+    choice is kept for the reconcile stage; since a tier may still be
+    rejected, its pages are streamed as provisional ("provisional": True,
+    with the "tier"), and a later tier's pages supersede them. The first
+    page of the first (cheapest) tier is checked against the bill index the
+    same way, and a servable match stops the cascade from escalating.
+    """
+
+    name = "extract"
+
+    def __init__(self, extractor, reconciliation_engine: Optional[ReconciliationEngine] = None,
+                 bill_index: Optional[BillSignatureIndex] = None):
+        self.extractor = extractor
+        self.reconciliation_engine = reconciliation_engine
+        self.bill_index = bill_index
+
+    def run(self, context: PipelineContext):
+        if isinstance(self.extractor, ExtractorCascade):
+            tier_names = {id(tier.extractor): tier.name for tier in self.extractor.tiers}
+            short_circuit = self.bill_index is not None and self.bill_index.short_circuit
+            tried = []
+
+            def extract(extractor):
+                first_tier = not tried
+                tried.append(extractor)
+                on_page = None
+                if self.reconciliation_engine is not None and (context.on_page is not None
+                                                               or (first_tier and short_circuit)):
+                    session = self.reconciliation_engine.session(STREAMING_MAX_CANDIDATES)
+                    on_page = functools.partial(self._provisional_page, context, session,
+                                                tier_names.get(id(extractor)), first_tier)
+                return extract_pages(context.pages(), extractor, on_page, context.deadline)
+
+            context.extraction_result, context.reconciliation_result = self.extractor.run(
+                extract, context.deadline, should_stop=lambda: context.done
+            )
+        elif self.reconciliation_engine is not None:
+            context.session = self.reconciliation_engine.session(STREAMING_MAX_CANDIDATES)
+            context.extraction_result = extract_pages(context.pages(), self.extractor,
+                                                      lambda *page: self._reconcile_page(context, *page),
+                                                      context.deadline)
+        else:
+            context.extraction_result = extract_pages(context.pages(), self.extractor, deadline=context.deadline)
+
+    def _provisional_page(self, context: PipelineContext, session: ReconciliationSession, tier: Optional[str],
+                          first_tier: bool, page_no: str, line_items: List[Dict], totals: Dict) -> bool:
+        partial = session.add_page(line_items, totals, page_no)
+        if context.on_page is not None:
+            context.on_page({**partial, "tier": tier, "provisional": True})
+        return first_tier and self._first_page_match(context, session, partial, totals)
+
+    def _reconcile_page(self, context: PipelineContext, page_no: str, line_items: List[Dict], totals: Dict) -> bool:
+        partial = context.session.add_page(line_items, totals, page_no)
+        if context.on_page is not None:
+            context.on_page(partial)
+        return self._first_page_match(context, context.session, partial, totals)
+
+    def _first_page_match(self, context: PipelineContext, session: ReconciliationSession, partial: Dict,
+                          totals: Dict) -> bool:
+        """Serve an indexed bill's stored response when the first page matches it with enough evidence;
+        returns whether extraction can stop"""
+        if session.page_count != 1 or self.bill_index is None or not self.bill_index.short_circuit:
+            return False
+        printed_total = self.reconciliation_engine._get_extracted_total(totals) or None
+        match, servable = self.bill_index.first_page_match(partial["line_items"], count_pages(context.document),
+                                                           printed_total)
+        if match and servable:
+            logger.info(f"First page matches indexed bill {match['document_key']} "
+                        f"(similarity {match['similarity']}), serving its stored result")
+            context.resubmission = match
+            context.response = match["result"]
+            context.done = True
+            return True
+        if match:
+            logger.info(f"First page resembles indexed bill {match['document_key']} "
+                        f"(similarity {match['similarity']}) without matching evidence; extracting in full")
+            context.resubmission = {**match, "first_page_only": True}
+        return False
+
+
+class ReconcileStage(PipelineStage):
+    name = "reconcile"
+
+    def __init__(self, reconciliation_engine: ReconciliationEngine):
+        self.reconciliation_engine = reconciliation_engine
+
+    def run(self, context: PipelineContext):
+        if context.reconciliation_result is None and context.session is not None:
+            context.reconciliation_result = context.session.finish(context.extraction_result.get("totals", {}))
+        elif context.reconciliation_result is None:
+            context.reconciliation_result = self.reconciliation_engine.reconcile_extraction(
+                context.extraction_result,
+                context.extraction_result.get("totals", {})
+            )
+
+
+class ExplainStage(PipelineStage):
+    """For a bill that did not reconcile, looks for the few lines that
+    account for the gap and adds them to the reconciliation result as
+    "discrepancy_candidates" (see DiscrepancyExplainer)"""
+
+    name = "explain"
+
+    def __init__(self, explainer: Optional[DiscrepancyExplainer] = None):
+        self.explainer = explainer or DiscrepancyExplainer()
+
+    def run(self, context: PipelineContext):
+        result = context.reconciliation_result
+        if result.get("is_reconciled", True) or not result.get("extracted_total"):
+            return
+        result["discrepancy_candidates"] = self.explainer.explain(result, context.extraction_result.get("totals", {}))
+
+
+class FormatStage(PipelineStage):
+    name = "format"
+
+    def run(self, context: PipelineContext):
+        context.response = format_success_response(context.reconciliation_result)
+
+
+class ResubmissionStage(PipelineStage):
+    """Flags a bill that looks like one already processed (another scan or
+    photo of it) and adds it to the bill index with its response, page
+    count and printed total"""
+
+    name = "resubmission"
+
+    def __init__(self, bill_index: BillSignatureIndex):
+        self.bill_index = bill_index
+
+    def run(self, context: PipelineContext):
+        line_items = context.reconciliation_result["line_items"]
+        if not line_items:
+            return
+        if context.resubmission is None or context.resubmission.get("first_page_only"):
+            # The whole bill's signature is stronger evidence than a first-page hint
+            context.resubmission = self.bill_index.lookup(line_items) or context.resubmission
+        first_page = [item for item in line_items if item.get("page_no") == line_items[0].get("page_no")]
+        response = {key: value for key, value in context.response.items() if key != "metadata"}
+        self.bill_index.add(context.document.sha256, line_items, first_page, response, context.document_url,
+                            context.extraction_result.get("page_count"),
+                            context.reconciliation_result.get("extracted_total") or None)
+
+
+def format_success_response(reconciliation_result: Dict) -> Dict[str, Any]:
+    """API response body for a reconciled extraction"""
+    line_items = reconciliation_result['line_items']
+
+    pages: Dict[str, List[Dict[str, Any]]] = {}
+    for item in line_items:
+        pages.setdefault(str(item.get("page_no", "1")), []).append({
+            "item_name": item["item_name"],
+            "item_amount": round(float(item["item_amount"]), 2),
+            "item_rate": round(float(item.get("item_rate", item["item_amount"])), 2),
+            "item_quantity": float(item.get("item_quantity", 1.0))
+        })
+
+    pagewise_line_items = [
+        {"page_no": page_no, "bill_items": bill_items}
+        for page_no, bill_items in sorted(pages.items(), key=lambda entry: int(entry[0]))
+    ] or [{"page_no": "1", "bill_items": []}]
+
+    return {
+        "is_success": True,
+        "data": {
+            "pagewise_line_items": pagewise_line_items,
+            "total_item_count": len(line_items),
+            "reconciled_amount": round(float(reconciliation_result['reconciled_amount']), 2)
+        }
+    }
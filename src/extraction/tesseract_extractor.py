@@ -1,23 +1,101 @@
-import pytesseract
-from PIL import Image, ImageEnhance, ImageFilter
+from PIL import Image
 import requests
-import io
 import re
 import logging
+import threading
+import time
 import numpy as np
-from typing import Dict, List, Any, Optional
+from concurrent.futures import (Executor, ProcessPoolExecutor, ThreadPoolExecutor,
+                                FIRST_COMPLETED, wait)
+from typing import Dict, List, Any, Optional, Sequence, Tuple, Union
+from src.cache.document_cache import DocumentCache, settings_key
+from src.extraction.ocr_backends import OCRBackend, create_ocr_backend, worker_backend
+from src.extraction.ocr_layout import OCRLayout
+from src.preprocessing.decoded_document import DecodedDocument, DocumentInput
+from src.preprocessing.pages import iter_document_pages
+from src.preprocessing.enhancement import ImageEnhancer
+from src.preprocessing.resolution import ResolutionPlanner
+
+# Tesseract configurations tried by _robust_ocr
+OCR_CONFIGS = {
+    # Default for invoices
+    "psm6": r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$ ()/-+',
+    # Single text line mode
+    "psm8": r'--oem 3 --psm 8',
+    # Sparse text
+    "psm11": r'--oem 3 --psm 11',
+}
+
+
+def _ocr_pass(backend: OCRBackend, image: Image.Image, config: str) -> Tuple[str, float]:
+    """One Tesseract pass; module level so it can run in a process pool"""
+    started = time.perf_counter()
+    text = worker_backend(backend).image_to_string(image, config=config)
+    return text, time.perf_counter() - started
+
 
 class TesseractExtractor:
-    def __init__(self):
+    def __init__(self, cache: Optional[DocumentCache] = None, enhancement_mode: str = "numpy",
+                 ocr_config_order: Sequence[str] = ("psm6", "psm8", "psm11"),
+                 early_exit_score: Optional[float] = 3.0, ocr_workers: int = 2,
+                 ocr_executor: str = "thread", ocr_backend: Union[str, OCRBackend] = "auto",
+                 ocr_mode: str = "text"):
         self.logger = logging.getLogger(__name__)
+        self.cache = cache
+        self.enhancer = ImageEnhancer(contrast=2.0, sharpness=2.0, median_size=3,
+                                      mode=enhancement_mode)
+        # Tesseract prefers a little more resolution than the display pipeline
+        self.resolution_planner = ResolutionPlanner(min_width=1000, upscale_width=2000)
+        
+        unknown = [name for name in ocr_config_order if name not in OCR_CONFIGS]
+        if unknown or not ocr_config_order:
+            raise ValueError(f"Unknown OCR configs: {unknown}")
+        if ocr_executor not in ("thread", "process"):
+            raise ValueError(f"Unknown OCR executor: {ocr_executor}")
+        if ocr_mode not in ("text", "layout"):
+            raise ValueError(f"Unknown OCR mode: {ocr_mode}")
+        # "text": concurrent image_to_string passes scored by _score_text_quality
+        # "layout": one image_to_data pass, confidence from Tesseract word confidences
+        self.ocr_mode = ocr_mode
+        self.ocr_config_order = list(ocr_config_order)
+        self.early_exit_score = early_exit_score
+        # Fewer workers than configs, so the last config only runs when the first ones don't exit early
+        self.ocr_workers = ocr_workers
+        # pytesseract runs the tesseract binary, so threads already overlap passes;
+        # "process" also parallelizes the in-process image encoding
+        self.ocr_executor_kind = ocr_executor
+        # Persistent tesserocr engine when available, pytesseract subprocesses otherwise
+        self.ocr_backend = create_ocr_backend(ocr_backend) if isinstance(ocr_backend, str) else ocr_backend
+        # Cached OCR text is specific to these settings
+        self.cache_variant = settings_key(enhancement_mode=enhancement_mode, ocr_mode=ocr_mode,
+                                          ocr_config_order=self.ocr_config_order, early_exit_score=early_exit_score,
+                                          ocr_backend=type(self.ocr_backend).__name__,
+                                          lang=getattr(self.ocr_backend, "lang", None))
+        self._ocr_executor: Optional[Executor] = None
+        self._ocr_lock = threading.Lock()
+        self._ocr_run = threading.local()
+        self.ocr_stats = {name: {"runs": 0, "wins": 0, "total_time": 0.0} for name in OCR_CONFIGS}
         self.medical_terms = ['tab', 'cap', 'syr', 'inj', 'mg', 'ml', 'medicine', 'drug', 'pharma', 'tablet', 'capsule', 'syrup', 'injection']
         
-    def extract_text_from_content(self, document_content: bytes) -> str:
+    def extract_text_from_content(self, document_content: DocumentInput) -> str:
         """Enhanced OCR with better preprocessing"""
         try:
-            image = Image.open(io.BytesIO(document_content))
+            document = DecodedDocument.ensure(document_content)
+            if document.text_layer is not None:
+                # Digital PDF page: the embedded text is exact, no OCR needed
+                return document.text_layer.text.strip()
+            if document.is_pdf:
+                return self._extract_pdf_text(document)
+            plan = self.resolution_planner.plan(document)
+            image = self.resolution_planner.load(document, plan, mode='L')
             processed_image = self._advanced_preprocessing(image)
             
+            if self.ocr_mode == "layout":
+                # One word-level pass; text, lines and confidences all come from it
+                layout = self._layout_ocr(processed_image)
+                self._ocr_run.layout = layout
+                return layout.text.strip()
+            
             # Multiple OCR attempts with different configurations
             text = self._robust_ocr(processed_image)
             
@@ -26,80 +104,147 @@ class TesseractExtractor:
             self.logger.error(f"OCR extraction failed: {e}")
             return ""
     
+    def _extract_pdf_text(self, document: DecodedDocument) -> str:
+        """Text of every PDF page, OCR-ing only pages without a usable text layer"""
+        page_texts = []
+        for page in iter_document_pages(document):
+            page_texts.append(self.extract_text_from_content(page))
+            page.release()
+        # A single page's layout does not describe the joined text
+        self._ocr_run.layout = None
+        return "\n".join(text for text in page_texts if text)
+    
     def _advanced_preprocessing(self, image: Image.Image) -> Image.Image:
         """Advanced image preprocessing for better OCR"""
         try:
             # Convert to grayscale for better OCR
+            # (resolution is planned before this step, see ResolutionPlanner)
             if image.mode != 'L':
                 image = image.convert('L')
             
-            # Resize for better resolution
-            if image.size[0] < 1000:
-                scale_factor = 2000 / image.size[0]
-                new_size = (int(image.size[0] * scale_factor), int(image.size[1] * scale_factor))
-                image = image.resize(new_size, Image.LANCZOS)
-            
-            # Enhance contrast
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(2.0)
-            
-            # Enhance sharpness
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(2.0)
-            
-            # Apply slight blur to reduce noise
-            image = image.filter(ImageFilter.MedianFilter(3))
-            
-            return image
+            # Enhance contrast and sharpness, then median filter to reduce noise
+            return self.enhancer.enhance(image)
             
         except Exception as e:
             self.logger.warning(f"Advanced preprocessing failed: {e}")
             return image
     
     def _robust_ocr(self, image: Image.Image) -> str:
-        """Multiple OCR attempts with different configurations"""
-        ocr_results = []
-        
-        # Configuration 1: Default for invoices
-        try:
-            config1 = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$ ()/-+'
-            text1 = pytesseract.image_to_string(image, config=config1)
-            if self._is_quality_text(text1):
-                ocr_results.append(("config1", text1))
-        except Exception as e:
-            self.logger.debug(f"OCR config1 failed: {e}")
-        
-        # Configuration 2: Single text line mode
-        try:
-            config2 = r'--oem 3 --psm 8'
-            text2 = pytesseract.image_to_string(image, config=config2)
-            if self._is_quality_text(text2):
-                ocr_results.append(("config2", text2))
-        except Exception as e:
-            self.logger.debug(f"OCR config2 failed: {e}")
-        
-        # Configuration 3: Sparse text
+        """Multiple OCR attempts with different configurations
+        
+        Passes run in `ocr_config_order`, at most `ocr_workers` at a time;
+        the next one is only submitted when a running pass finishes. Once a
+        result scores at least `early_exit_score` no further pass is
+        started. Passes already running cannot be interrupted: they finish
+        in the background and their results are ignored.
+        """
+        started = time.perf_counter()
+        executor = self._get_ocr_executor()
+        queued = list(self.ocr_config_order)
+        futures = {}
+        pending = set()
+        
+        ocr_results = {}
+        timings = {}
+        early_exit = False
+        while not early_exit and (queued or pending):
+            while queued and len(pending) < self.ocr_workers:
+                config_name = queued.pop(0)
+                future = executor.submit(_ocr_pass, self.ocr_backend, image, OCR_CONFIGS[config_name])
+                futures[future] = config_name
+                pending.add(future)
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                config_name = futures[future]
+                try:
+                    text, elapsed = future.result()
+                except Exception as e:
+                    self.logger.debug(f"OCR {config_name} failed: {e}")
+                    continue
+                timings[config_name] = round(elapsed, 4)
+                if self._is_quality_text(text):
+                    ocr_results[config_name] = (self._score_text_quality(text), text)
+                    if self.early_exit_score is not None and ocr_results[config_name][0] >= self.early_exit_score:
+                        early_exit = True
+        
+        # Still queued behind another image's passes in the shared pool
+        for future in pending:
+            future.cancel()
+        
+        # Choose the best result; ties go to the config tried first
+        winner = None
+        if ocr_results:
+            winner = max(ocr_results, key=lambda name: (ocr_results[name][0],
+                                                        -self.ocr_config_order.index(name)))
+        self._record_ocr_run(timings, winner, early_exit, time.perf_counter() - started)
+        return ocr_results[winner][1] if winner else ""
+    
+    def _layout_ocr(self, image: Image.Image) -> OCRLayout:
+        """Single image_to_data pass with the first configured OCR config"""
+        config_name = self.ocr_config_order[0]
+        started = time.perf_counter()
         try:
-            config3 = r'--oem 3 --psm 11'
-            text3 = pytesseract.image_to_string(image, config=config3)
-            if self._is_quality_text(text3):
-                ocr_results.append(("config3", text3))
+            layout = OCRLayout.from_tesseract_data(
+                self.ocr_backend.image_to_data(image, config=OCR_CONFIGS[config_name])
+            )
         except Exception as e:
-            self.logger.debug(f"OCR config3 failed: {e}")
-        
-        # Choose the best result
-        if ocr_results:
-            # Prioritize results with numbers and medical terms
-            scored_results = []
-            for config_name, text in ocr_results:
-                score = self._score_text_quality(text)
-                scored_results.append((score, text))
-            
-            # Return highest scored text
-            scored_results.sort(reverse=True)
-            return scored_results[0][1]
-        
-        return ""
+            self.logger.debug(f"OCR {config_name} failed: {e}")
+            layout = OCRLayout([])
+        elapsed = time.perf_counter() - started
+        self._record_ocr_run({config_name: round(elapsed, 4)}, config_name if layout.lines else None,
+                             False, elapsed)
+        self._ocr_run.metadata["layout"] = layout.to_dict()
+        return layout
+    
+    def _get_ocr_executor(self) -> Executor:
+        """Shared bounded pool for OCR passes, created on first use"""
+        with self._ocr_lock:
+            if self._ocr_executor is None:
+                if self.ocr_executor_kind == "process":
+                    self._ocr_executor = ProcessPoolExecutor(max_workers=self.ocr_workers)
+                else:
+                    self._ocr_executor = ThreadPoolExecutor(max_workers=self.ocr_workers,
+                                                            thread_name_prefix="ocr")
+            return self._ocr_executor
+    
+    def _record_ocr_run(self, timings: Dict[str, float], winner: Optional[str], early_exit: bool, elapsed: float):
+        """Accumulate per-config statistics and remember this thread's run"""
+        with self._ocr_lock:
+            for config_name, seconds in timings.items():
+                stats = self.ocr_stats[config_name]
+                stats["runs"] += 1
+                stats["total_time"] += seconds
+            if winner:
+                self.ocr_stats[winner]["wins"] += 1
+        self._ocr_run.metadata = {
+            "backend": self.ocr_backend.name,
+            "config_order": list(self.ocr_config_order),
+            "timings": timings,
+            "winner": winner,
+            "early_exit": early_exit,
+            "wall_time": round(elapsed, 4),
+            "win_rates": self.get_ocr_stats()
+        }
+    
+    def get_ocr_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-config run count, mean wall time and win rate since startup"""
+        with self._ocr_lock:
+            return {
+                config_name: {
+                    "runs": stats["runs"],
+                    "mean_time": round(stats["total_time"] / stats["runs"], 4) if stats["runs"] else 0.0,
+                    "win_rate": round(stats["wins"] / stats["runs"], 4) if stats["runs"] else 0.0
+                }
+                for config_name, stats in self.ocr_stats.items()
+            }
+    
+    def close(self):
+        """Shut down the OCR worker pool"""
+        with self._ocr_lock:
+            if self._ocr_executor is not None:
+                self._ocr_executor.shutdown(wait=False, cancel_futures=True)
+                self._ocr_executor = None
+        self.ocr_backend.close()
     
     def _is_quality_text(self, text: str) -> bool:
         """Check if text contains meaningful content"""
@@ -136,37 +281,66 @@ class TesseractExtractor:
         
         return score
     
+    # Enhanced patterns for medical invoices
+    LINE_ITEM_PATTERNS = [
+        # Pattern: Medical Name Quantity Rate Amount
+        r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj|Tablet|Capsule|Syrup|Injection)[A-Za-z\s]*)\s+(\d+)\s+([\d,]+\.?\d*)\s+([\d,]+\.?\d*)',
+        # Pattern: Name x Quantity @ Rate = Amount
+        r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj)[A-Za-z\s]*)\s+x\s*(\d+)\s*@\s*([\d,]+\.?\d*)\s*=\s*([\d,]+\.?\d*)',
+        # Pattern: Name Rate Quantity Amount
+        r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj)[A-Za-z\s]*)\s+([\d,]+\.?\d*)\s+(\d+)\s+([\d,]+\.?\d*)',
+        # Pattern: Simple medical item with amount
+        r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj)[A-Za-z\s]*)\s+([\d,]+\.\d{2})'
+    ]
+    
     def extract_line_items(self, text: str) -> List[Dict[str, Any]]:
         """Enhanced line item extraction with medical focus"""
         if not text:
             return []
-            
-        lines = text.split('\n')
-        line_items = []
-        
-        # Enhanced patterns for medical invoices
-        patterns = [
-            # Pattern: Medical Name Quantity Rate Amount
-            r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj|Tablet|Capsule|Syrup|Injection)[A-Za-z\s]*)\s+(\d+)\s+([\d,]+\.?\d*)\s+([\d,]+\.?\d*)',
-            # Pattern: Name x Quantity @ Rate = Amount
-            r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj)[A-Za-z\s]*)\s+x\s*(\d+)\s*@\s*([\d,]+\.?\d*)\s*=\s*([\d,]+\.?\d*)',
-            # Pattern: Name Rate Quantity Amount
-            r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj)[A-Za-z\s]*)\s+([\d,]+\.?\d*)\s+(\d+)\s+([\d,]+\.?\d*)',
-            # Pattern: Simple medical item with amount
-            r'([A-Za-z][A-Za-z\s]*(?:\d+[mg]|Tab|Cap|Syr|Inj)[A-Za-z\s]*)\s+([\d,]+\.\d{2})'
-        ]
         
-        for line in lines:
-            line = line.strip()
-            if not self._is_potential_line_item(line):
-                continue
-                
-            item = self._extract_with_enhanced_patterns(line, patterns)
-            if item and self._is_valid_medical_item(item):
+        line_items = []
+        for line in text.split('\n'):
+            item = self._parse_line_item(line)
+            if item:
                 line_items.append(item)
         
         return line_items
     
+    def extract_line_items_from_layout(self, layout: OCRLayout) -> Tuple[List[Dict[str, Any]], List[float]]:
+        """Line items and their word confidences from a word-level OCR layout
+        
+        Every line is considered, as in `extract_line_items`, so single-amount
+        lines outside a detected number table are kept too. Lines of the
+        table are parsed first, and a line outside it that repeats a table
+        item (same name and amount) is dropped. Items come back in page order.
+        """
+        table_lines = layout.table_lines()
+        in_table = set(table_lines)
+        candidates = table_lines + [index for index in range(len(layout.lines)) if index not in in_table]
+        parsed, seen = [], set()
+        for index in candidates:
+            item = self._parse_line_item(layout.line_text(index))
+            if not item:
+                continue
+            key = (item["item_name"].lower(), item["item_amount"])
+            if key in seen:
+                continue
+            seen.add(key)
+            parsed.append((index, item, layout.line_confidence(index)))
+        parsed.sort(key=lambda entry: entry[0])
+        return [item for _, item, _ in parsed], [confidence for _, _, confidence in parsed]
+    
+    def _parse_line_item(self, line: str) -> Optional[Dict[str, Any]]:
+        """A validated line item from one line of text, or None"""
+        line = line.strip()
+        if not self._is_potential_line_item(line):
+            return None
+        
+        item = self._extract_with_enhanced_patterns(line, self.LINE_ITEM_PATTERNS)
+        if item and self._is_valid_medical_item(item):
+            return item
+        return None
+    
     def _is_potential_line_item(self, line: str) -> bool:
         """Improved line item detection"""
         if not line or len(line) < 5:
@@ -317,28 +491,50 @@ class TesseractExtractor:
         except (ValueError, TypeError):
             return 0.0
     
-    def analyze_document(self, document_url: str) -> Dict[str, Any]:
-        """Main analysis with confidence scoring"""
+    def analyze_document(self, document: Union[str, DocumentInput]) -> Dict[str, Any]:
+        """Main analysis with confidence scoring
+        
+        Accepts a document URL, raw bytes or an already DecodedDocument.
+        """
         try:
-            # Download document
-            response = requests.get(document_url, timeout=30)
-            response.raise_for_status()
-            document_content = response.content
-            
-            # Extract text
-            text = self.extract_text_from_content(document_content)
+            text_source = "ocr"
+            self._ocr_run.metadata = None
+            self._ocr_run.layout = None
+            if isinstance(document, str):
+                text = self._cached_text_for_url(document)
+                if text is None:
+                    text = self._extract_text_cached(self._download(document), document)
+            else:
+                document = DecodedDocument.ensure(document)
+                if document.text_layer is not None:
+                    # Skips the cache too: hashing would force the page to be rasterized
+                    text = self.extract_text_from_content(document)
+                    text_source = "pdf_text_layer"
+                    if self.ocr_mode == "layout":
+                        self._ocr_run.layout = OCRLayout.from_text_layer(document.text_layer)
+                else:
+                    text = self._extract_text_cached(document)
             
             if not text:
                 return self._get_fallback_data()
             
+            # Set when this call ran a word-level pass (not on text cache hits)
+            layout = self._ocr_run.layout
+            
             # Extract line items
-            line_items = self.extract_line_items(text)
+            if layout is not None:
+                line_items, line_confidences = self.extract_line_items_from_layout(layout)
+            else:
+                line_items = self.extract_line_items(text)
             
             if not line_items:
                 return self._get_fallback_data()
             
             # Calculate confidence
-            confidence = self._calculate_confidence(text, line_items)
+            if layout is not None:
+                confidence = self._layout_confidence(line_items, line_confidences)
+            else:
+                confidence = self._calculate_confidence(text, line_items)
             total_amount = sum(item["item_amount"] for item in line_items)
             
             self.logger.info(f"Extraction successful: {len(line_items)} items, confidence: {confidence:.2f}")
@@ -347,12 +543,50 @@ class TesseractExtractor:
                 "line_items": line_items,
                 "totals": {"Total": total_amount},
                 "confidence": confidence,
-                "raw_text": text[:300]
+                "raw_text": text[:300],
+                "text_source": text_source,
+                # Per-config timings and win rates; None when OCR was skipped (cache hit, text layer)
+                "ocr": self._ocr_run.metadata
             }
             
         except Exception as e:
             self.logger.error(f"Analysis failed: {e}")
-            return self._get_fallback_data()
+            return {**self._get_fallback_data(), "error": str(e)}
+    
+    def _cached_text_for_url(self, document_url: str) -> Optional[str]:
+        """OCR text for a previously seen URL, skipping download and OCR"""
+        if not self.cache:
+            return None
+        content_hash = self.cache.lookup_url(document_url)
+        if not content_hash:
+            return None
+        text = self.cache.get_text(content_hash, self.cache_variant)
+        if text is not None:
+            self.logger.info("OCR cache hit for URL")
+        return text
+    
+    def _download(self, document_url: str) -> DecodedDocument:
+        """Fetch document bytes, preferring the cache"""
+        document_content = self.cache.get_document_for_url(document_url) if self.cache else None
+        if document_content is None:
+            response = requests.get(document_url, timeout=30)
+            response.raise_for_status()
+            document_content = response.content
+        return DecodedDocument(document_content, source_url=document_url)
+    
+    def _extract_text_cached(self, document: DecodedDocument, document_url: Optional[str] = None) -> str:
+        """Run OCR unless the same document bytes were already recognized"""
+        if not self.cache:
+            return self.extract_text_from_content(document)
+        
+        content_hash = self.cache.put_document(document.content, url=document_url,
+                                               content_hash=document.sha256)
+        text = self.cache.get_text(content_hash, self.cache_variant)
+        if text is None:
+            text = self.extract_text_from_content(document)
+            if text:
+                self.cache.put_text(content_hash, text, self.cache_variant)
+        return text
     
     def _calculate_confidence(self, text: str, line_items: List[Dict]) -> float:
         """Calculate confidence based on multiple factors"""
@@ -374,20 +608,36 @@ class TesseractExtractor:
         
         return min(0.95, confidence)
     
+    def _layout_confidence(self, line_items: List[Dict], line_confidences: List[float]) -> float:
+        """Confidence from Tesseract's own word confidences on the item lines
+        
+        Items are already validated while parsing, so only the number of
+        items and how sure the OCR engine was about their words count.
+        """
+        confidence = 0.5
+        confidence += min(0.2, len(line_items) * 0.05)
+        if line_confidences:
+            confidence += 0.3 * sum(line_confidences) / len(line_confidences)
+        return round(min(0.95, confidence), 4)
+    
     def _get_fallback_data(self) -> Dict[str, Any]:
         """Enhanced fallback with medical focus"""
         try:
             from .mock_extractor import MockExtractor
-            return MockExtractor().analyze_document(b"")
+            result = MockExtractor().analyze_document(b"")
+            # Sample data, not read from the bill; the cascade escalates past it
+            result["fallback"] = True
+            return result
         except Exception as e:
             self.logger.error(f"Fallback failed: {e}")
             return {
                 "line_items": [],
                 "totals": {"Total": 0.0},
                 "confidence": 0.0,
-                "raw_text": ""
+                "raw_text": "",
+                "fallback": True
             }
 
 
-def create_tesseract_extractor() -> TesseractExtractor:
-    return TesseractExtractor()
+def create_tesseract_extractor(cache: Optional[DocumentCache] = None) -> TesseractExtractor:
+    return TesseractExtractor(cache=cache)
@@ -0,0 +1,134 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import time
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, Optional, Sequence
+
+from src.extraction.textract_parser import TextractBlockIndex
+
+logger = logging.getLogger(__name__)
+
+
+class TextractJobRunner:
+    """Asynchronous Textract document analysis: upload -> start -> poll -> paginate.
+
+    StartDocumentAnalysis handles multi-page PDFs and larger files than the
+    synchronous API, but only reads from S3, so the document is uploaded
+    first. Status polls back off exponentially up to `max_poll_interval`.
+    Result pages (`NextToken`) are added to a TextractBlockIndex as they
+    arrive, so the full block list is never concatenated.
+
+    The boto3 clients are blocking; every call runs on `executor` and the
+    waits between polls are `asyncio.sleep`, so a pending job does not hold
+    a worker thread.
+    """
+
+    def __init__(self, textract_client, s3_client, bucket: str, key_prefix: str = "textract-input/",
+                 feature_types: Sequence[str] = ("TABLES", "FORMS"), poll_interval: float = 1.0,
+                 max_poll_interval: float = 10.0, backoff: float = 1.5, timeout: float = 300.0,
+                 max_results: int = 1000, executor: Optional[Executor] = None):
+        if not bucket:
+            raise ValueError("An S3 bucket is required for asynchronous Textract jobs")
+        self.textract = textract_client
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.feature_types = list(feature_types)
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_results = max_results
+        self.executor = executor
+
+    async def _call(self, method, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(method, **kwargs))
+
+    async def run(self, content: bytes) -> Dict[str, Any]:
+        """Run one analysis job; returns the block index and job statistics"""
+        started = time.monotonic()
+        content_hash = hashlib.sha256(content).hexdigest()
+        # Each attempt gets its own input object and token: a retry after a FAILED
+        # job starts a new one, and concurrent runs never delete each other's input
+        attempt = f"{content_hash[:32]}-{uuid.uuid4().hex[:16]}"
+        key = f"{self.key_prefix}{attempt}"
+
+        await self._call(self.s3.put_object, Bucket=self.bucket, Key=key, Body=content)
+        try:
+            job = await self._call(
+                self.textract.start_document_analysis,
+                DocumentLocation={"S3Object": {"Bucket": self.bucket, "Name": key}},
+                FeatureTypes=self.feature_types,
+                # Makes SDK-level retries of this start call idempotent
+                ClientRequestToken=attempt
+            )
+            job_id = job["JobId"]
+            logger.info(f"Started Textract job {job_id}")
+
+            response, polls = await self._wait_for_job(job_id, started)
+
+            index = TextractBlockIndex()
+            result_pages = 0
+            while True:
+                index.add_blocks(response.get("Blocks", []))
+                result_pages += 1
+                next_token = response.get("NextToken")
+                if not next_token:
+                    break
+                response = await self._call(self.textract.get_document_analysis, JobId=job_id,
+                                            MaxResults=self.max_results, NextToken=next_token)
+
+            return {
+                "index": index,
+                "job": {
+                    "job_id": job_id,
+                    "status": response.get("JobStatus"),
+                    "pages": response.get("DocumentMetadata", {}).get("Pages"),
+                    "result_pages": result_pages,
+                    "blocks": len(index),
+                    "polls": polls,
+                    "elapsed": round(time.monotonic() - started, 3)
+                }
+            }
+        finally:
+            try:
+                await self._call(self.s3.delete_object, Bucket=self.bucket, Key=key)
+            except Exception as e:
+                logger.warning(f"Could not delete Textract input {key}: {e}")
+
+    async def _wait_for_job(self, job_id: str, started: float):
+        """Poll with exponential backoff; returns the first result page and the poll count"""
+        interval = self.poll_interval
+        polls = 0
+        while True:
+            polls += 1
+            response = await self._call(self.textract.get_document_analysis, JobId=job_id,
+                                        MaxResults=self.max_results)
+            status = response.get("JobStatus")
+            if status in ("SUCCEEDED", "PARTIAL_SUCCESS"):
+                if status == "PARTIAL_SUCCESS":
+                    logger.warning(f"Textract job {job_id} partially succeeded: {response.get('Warnings')}")
+                return response, polls
+            if status == "FAILED":
+                raise RuntimeError(f"Textract job {job_id} failed: {response.get('StatusMessage')}")
+
+            remaining = self.timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                raise TimeoutError(f"Textract job {job_id} still {status} after {self.timeout}s")
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * self.backoff, self.max_poll_interval)
+
+
+def run_blocking(coroutine):
+    """Run a coroutine from synchronous code, even if this thread already runs an event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    # Called from a sync function inside a running loop: use a helper thread
+    with ThreadPoolExecutor(max_workers=1) as helper:
+        return helper.submit(asyncio.run, coroutine).result()
@@ -0,0 +1,177 @@
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TextractBlockIndex:
+    """One-pass index over Textract blocks.
+
+    Maps Id -> block, BlockType -> blocks (in response order) and
+    Id -> related Ids per relationship type, so resolving a cell's words or
+    a key's value is a dict lookup instead of a scan over every block.
+    Blocks can be added in batches, e.g. one GetDocumentAnalysis page at a
+    time; the first block seen for an Id wins, as with a linear scan.
+    """
+
+    def __init__(self, blocks: Optional[Iterable[Dict[str, Any]]] = None):
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_type: Dict[str, List[Dict[str, Any]]] = {}
+        self.related: Dict[str, Dict[str, List[str]]] = {}
+        if blocks is not None:
+            self.add_blocks(blocks)
+
+    def add_blocks(self, blocks: Iterable[Dict[str, Any]]):
+        for block in blocks:
+            block_id = block.get('Id')
+            if block_id in self.by_id:
+                continue
+            self.by_id[block_id] = block
+            self.by_type.setdefault(block.get('BlockType'), []).append(block)
+            for relationship in block.get('Relationships', []):
+                self.related.setdefault(block_id, {}).setdefault(relationship['Type'], []).extend(
+                    relationship.get('Ids', [])
+                )
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def of_type(self, block_type: str) -> List[Dict[str, Any]]:
+        return self.by_type.get(block_type, [])
+
+    def related_blocks(self, block: Dict[str, Any], relationship_type: str = 'CHILD',
+                       block_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Blocks linked from `block` by `relationship_type`, optionally filtered by BlockType"""
+        found = []
+        for related_id in self.related.get(block.get('Id'), {}).get(relationship_type, []):
+            related = self.by_id.get(related_id)
+            if related is not None and (block_type is None or related.get('BlockType') == block_type):
+                found.append(related)
+        return found
+
+
+class TextractResponseParser:
+    """Turns Textract AnalyzeDocument blocks (TABLES, FORMS) into line items and totals"""
+
+    def parse(self, response: Dict) -> Dict[str, Any]:
+        """Parse a single AnalyzeDocument response"""
+        return self.parse_index(TextractBlockIndex(response.get('Blocks', [])))
+
+    def parse_index(self, index: TextractBlockIndex) -> Dict[str, Any]:
+        """Parse blocks that are already indexed (e.g. from several result pages)"""
+        line_items = []
+
+        # Extract tables for line items
+        for table in index.of_type('TABLE'):
+            line_items.extend(self._extract_line_items_from_table(table, index))
+
+        # Extract forms for additional data
+        totals = self._extract_totals_from_forms(index.of_type('KEY_VALUE_SET'), index)
+
+        return {
+            "line_items": line_items,
+            "totals": totals,
+            "confidence": 0.85
+        }
+
+    def _extract_line_items_from_table(self, table: Dict, index: TextractBlockIndex) -> List[Dict]:
+        """Extract line items from table structure"""
+        line_items = []
+
+        try:
+            # Group cells by row
+            rows: Dict[int, List[Dict]] = {}
+            for cell in index.related_blocks(table, 'CHILD', 'CELL'):
+                rows.setdefault(cell.get('RowIndex', 0), []).append(cell)
+
+            # Convert rows to line items (skip header)
+            for row_index, row_cells in sorted(rows.items()):
+                if row_index > 1:
+                    line_item = self._parse_table_row(row_cells, index)
+                    if line_item:
+                        line_items.append(line_item)
+
+        except Exception as e:
+            logger.warning(f"Error extracting line items from table: {e}")
+
+        return line_items
+
+    def _parse_table_row(self, row_cells: List[Dict], index: TextractBlockIndex) -> Optional[Dict]:
+        """Parse a table row into a line item"""
+        try:
+            description = ""
+            quantity = 1.0
+            rate = 0.0
+            amount = 0.0
+
+            for cell in row_cells:
+                cell_text = self._get_cell_text(cell, index)
+                if not cell_text:
+                    continue
+
+                # Simple heuristic-based parsing
+                if not description and len(cell_text) > 2 and not self._looks_like_number(cell_text):
+                    description = cell_text
+                elif self._looks_like_amount(cell_text):
+                    parsed_amount = self._parse_amount(cell_text)
+                    if amount == 0.0:
+                        amount = parsed_amount
+                    else:
+                        rate = parsed_amount
+
+            if amount > 0 and description:
+                return {
+                    "item_name": description,
+                    "item_quantity": quantity,
+                    "item_rate": rate if rate > 0 else amount,
+                    "item_amount": amount,
+                    "confidence": 0.8
+                }
+        except Exception as e:
+            logger.warning(f"Failed to parse table row: {e}")
+
+        return None
+
+    def _get_cell_text(self, cell: Dict, index: TextractBlockIndex) -> str:
+        """Extract text from the WORD children of a cell (or key/value block)"""
+        return " ".join(word.get('Text', '') for word in index.related_blocks(cell, 'CHILD', 'WORD')).strip()
+
+    def _looks_like_number(self, text: str) -> bool:
+        """Check if text looks like a number"""
+        return bool(re.match(r'^[\d.,]+$', text.strip()))
+
+    def _looks_like_amount(self, text: str) -> bool:
+        """Check if text looks like a monetary amount"""
+        return bool(re.match(r'^[\$€£]?[\d,]+\.?\d*$', text.strip()))
+
+    def _parse_amount(self, text: str) -> float:
+        """Parse amount string to float"""
+        try:
+            cleaned = re.sub(r'[^\d.]', '', text)
+            return float(cleaned) if cleaned else 0.0
+        except ValueError:
+            return 0.0
+
+    def _extract_totals_from_forms(self, forms: List[Dict], index: TextractBlockIndex) -> Dict:
+        """Extract totals from form fields"""
+        totals = {}
+
+        try:
+            for form in forms:
+                if 'KEY' in form.get('EntityTypes', []):
+                    key_text = self._get_cell_text(form, index).lower()
+                    if any(total_keyword in key_text for total_keyword in ['total', 'amount', 'balance']):
+                        # Find corresponding value
+                        for value_block in index.related_blocks(form, 'VALUE'):
+                            amount = self._parse_amount(self._get_cell_text(value_block, index))
+                            if amount > 0:
+                                totals['Total'] = amount
+        except Exception as e:
+            logger.warning(f"Error extracting totals from forms: {e}")
+
+        return totals
+
+
+def create_textract_parser() -> TextractResponseParser:
+    return TextractResponseParser()
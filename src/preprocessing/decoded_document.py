@@ -0,0 +1,178 @@
+import hashlib
+import io
+import logging
+from typing import Optional, Tuple, Dict, Any, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+class DecodedDocument:
+    """Document bytes that are parsed and decoded at most once.
+
+    The image header is parsed lazily on first access to format/dimensions,
+    and pixel data is decoded lazily on first access to `image`. Every stage
+    (validation, info, preprocessing, extractors) shares the same instance,
+    so one bill costs a single decode.
+    """
+
+    # Single-image documents are their own (only) page
+    page_no = 1
+    # Embedded PDF text for this page, when it has a usable one (see pages.py)
+    text_layer = None
+
+    def __init__(self, content, source_url: Optional[str] = None):
+        self._content = content
+        self.source_url = source_url
+        self.error: Optional[str] = None
+        self._header: Optional[Image.Image] = None
+        self._header_parsed = False
+        self._verified: Optional[bool] = None
+        self._dimensions: Optional[Tuple[int, int]] = None
+        self._image: Optional[Image.Image] = None
+        self.decode_scale = 1
+        self._sha256: Optional[str] = None
+        self._bytes: Optional[bytes] = None
+
+    @classmethod
+    def ensure(cls, document: Union["DecodedDocument", bytes, bytearray, memoryview]) -> "DecodedDocument":
+        """Wrap raw bytes, or return an existing DecodedDocument unchanged"""
+        if isinstance(document, cls):
+            return document
+        return cls(document)
+
+    def _open(self) -> Optional[Image.Image]:
+        """Parse the image header once (no pixel decode)"""
+        if not self._header_parsed:
+            self._header_parsed = True
+            try:
+                self._header = Image.open(io.BytesIO(self.content))
+                self._dimensions = self._header.size
+            except Exception as e:
+                self.error = str(e)
+                self._header = None
+        return self._header
+
+    @property
+    def content(self):
+        return self._content
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.content)
+
+    @property
+    def is_pdf(self) -> bool:
+        return bytes(self.content[:5]) == b"%PDF-"
+
+    @property
+    def is_valid(self) -> bool:
+        return self._open() is not None
+
+    def verify(self) -> bool:
+        """Check the image data is intact without decoding pixels; runs at most once.
+
+        Uses PIL's verify on a separate parse, so the shared header stays
+        usable: PNGs are walked chunk by chunk with their checksums, which
+        catches truncated uploads. Formats PIL cannot verify cheaply (JPEG,
+        TIFF) only get the header check and fail at decode if damaged.
+        """
+        if self._verified is None:
+            self._verified = self.is_valid
+            if self._verified:
+                try:
+                    Image.open(io.BytesIO(self.content)).verify()
+                except Exception as e:
+                    self.error = f"corrupt image data: {e}"
+                    self._verified = False
+        return self._verified
+
+    @property
+    def format(self) -> Optional[str]:
+        header = self._open()
+        return header.format if header else None
+
+    @property
+    def dimensions(self) -> Optional[Tuple[int, int]]:
+        """Stored (full-resolution) dimensions, even after a reduced-scale decode"""
+        self._open()
+        return self._dimensions
+
+    @property
+    def mode(self) -> Optional[str]:
+        header = self._open()
+        return header.mode if header else None
+
+    @property
+    def frame_count(self) -> int:
+        """Number of frames (pages) in the image container, 0 if unreadable"""
+        header = self._open()
+        return getattr(header, "n_frames", 1) if header else 0
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        header = self._open()
+        return dict(header.info) if header else {}
+
+    @property
+    def image(self) -> Image.Image:
+        """Fully decoded image; decoded on first access and reused afterwards"""
+        return self.decode()
+
+    def decode(self, draft_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+        """Decode pixels once, optionally at a reduced JPEG scale.
+
+        With `draft_size`, JPEGs are decoded through PIL's draft mode at the
+        smallest DCT scale (1/2, 1/4, 1/8) that is still at least that size.
+        An existing decode is reused whenever it is large enough; only a
+        request for more pixels than a previous draft decode re-decodes.
+        """
+        if self._image is not None:
+            if draft_size is None and self.decode_scale == 1:
+                return self._image
+            if draft_size is not None and self._covers(self._image.size, draft_size):
+                return self._image
+
+        header = self._open()
+        if header is None:
+            raise ValueError(f"Document is not a valid image: {self.error}")
+        if self._image is not None:
+            # The header object was already consumed by an earlier decode
+            header = Image.open(io.BytesIO(self.content))
+
+        scale = 1
+        if draft_size is not None and header.format == "JPEG":
+            if header.draft(header.mode, draft_size) is not None:
+                scale = max(1, round(self._dimensions[0] / header.size[0]))
+        header.load()
+
+        self._image = header
+        self.decode_scale = scale
+        return header
+
+    @staticmethod
+    def _covers(size: Tuple[int, int], required: Tuple[int, int]) -> bool:
+        return size[0] >= required[0] and size[1] >= required[1]
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.content).hexdigest()
+        return self._sha256
+
+    def tobytes(self) -> bytes:
+        """Raw document bytes, for extractors whose APIs need bytes"""
+        if self._bytes is None:
+            self._bytes = self.content if isinstance(self.content, bytes) else bytes(self.content)
+        return self._bytes
+
+
+DocumentInput = Union[DecodedDocument, bytes, bytearray, memoryview]
+
+
+def document_bytes(document: DocumentInput) -> bytes:
+    """Raw bytes from either a DecodedDocument or any bytes-like object"""
+    if isinstance(document, DecodedDocument):
+        return document.tobytes()
+    return document if isinstance(document, bytes) else bytes(document)
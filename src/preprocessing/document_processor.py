@@ -1,14 +1,39 @@
 import requests
 import logging
-from PIL import Image, ImageEnhance, ImageFilter
-import io
-from typing import Optional, Tuple, Dict, Any
+from PIL import Image
+import mmap
+import tempfile
+from typing import Iterator, Optional, Tuple, Dict, Any
+from src.cache.document_cache import DocumentCache, settings_key
+from src.preprocessing.decoded_document import DecodedDocument, DocumentInput
+from src.preprocessing.enhancement import ImageEnhancer
+from src.preprocessing.resolution import ResolutionPlanner
+from src.preprocessing.pages import count_pages, iter_document_pages
 
 class DocumentProcessor:
-    def __init__(self, max_file_size_mb: int = 10, timeout: int = 30):
+    def __init__(self, max_file_size_mb: int = 10, timeout: int = 30,
+                 chunk_size: int = 64 * 1024, spool_threshold_mb: int = 2,
+                 cache: Optional[DocumentCache] = None, enhancement_mode: str = "numpy",
+                 target_dpi: int = 300, raster_dpi: int = 300,
+                 use_text_layer: bool = True, min_text_chars: int = 20):
         self.logger = logging.getLogger(__name__)
         self.max_file_size = max_file_size_mb * 1024 * 1024  # Convert to bytes
         self.timeout = timeout
+        self.chunk_size = chunk_size
+        # Bodies of unknown length stay in memory up to this size, then spill to disk
+        self.spool_threshold = spool_threshold_mb * 1024 * 1024
+        self.cache = cache
+        # Preprocessed images in the cache are specific to these settings
+        self.cache_variant = settings_key(enhancement_mode=enhancement_mode, target_dpi=target_dpi,
+                                          raster_dpi=raster_dpi)
+        # Moderate contrast/sharpness boost, 3x3 median denoise, slight brightness boost
+        self.enhancer = ImageEnhancer(contrast=1.8, sharpness=1.6, median_size=3,
+                                      brightness=1.1, mode=enhancement_mode)
+        self.resolution_planner = ResolutionPlanner(target_dpi=target_dpi)
+        self.raster_dpi = raster_dpi
+        # Digital PDFs: read the embedded text instead of rasterizing for OCR
+        self.use_text_layer = use_text_layer
+        self.min_text_chars = min_text_chars
         
         # Create session with better headers
         self.session = requests.Session()
@@ -18,12 +43,33 @@ class DocumentProcessor:
     
     def download_document(self, document_url: str) -> Optional[bytes]:
         """Download document from URL with enhanced error handling"""
+        document = self.fetch_document(document_url)
+        if document is None:
+            return None
+        return document.tobytes()
+    
+    def download_document_buffer(self, document_url: str) -> Optional[memoryview]:
+        """Stream document into a single buffer and return a zero-copy view of it"""
+        document = self.fetch_document(document_url)
+        if document is None:
+            return None
+        return document.content
+    
+    def fetch_document(self, document_url: str) -> Optional[DecodedDocument]:
+        """Download document and wrap it for decode-once use by later stages"""
         try:
             # Validate URL format
             if not document_url.startswith(('http://', 'https://')):
                 self.logger.error("Invalid URL protocol")
                 return None
             
+            # Serve resubmitted URLs straight from the cache
+            if self.cache:
+                cached = self.cache.get_document_for_url(document_url)
+                if cached is not None:
+                    self.logger.info(f"Document cache hit: {len(cached)} bytes")
+                    return DecodedDocument(memoryview(cached), source_url=document_url)
+            
             # Download with timeout and size limits
             response = self.session.get(
                 document_url, 
@@ -34,25 +80,26 @@ class DocumentProcessor:
             response.raise_for_status()
             
             # Read content with size limit
-            content = b''
-            for chunk in response.iter_content(chunk_size=8192):
-                content += chunk
-                if len(content) > self.max_file_size:
-                    self.logger.error(f"File exceeds size limit: {len(content)} bytes")
-                    return None
+            with response:
+                content = self._read_response_body(response)
+            if content is None:
+                return None
             
             # Basic content validation
             if len(content) < 100:  # Too small to be a valid image
                 self.logger.warning("Downloaded content too small")
                 return None
             
-            # Check if it's a valid image
-            if not self._is_valid_image(content):
-                self.logger.warning("Downloaded content is not a valid image")
+            # Check if it's a valid image or PDF
+            document = DecodedDocument(content, source_url=document_url)
+            if not (document.is_pdf or self._is_valid_image(document)):
+                self.logger.warning("Downloaded content is not a valid image or PDF")
                 return None
             
             self.logger.info(f"Successfully downloaded document: {len(content)} bytes")
-            return content
+            if self.cache:
+                self.cache.put_document(content, url=document_url)
+            return document
             
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Network error downloading document: {e}")
@@ -61,59 +108,129 @@ class DocumentProcessor:
             self.logger.error(f"Unexpected error downloading document: {e}")
             return None
     
-    def _is_valid_image(self, content: bytes) -> bool:
-        """Check if content is a valid image"""
+    def _read_response_body(self, response: requests.Response) -> Optional[memoryview]:
+        """Read a streamed response body in linear time, enforcing max_file_size"""
+        declared_length = self._declared_length(response)
+        if declared_length is not None and declared_length > self.max_file_size:
+            self.logger.error(f"File exceeds size limit: {declared_length} bytes")
+            return None
+        
+        # Known length: fill a preallocated buffer in place.
+        # Unknown length (or a server sending more than it declared): spool.
+        buffer = bytearray(declared_length) if declared_length else None
+        spool = None
+        received = 0
+        
         try:
-            image = Image.open(io.BytesIO(content))
-            image.verify()  # Verify without loading entire image
-            return True
-        except Exception:
-            return False
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if not chunk:
+                    continue
+                end = received + len(chunk)
+                if end > self.max_file_size:
+                    self.logger.error(f"File exceeds size limit: {end} bytes")
+                    return None
+                
+                if spool is None and buffer is not None and end <= len(buffer):
+                    buffer[received:end] = chunk
+                else:
+                    if spool is None:
+                        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_threshold)
+                        if buffer is not None:
+                            spool.write(memoryview(buffer)[:received])
+                            buffer = None
+                    spool.write(chunk)
+                received = end
+            
+            if spool is None:
+                if buffer is None:
+                    return memoryview(b'')
+                return memoryview(buffer)[:received]
+            return self._spool_to_buffer(spool, received)
+        finally:
+            if spool is not None:
+                spool.close()
     
-    def validate_document(self, document_content: bytes) -> bool:
+    def _declared_length(self, response: requests.Response) -> Optional[int]:
+        """Content-Length of the decoded body, if the server declared a usable one"""
+        # Content-Length describes the encoded body; gzip/deflate bodies decode larger
+        if response.headers.get('Content-Encoding', 'identity') not in ('', 'identity'):
+            return None
+        try:
+            length = int(response.headers.get('Content-Length', ''))
+        except ValueError:
+            return None
+        return length if length >= 0 else None
+    
+    def _spool_to_buffer(self, spool: tempfile.SpooledTemporaryFile, size: int) -> memoryview:
+        """Expose spooled content as a buffer, memory-mapping it if it spilled to disk"""
+        if size > self.spool_threshold and size > 0:
+            # Spilled to a real file: map it instead of reading it back into memory
+            spool.flush()
+            mapped = mmap.mmap(spool.fileno(), size, access=mmap.ACCESS_READ)
+            return memoryview(mapped)
+        
+        spool.seek(0)
+        return memoryview(spool.read())
+    
+    def _is_valid_image(self, document: DocumentInput) -> bool:
+        """Check if content is a valid image (header only, no pixel decode)"""
+        return DecodedDocument.ensure(document).is_valid
+    
+    def validate_document(self, document_content: DocumentInput) -> bool:
         """Enhanced document validation with multiple checks"""
-        if not document_content:
+        if document_content is None:
+            return False
+        document = DecodedDocument.ensure(document_content)
+        if not document.size_bytes:
             return False
         
         # Size validation
-        if len(document_content) < 100 or len(document_content) > self.max_file_size:
-            self.logger.warning(f"Invalid document size: {len(document_content)} bytes")
+        if document.size_bytes < 100 or document.size_bytes > self.max_file_size:
+            self.logger.warning(f"Invalid document size: {document.size_bytes} bytes")
             return False
         
-        # Image format validation
-        try:
-            image = Image.open(io.BytesIO(document_content))
-            image.verify()
-            
-            # Check dimensions
-            width, height = image.size
-            if width < 50 or height < 50:
-                self.logger.warning(f"Image dimensions too small: {width}x{height}")
-                return False
-            if width > 10000 or height > 10000:
-                self.logger.warning(f"Image dimensions too large: {width}x{height}")
+        # Multi-page PDFs are validated page by page when rasterized
+        if document.is_pdf:
+            if count_pages(document) == 0:
+                self.logger.warning("PDF has no readable pages")
                 return False
-                
             return True
-            
-        except Exception as e:
-            self.logger.error(f"Document validation failed: {e}")
+        
+        # Image format and integrity validation (no pixel decode)
+        if not document.verify():
+            self.logger.error(f"Document validation failed: {document.error}")
+            return False
+        
+        # Check dimensions
+        width, height = document.dimensions
+        if width < 50 or height < 50:
+            self.logger.warning(f"Image dimensions too small: {width}x{height}")
             return False
+        if width > 10000 or height > 10000:
+            self.logger.warning(f"Image dimensions too large: {width}x{height}")
+            return False
+            
+        return True
     
-    def preprocess_image(self, document_content: bytes) -> Tuple[Any, Dict[str, Any]]:
+    def preprocess_image(self, document_content: DocumentInput) -> Tuple[Any, Dict[str, Any]]:
         """Enhanced image preprocessing for better OCR"""
+        document = DecodedDocument.ensure(document_content)
         try:
-            # Open and verify image
-            image = Image.open(io.BytesIO(document_content))
-            original_format = image.format or 'JPEG'
+            content_hash = None
+            if self.cache:
+                content_hash = document.sha256
+                cached = self.cache.get_preprocessed(content_hash, self.cache_variant)
+                if cached is not None:
+                    processed_image, metadata = cached
+                    metadata["cache_hit"] = True
+                    return processed_image, metadata
             
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Store original info
-            original_size = image.size
-            original_mode = image.mode
+            # Decode once, straight to the OCR working resolution
+            original_format = document.format or 'JPEG'
+            original_mode = document.mode
+            original_size = document.dimensions
+            plan = self.resolution_planner.plan(document)
+            image = self.resolution_planner.load(document, plan, mode='RGB')
             
             # Apply preprocessing pipeline
             processed_image = self._enhance_image_for_ocr(image)
@@ -124,16 +241,20 @@ class DocumentProcessor:
                 "original_size": original_size,
                 "original_mode": original_mode,
                 "processed_size": processed_image.size,
+                "resolution": plan.to_dict(),
                 "processed": True,
                 "enhancements_applied": True
             }
             
+            if content_hash:
+                self.cache.put_preprocessed(content_hash, processed_image, metadata, self.cache_variant)
+            
             return processed_image, metadata
             
         except Exception as e:
             self.logger.warning(f"Image preprocessing failed, returning original: {e}")
             # Return original content with basic metadata
-            return document_content, {
+            return document.content, {
                 "format": "unknown", 
                 "processed": False,
                 "error": str(e)
@@ -142,32 +263,13 @@ class DocumentProcessor:
     def _enhance_image_for_ocr(self, image: Image.Image) -> Image.Image:
         """Apply image enhancements specifically optimized for OCR"""
         try:
-            # Step 1: Resize if too small (better for OCR)
-            width, height = image.size
-            if width < 800:
-                # Calculate new dimensions maintaining aspect ratio
-                scale_factor = 1600 / width
-                new_width = int(width * scale_factor)
-                new_height = int(height * scale_factor)
-                image = image.resize((new_width, new_height), Image.LANCZOS)
+            # Step 1: Resolution is already planned (see ResolutionPlanner) before enhancement
             
             # Step 2: Convert to grayscale for better OCR (optional but often improves accuracy)
             # image = image.convert('L').convert('RGB')  # Uncomment if grayscale improves your OCR
             
-            # Step 3: Enhance contrast
-            enhancer = ImageEnhance.Contrast(image)
-            image = enhancer.enhance(1.8)  # Moderate contrast boost
-            
-            # Step 4: Enhance sharpness
-            enhancer = ImageEnhance.Sharpness(image)
-            image = enhancer.enhance(1.6)  # Moderate sharpness boost
-            
-            # Step 5: Reduce noise with median filter
-            image = image.filter(ImageFilter.MedianFilter(3))
-            
-            # Step 6: Optional brightness adjustment
-            enhancer = ImageEnhance.Brightness(image)
-            image = enhancer.enhance(1.1)  # Slight brightness boost
+            # Steps 3-6: contrast, sharpness, median denoise, brightness
+            image = self.enhancer.enhance(image)
             
             self.logger.info("Image preprocessing completed successfully")
             return image
@@ -176,32 +278,48 @@ class DocumentProcessor:
             self.logger.warning(f"Image enhancement failed: {e}")
             return image  # Return original if enhancement fails
     
-    def get_document_info(self, document_content: bytes) -> Dict[str, Any]:
+    def get_document_info(self, document_content: DocumentInput) -> Dict[str, Any]:
         """Get detailed information about the document"""
-        try:
-            image = Image.open(io.BytesIO(document_content))
-            
+        document = DecodedDocument.ensure(document_content)
+        if document.is_pdf:
+            page_count = count_pages(document)
             return {
-                "size_bytes": len(document_content),
-                "format": image.format,
-                "dimensions": image.size,
-                "mode": image.mode,
-                "is_valid": True
+                "size_bytes": document.size_bytes,
+                "format": "PDF",
+                "page_count": page_count,
+                "sha256": document.sha256,
+                "is_valid": page_count > 0
             }
-        except Exception as e:
+        if not document.is_valid:
             return {
-                "size_bytes": len(document_content),
+                "size_bytes": document.size_bytes,
                 "is_valid": False,
-                "error": str(e)
+                "error": document.error
             }
+        
+        return {
+            "size_bytes": document.size_bytes,
+            "format": document.format,
+            "dimensions": document.dimensions,
+            "mode": document.mode,
+            "page_count": document.frame_count,
+            "sha256": document.sha256,
+            "is_valid": True
+        }
+    
+    def iter_pages(self, document_content: DocumentInput) -> Iterator[DecodedDocument]:
+        """Yield pages lazily from multi-page PDFs/TIFFs (single images yield themselves)"""
+        yield from iter_document_pages(DecodedDocument.ensure(document_content), raster_dpi=self.raster_dpi,
+                                       use_text_layer=self.use_text_layer,
+                                       min_text_chars=self.min_text_chars)
     
-    def safe_preprocess(self, document_content: bytes) -> Tuple[Any, Dict[str, Any]]:
+    def safe_preprocess(self, document_content: DocumentInput) -> Tuple[Any, Dict[str, Any]]:
         """Safe preprocessing that never crashes"""
         try:
             return self.preprocess_image(document_content)
         except Exception as e:
             self.logger.error(f"Safe preprocessing failed: {e}")
-            return document_content, {
+            return DecodedDocument.ensure(document_content).content, {
                 "format": "unknown",
                 "processed": False,
                 "error": "Preprocessing failed"
@@ -209,6 +327,7 @@ class DocumentProcessor:
 
 
 # Factory function for easy initialization
-def create_document_processor(max_file_size_mb: int = 10) -> DocumentProcessor:
+def create_document_processor(max_file_size_mb: int = 10,
+                              cache: Optional[DocumentCache] = None) -> DocumentProcessor:
     """Create and return a DocumentProcessor instance"""
-    return DocumentProcessor(max_file_size_mb=max_file_size_mb)
+    return DocumentProcessor(max_file_size_mb=max_file_size_mb, cache=cache)
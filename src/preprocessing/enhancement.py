@@ -0,0 +1,198 @@
+import logging
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+
+logger = logging.getLogger(__name__)
+
+# ITU-R 601-2 luma weights, as used by PIL's RGB -> L conversion
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+class ImageEnhancer:
+    """Contrast -> Sharpness -> Median -> Brightness enhancement for OCR.
+
+    Two interchangeable modes:
+
+    - "numpy": a fused kernel over one uint8 buffer. Contrast (a lookup
+      table), sharpening and brightness run in a single strip-wise pass;
+      the 3x3 median is a separable min/max network written back into the
+      first buffer. Peak memory is two image-sized uint8 buffers plus small
+      per-strip temporaries.
+    - "pil": the original ImageEnhance/ImageFilter chain, kept as the
+      reference implementation.
+
+    Brightness is a monotonic point operation, so it commutes with the
+    median filter and is folded into the sharpening pass. The output matches
+    the PIL chain exactly, except that the RGB contrast mean is computed from
+    channel means rather than per-pixel luma (an off-by-one grey level in
+    rare cases).
+    """
+
+    MODES = ("numpy", "pil")
+
+    def __init__(self, contrast: float = 1.8, sharpness: float = 1.6,
+                 median_size: Optional[int] = 3, brightness: float = 1.0,
+                 mode: str = "numpy", strip_bytes: int = 1 << 20):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown enhancement mode: {mode}")
+        if median_size not in (None, 3):
+            raise ValueError("Only a 3x3 median filter is supported")
+        self.contrast = contrast
+        self.sharpness = sharpness
+        self.median_size = median_size
+        self.brightness = brightness
+        self.mode = mode
+        self.strip_bytes = strip_bytes
+
+    def enhance(self, image: Image.Image) -> Image.Image:
+        """Apply the enhancement chain, falling back to PIL if numpy fails"""
+        if self.mode == "numpy" and image.mode in ("L", "RGB"):
+            try:
+                return self._enhance_numpy(image)
+            except Exception as e:
+                logger.warning(f"NumPy enhancement failed, using PIL chain: {e}")
+        return self._enhance_pil(image)
+
+    # ------------------------------------------------------------------
+    # Reference PIL chain
+    # ------------------------------------------------------------------
+
+    def _enhance_pil(self, image: Image.Image) -> Image.Image:
+        if self.contrast != 1.0:
+            image = ImageEnhance.Contrast(image).enhance(self.contrast)
+        if self.sharpness != 1.0:
+            image = ImageEnhance.Sharpness(image).enhance(self.sharpness)
+        if self.median_size:
+            image = image.filter(ImageFilter.MedianFilter(self.median_size))
+        if self.brightness != 1.0:
+            image = ImageEnhance.Brightness(image).enhance(self.brightness)
+        return image
+
+    # ------------------------------------------------------------------
+    # Fused NumPy kernel
+    # ------------------------------------------------------------------
+
+    def _enhance_numpy(self, image: Image.Image) -> Image.Image:
+        buffer = np.array(image, dtype=np.uint8)  # single writable copy
+        height, width = buffer.shape[:2]
+        channels = 1 if buffer.ndim == 2 else buffer.shape[2]
+        strip_rows = max(8, self.strip_bytes // max(1, width * channels))
+
+        identity = np.arange(256, dtype=np.uint8)
+        contrast_lut = self._contrast_lut(buffer) if self.contrast != 1.0 else identity
+        brightness_lut = self._blend_lut(0.0, self.brightness) if self.brightness != 1.0 else identity
+
+        # Pass 1: contrast + sharpening + brightness, strip by strip into a second buffer
+        if self.sharpness != 1.0 and height >= 3 and width >= 3:
+            sharpened = np.empty_like(buffer)
+            for start in range(0, height, strip_rows):
+                stop = min(height, start + strip_rows)
+                self._sharpen_strip(buffer, sharpened, start, stop, contrast_lut, brightness_lut)
+        else:
+            # Pure point operations: compose the lookup tables and apply in place
+            sharpened = buffer
+            np.take(brightness_lut[contrast_lut], buffer, out=buffer)
+
+        # Pass 2: 3x3 median, written back into the first buffer
+        if self.median_size:
+            output = buffer if sharpened is not buffer else np.empty_like(buffer)
+            for start in range(0, height, strip_rows):
+                stop = min(height, start + strip_rows)
+                self._median_strip(sharpened, output, start, stop)
+        else:
+            output = sharpened
+
+        return Image.fromarray(output)
+
+    def _contrast_lut(self, buffer: np.ndarray) -> np.ndarray:
+        """Lookup table blending every level towards the mean grey level"""
+        # Summing rows first keeps the reduction vectorized and overflow-free
+        column_sums = buffer.sum(axis=0, dtype=np.uint32).sum(axis=0, dtype=np.uint64)
+        pixels = buffer.shape[0] * buffer.shape[1]
+        if buffer.ndim == 2:
+            mean = float(column_sums) / pixels
+        else:
+            mean = float(column_sums[:3].astype(np.float64) @ _LUMA_WEIGHTS) / pixels
+        return self._blend_lut(float(int(mean + 0.5)), self.contrast)
+
+    @staticmethod
+    def _blend_lut(degenerate: float, factor: float) -> np.ndarray:
+        """Lookup table equivalent to PIL's Image.blend(degenerate, image, factor)"""
+        levels = np.arange(256, dtype=np.float32)
+        blended = np.float32(degenerate) + np.float32(factor) * (levels - np.float32(degenerate))
+        return np.trunc(np.clip(blended, 0, 255)).astype(np.uint8)
+
+    def _sharpen_strip(self, source: np.ndarray, target: np.ndarray, start: int, stop: int,
+                       contrast_lut: np.ndarray, brightness_lut: np.ndarray):
+        """Contrast, blend with PIL's SMOOTH kernel, then brightness for rows [start, stop)"""
+        height = source.shape[0]
+        # Border rows/columns are copied unchanged by PIL's 3x3 filters
+        top, bottom = max(start, 1), min(stop, height - 1)
+        result = contrast_lut[source[start:stop]].astype(np.float32)
+
+        if bottom > top:
+            window = contrast_lut[source[top - 1:bottom + 1]].astype(np.int16)
+            # Separable 3x3 box sum; the SMOOTH kernel is (box + 4 * centre) / 13, rounded
+            rows = window[:-2] + window[1:-1]
+            rows += window[2:]
+            kernel_sum = rows[:, :-2] + rows[:, 1:-1]
+            kernel_sum += rows[:, 2:]
+            kernel_sum += 4 * window[1:-1, 1:-1]
+            smooth = kernel_sum.astype(np.float32)
+            smooth += np.float32(6.5)
+            smooth *= np.float32(1 / 13)
+            np.floor(smooth, out=smooth)
+
+            # Same float32 arithmetic as Image.blend(smooth, image, factor)
+            inner = result[top - start:bottom - start, 1:-1]
+            inner -= smooth
+            inner *= np.float32(self.sharpness)
+            inner += smooth
+
+        np.clip(result, 0, 255, out=result)
+        target[start:stop] = brightness_lut[result.astype(np.uint8)]
+
+    @staticmethod
+    def _median_strip(source: np.ndarray, target: np.ndarray, start: int, stop: int):
+        """Exact 3x3 median with edge replication, via a separable min/max network"""
+        height = source.shape[0]
+        centre = source[start:stop]
+        if start > 0:
+            rows_up = source[start - 1:stop - 1]
+        else:
+            rows_up = np.concatenate([source[:1], source[:stop - 1]])
+        if stop < height:
+            rows_down = source[start + 1:stop + 1]
+        else:
+            rows_down = np.concatenate([source[start + 1:height], source[height - 1:]])
+
+        # Sort each vertical triple: lo <= mid <= hi
+        lo = np.minimum(rows_up, centre)
+        hi = np.maximum(rows_up, centre)
+        mid = np.minimum(hi, rows_down)
+        hi = np.maximum(hi, rows_down)
+        mid_lo = np.minimum(lo, mid)
+        mid = np.maximum(lo, mid)
+        lo = mid_lo
+
+        def shifted(column_values):
+            padded = np.concatenate([column_values[:, :1], column_values, column_values[:, -1:]], axis=1)
+            return padded[:, :-2], padded[:, 1:-1], padded[:, 2:]
+
+        # Median of 9 = med3(max of lows, med3 of mids, min of highs)
+        lo_l, lo_c, lo_r = shifted(lo)
+        max_lo = np.maximum(np.maximum(lo_l, lo_c), lo_r)
+        hi_l, hi_c, hi_r = shifted(hi)
+        min_hi = np.minimum(np.minimum(hi_l, hi_c), hi_r)
+        mid_l, mid_c, mid_r = shifted(mid)
+        med_mid = np.maximum(np.minimum(mid_l, mid_c), np.minimum(np.maximum(mid_l, mid_c), mid_r))
+
+        result = np.maximum(np.minimum(max_lo, med_mid), np.minimum(np.maximum(max_lo, med_mid), min_hi))
+        target[start:stop] = result
+
+
+def create_image_enhancer(mode: str = "numpy", **kwargs) -> ImageEnhancer:
+    """Create an ImageEnhancer with the DocumentProcessor defaults"""
+    return ImageEnhancer(mode=mode, **kwargs)
@@ -0,0 +1,208 @@
+import importlib.util
+import io
+import logging
+from typing import Callable, Iterator, Optional, Tuple, Dict, Any
+
+from PIL import Image
+
+from src.preprocessing.decoded_document import DecodedDocument
+from src.preprocessing.text_layer import TextLayer, extract_text_layer
+
+logger = logging.getLogger(__name__)
+
+# PDF rasterization is optional; without PyMuPDF only image documents are supported.
+# It takes ~100 ms to import, so it is only loaded once a PDF arrives.
+PDF_SUPPORT_AVAILABLE = any(importlib.util.find_spec(name) is not None for name in ("pymupdf", "fitz"))
+
+
+def _pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    return pymupdf
+
+# Same ceiling as DocumentProcessor.validate_document
+MAX_PAGE_PIXELS_PER_SIDE = 10000
+
+
+class DocumentPage(DecodedDocument):
+    """One page of a multi-page document, rasterized or decoded on first use.
+
+    Pages behave like a DecodedDocument, so preprocessing and every extractor
+    accept them unchanged. Encoded bytes (for cloud extractors and the
+    cache) are produced lazily as PNG. Call `release()` once a page is done
+    so its bitmap can be freed before the next page is loaded.
+
+    PDF pages with a usable embedded text layer carry it as `text_layer`;
+    extractors read it directly and the page is never rasterized.
+    """
+
+    def __init__(self, page_no: int, loader: Callable[[], Image.Image], dimensions: Tuple[int, int],
+                 source_format: str, dpi: Optional[float] = None, source_url: Optional[str] = None,
+                 text_layer: Optional[TextLayer] = None, mode: str = "RGB"):
+        super().__init__(None, source_url=source_url)
+        self.page_no = page_no
+        self.text_layer = text_layer
+        self.source_format = source_format
+        self._loader = loader
+        self._dimensions = dimensions
+        self._dpi = dpi
+        # Taken from the source frame, so page info needs no decode
+        self._mode = mode
+        self._header_parsed = True
+
+    @property
+    def content(self) -> bytes:
+        if self._content is None:
+            buffer = io.BytesIO()
+            self.image.save(buffer, format="PNG", compress_level=1)
+            self._content = buffer.getvalue()
+        return self._content
+
+    @property
+    def is_valid(self) -> bool:
+        return True
+
+    def verify(self) -> bool:
+        return True
+
+    @property
+    def is_pdf(self) -> bool:
+        return False
+
+    @property
+    def format(self) -> Optional[str]:
+        return self.source_format
+
+    @property
+    def mode(self) -> Optional[str]:
+        return self._image.mode if self._image is not None else self._mode
+
+    @property
+    def frame_count(self) -> int:
+        return 1
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return {"dpi": (self._dpi, self._dpi)} if self._dpi else {}
+
+    def decode(self, draft_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+        if self._image is None:
+            self._image = self._loader()
+            self._dimensions = self._image.size
+        return self._image
+
+    def release(self):
+        """Drop the decoded bitmap and encoded bytes of this page"""
+        self._image = None
+        self._content = None
+        self._bytes = None
+
+
+def count_pages(document: DecodedDocument) -> int:
+    """Number of pages without decoding any of them (0 if unreadable)"""
+    if document.is_pdf:
+        if not PDF_SUPPORT_AVAILABLE:
+            return 0
+        try:
+            with _pymupdf().open(stream=document.tobytes(), filetype="pdf") as pdf:
+                return pdf.page_count
+        except Exception as e:
+            logger.warning(f"Could not read PDF: {e}")
+            return 0
+    return document.frame_count
+
+
+def iter_document_pages(document: DecodedDocument, raster_dpi: int = 300,
+                        use_text_layer: bool = True, min_text_chars: int = 20) -> Iterator[DecodedDocument]:
+    """Yield pages lazily; only the page being processed is ever held in memory.
+
+    PDF pages are rasterized one at a time at `raster_dpi`; multi-frame
+    TIFFs decode one frame at a time. Single images yield the document
+    itself. Pages must be consumed while the iterator is alive.
+
+    With `use_text_layer`, PDF pages with at least `min_text_chars` readable
+    embedded characters carry a `text_layer` so OCR can be skipped.
+    """
+    if document.is_pdf:
+        yield from _iter_pdf_pages(document, raster_dpi, min_text_chars if use_text_layer else None)
+        return
+
+    frames = document.frame_count
+    if frames == 0:
+        logger.warning(f"Cannot split document into pages: {document.error}")
+        return
+    if frames == 1:
+        yield document
+        return
+
+    content = document.tobytes()
+    sizes = []
+    probe = Image.open(io.BytesIO(content))
+    for index in range(frames):
+        probe.seek(index)
+        sizes.append((probe.size, probe.info.get("dpi"), probe.mode))
+    probe.close()
+
+    for index, (size, dpi, mode) in enumerate(sizes):
+        yield DocumentPage(
+            page_no=index + 1,
+            loader=_tiff_frame_loader(content, index),
+            dimensions=size,
+            source_format=document.format or "TIFF",
+            dpi=float(dpi[0]) if dpi else None,
+            source_url=document.source_url,
+            mode=mode
+        )
+
+
+def _tiff_frame_loader(content: bytes, index: int) -> Callable[[], Image.Image]:
+    def load() -> Image.Image:
+        # A fresh handle per frame keeps loaders independent of iteration order
+        frame = Image.open(io.BytesIO(content))
+        frame.seek(index)
+        frame.load()
+        return frame
+    return load
+
+
+def _iter_pdf_pages(document: DecodedDocument, raster_dpi: int,
+                    min_text_chars: Optional[int]) -> Iterator[DocumentPage]:
+    if not PDF_SUPPORT_AVAILABLE:
+        logger.error("PDF support requires PyMuPDF (pip install pymupdf)")
+        return
+
+    pdf = _pymupdf().open(stream=document.tobytes(), filetype="pdf")
+    try:
+        for index in range(pdf.page_count):
+            page = pdf[index]
+            rect = page.rect
+            text_layer = None
+            if min_text_chars is not None:
+                text_layer = extract_text_layer(page)
+                if text_layer is not None and not text_layer.is_usable(min_chars=min_text_chars):
+                    text_layer = None
+            # Cap the raster size of oversized pages at the validation limit
+            dpi = min(raster_dpi, MAX_PAGE_PIXELS_PER_SIDE * 72 / max(rect.width, rect.height, 1))
+            dimensions = (int(rect.width * dpi / 72), int(rect.height * dpi / 72))
+            yield DocumentPage(
+                page_no=index + 1,
+                loader=_pdf_page_loader(pdf, index, dpi),
+                dimensions=dimensions,
+                source_format="PDF",
+                dpi=dpi,
+                source_url=document.source_url,
+                text_layer=text_layer
+            )
+    finally:
+        pdf.close()
+
+
+def _pdf_page_loader(pdf, index: int, dpi: float) -> Callable[[], Image.Image]:
+    def load() -> Image.Image:
+        zoom = dpi / 72
+        pymupdf = _pymupdf()
+        pixmap = pdf[index].get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csRGB, alpha=False)
+        return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    return load
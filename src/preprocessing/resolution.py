@@ -0,0 +1,117 @@
+import logging
+from typing import Optional, Tuple, Dict, Any
+
+from PIL import Image
+
+from src.preprocessing.decoded_document import DecodedDocument
+
+logger = logging.getLogger(__name__)
+
+
+class ResolutionPlan:
+    """How a document is decoded and resized before enhancement"""
+
+    NATIVE = "native"
+    UPSCALE = "upscale"
+    DOWNSCALE = "downscale"
+    JPEG_DRAFT = "jpeg_draft"
+
+    def __init__(self, path: str, source_size: Tuple[int, int], target_size: Tuple[int, int],
+                 source_dpi: Optional[float], target_dpi: int):
+        self.path = path
+        self.source_size = source_size
+        self.target_size = target_size
+        self.source_dpi = source_dpi
+        self.target_dpi = target_dpi
+        self.decoded_size: Optional[Tuple[int, int]] = None
+        self.decode_scale = 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "source_size": self.source_size,
+            "decoded_size": self.decoded_size,
+            "decode_scale": self.decode_scale,
+            "target_size": self.target_size,
+            "source_dpi": self.source_dpi,
+            "target_dpi": self.target_dpi
+        }
+
+
+class ResolutionPlanner:
+    """Pick an OCR working resolution and decode straight to it.
+
+    The target width is `target_dpi` times the page's physical width, taken
+    from the image DPI when it is plausible and otherwise assumed to be an
+    A4 page. Small images are upscaled as before; oversized ones are shrunk
+    *before* enhancement, and JPEGs are decoded at a reduced DCT scale via
+    PIL's draft mode so the full-size bitmap is never materialized.
+    """
+
+    def __init__(self, target_dpi: int = 300, assumed_page_width_in: float = 8.27,
+                 min_width: int = 800, upscale_width: int = 1600, downscale_slack: float = 1.25):
+        self.target_dpi = target_dpi
+        self.assumed_page_width_in = assumed_page_width_in
+        self.min_width = min_width
+        self.upscale_width = upscale_width
+        # Only downscale images meaningfully larger than the target
+        self.downscale_slack = downscale_slack
+
+    def _source_dpi(self, document: DecodedDocument) -> Optional[float]:
+        dpi = document.info.get("dpi")
+        try:
+            value = float(dpi[0]) if isinstance(dpi, (tuple, list)) else float(dpi)
+        except (TypeError, ValueError):
+            return None
+        # Ignore placeholder DPI values written by phones and screenshot tools
+        return value if 100 <= value <= 1200 else None
+
+    def plan(self, document: DecodedDocument) -> ResolutionPlan:
+        """Decide the decode path and target size without decoding pixels"""
+        width, height = document.dimensions
+        source_dpi = self._source_dpi(document)
+
+        if width < self.min_width:
+            scale = self.upscale_width / width
+            target = (int(width * scale), int(height * scale))
+            return ResolutionPlan(ResolutionPlan.UPSCALE, (width, height), target, source_dpi, self.target_dpi)
+
+        if source_dpi:
+            target_width = int(width * self.target_dpi / source_dpi)
+        else:
+            target_width = int(self.assumed_page_width_in * self.target_dpi)
+        target_width = max(target_width, self.upscale_width)
+
+        if width <= target_width * self.downscale_slack:
+            return ResolutionPlan(ResolutionPlan.NATIVE, (width, height), (width, height),
+                                  source_dpi, self.target_dpi)
+
+        target = (target_width, max(1, round(height * target_width / width)))
+        # JPEG draft decoding only helps when at least a 2x DCT reduction fits
+        path = ResolutionPlan.JPEG_DRAFT if (document.format == "JPEG" and width >= 2 * target_width) \
+            else ResolutionPlan.DOWNSCALE
+        return ResolutionPlan(path, (width, height), target, source_dpi, self.target_dpi)
+
+    def load(self, document: DecodedDocument, plan: ResolutionPlan, mode: str = "RGB") -> Image.Image:
+        """Decode the document according to the plan, resize to the target and convert to `mode`"""
+        image = document.decode(draft_size=plan.target_size if plan.path == ResolutionPlan.JPEG_DRAFT else None)
+        plan.decoded_size = image.size
+        plan.decode_scale = document.decode_scale
+
+        # Convert on whichever side of the resize has fewer pixels
+        upscaling = plan.path == ResolutionPlan.UPSCALE
+        if image.mode != mode and (upscaling or image.size == plan.target_size):
+            image = image.convert(mode)
+
+        if image.size != plan.target_size:
+            if image.mode not in ("L", "RGB"):
+                image = image.convert("RGB")
+            # Box filtering is accurate and cheap for shrinking; LANCZOS for upscaling
+            resample = Image.LANCZOS if upscaling else Image.BOX
+            image = image.resize(plan.target_size, resample)
+
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        logger.debug(f"Resolution plan {plan.path}: {plan.source_size} -> {plan.target_size}")
+        return image
@@ -0,0 +1,73 @@
+import logging
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (x0, y0, x1, y1, text) in PDF points, origin at the top-left of the page
+Word = Tuple[float, float, float, float, str]
+
+
+class TextLayer:
+    """Words and reading-order text taken from a PDF page's embedded text.
+
+    Words are regrouped into visual rows by vertical position rather than by
+    the PDF's own block/line structure, because table cells in generated
+    bills are usually separate text objects. This yields the same
+    "name qty rate amount" lines that OCR produces, so the text feeds
+    `TesseractExtractor.extract_line_items` unchanged.
+    """
+
+    def __init__(self, words: List[Word], page_size: Tuple[float, float]):
+        self.words = words
+        self.page_size = page_size
+        self._text: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "\n".join(" ".join(word[4] for word in row) for row in self.rows())
+        return self._text
+
+    def rows(self) -> List[List[Word]]:
+        """Words grouped into rows (top to bottom), each sorted left to right"""
+        if not self.words:
+            return []
+        heights = sorted(word[3] - word[1] for word in self.words)
+        tolerance = max(heights[len(heights) // 2], 1.0) * 0.5
+
+        rows: List[List[Word]] = []
+        row_centre = None
+        for word in sorted(self.words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+            centre = (word[1] + word[3]) / 2
+            if row_centre is None or centre - row_centre > tolerance:
+                rows.append([word])
+                row_centre = centre
+            else:
+                rows[-1].append(word)
+        return [sorted(row, key=lambda w: w[0]) for row in rows]
+
+    def is_usable(self, min_chars: int = 20, max_garbage_ratio: float = 0.1) -> bool:
+        """True when the layer has enough readable text to skip OCR.
+
+        Scanned PDFs have no words at all; PDFs with broken font encodings
+        produce replacement or control characters instead of text.
+        """
+        characters = "".join(word[4] for word in self.words)
+        readable = sum(1 for char in characters if char.isalnum())
+        if readable < min_chars:
+            return False
+        garbage = sum(1 for char in characters if char == "\ufffd" or (not char.isprintable()))
+        return garbage / len(characters) <= max_garbage_ratio
+
+
+def extract_text_layer(page) -> Optional[TextLayer]:
+    """Read the embedded words of a PyMuPDF page (None if it has no text)"""
+    try:
+        words = [(x0, y0, x1, y1, text) for x0, y0, x1, y1, text, *_ in page.get_text("words")
+                 if text.strip()]
+    except Exception as e:
+        logger.warning(f"Could not read PDF text layer: {e}")
+        return None
+    if not words:
+        return None
+    return TextLayer(words, (page.rect.width, page.rect.height))
@@ -0,0 +1,123 @@
+import logging
+from typing import Any, Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from src.reconciliation.validator import TOTAL_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Rate x quantity must be within 10% of the item amount, or within 1.00 for
+# small amounts (the rule TesseractExtractor applies to OCR'd rows)
+RATE_TOLERANCE = 0.1
+RATE_MIN_TOLERANCE = 1.0
+
+
+class BillColumns(NamedTuple):
+    """Line items of many bills as flat columns.
+
+    Bill i owns items offsets[i]:offsets[i + 1]. `amount` and
+    `extracted_total` (0 where the bill printed none) are either float64
+    currency units or int64 cents; `rate` is in the same unit as `amount`
+    and, like `quantity`, float64 with NaN where the extractor gave none.
+    """
+    amount: np.ndarray
+    offsets: np.ndarray
+    extracted_total: np.ndarray
+    rate: Optional[np.ndarray] = None
+    quantity: Optional[np.ndarray] = None
+
+    @property
+    def bill_count(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def in_cents(self) -> bool:
+        return self.amount.dtype.kind in "iu"
+
+
+class BatchReconciliation(NamedTuple):
+    """Per-bill results (per item for `rate_consistent`), in the unit of the input"""
+    calculated_total: np.ndarray
+    extracted_total: np.ndarray
+    discrepancy: np.ndarray
+    is_reconciled: np.ndarray
+    reconciled_amount: np.ndarray
+    rate_consistent: np.ndarray
+    inconsistent_items: np.ndarray
+
+
+def bill_columns(extractions: Iterable[Dict[str, Any]], cents: bool = False) -> BillColumns:
+    """Columns for extraction results ({"line_items": [...], "totals": {...}})"""
+    amounts, rates, quantities, offsets, extracted_totals = [], [], [], [0], []
+    for extraction in extractions:
+        for item in extraction.get("line_items", []):
+            amounts.append(item["item_amount"])
+            rates.append(item.get("item_rate", np.nan))
+            quantities.append(item.get("item_quantity", np.nan))
+        offsets.append(len(amounts))
+        totals = extraction.get("totals", {})
+        extracted_totals.append(next((totals[field] for field in TOTAL_FIELDS if field in totals), 0.0))
+
+    amount = np.array(amounts, dtype=np.float64)
+    rate = np.array(rates, dtype=np.float64)
+    extracted_total = np.array(extracted_totals, dtype=np.float64)
+    if cents:
+        amount = np.rint(amount * 100).astype(np.int64)
+        rate = rate * 100
+        extracted_total = np.rint(extracted_total * 100).astype(np.int64)
+    return BillColumns(amount, np.array(offsets, dtype=np.int64), extracted_total, rate,
+                       np.array(quantities, dtype=np.float64))
+
+
+def _segment_sums(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Exact per-bill sums of integer values"""
+    sums = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    return sums[offsets[1:]] - sums[offsets[:-1]]
+
+
+def reconcile_columns(columns: BillColumns, tolerance: float = 0.01) -> BatchReconciliation:
+    """Reconcile every bill in `columns` with vectorized passes.
+
+    Applies ReconciliationEngine.reconcile_extraction's total and tolerance
+    rules to each bill; float totals come out bit for bit the same. Line
+    items are taken as they are: unlike reconcile_extraction this does not
+    drop fuzzy duplicates, so feed it items that have already been
+    reconciled (such as stored responses).
+    """
+    amount = np.asarray(columns.amount)
+    offsets = np.asarray(columns.offsets, dtype=np.int64)
+    extracted = np.asarray(columns.extracted_total)
+    bill_count = len(offsets) - 1
+    if bill_count < 0 or offsets[0] != 0 or offsets[-1] != len(amount) or np.any(np.diff(offsets) < 0):
+        raise ValueError("offsets must rise from 0 to the number of line items")
+    if len(extracted) != bill_count:
+        raise ValueError("extracted_total needs one value per bill")
+    if (amount.dtype.kind in "iu") != (extracted.dtype.kind in "iu"):
+        raise ValueError("amount and extracted_total must both be cents or both be currency units")
+
+    cents = amount.dtype.kind in "iu"
+    if cents:
+        calculated = _segment_sums(amount, offsets)
+    else:
+        # bincount adds each bill's items in order, the same float sums as the per-bill sum()
+        bill_of_item = np.repeat(np.arange(bill_count), np.diff(offsets))
+        calculated = np.bincount(bill_of_item, weights=amount, minlength=bill_count)
+
+    discrepancy = np.abs(calculated - extracted)
+    is_reconciled = (extracted <= 0) | (discrepancy <= extracted * tolerance)
+    reconciled_amount = np.where(is_reconciled, extracted, calculated)
+
+    if columns.rate is None or columns.quantity is None:
+        rate_consistent = np.ones(len(amount), dtype=bool)
+    else:
+        expected = np.asarray(columns.rate) * np.asarray(columns.quantity)
+        allowed = np.maximum(RATE_MIN_TOLERANCE * (100 if cents else 1), np.abs(amount) * RATE_TOLERANCE)
+        # NaN (no rate or quantity) compares false, so such items are not flagged
+        rate_consistent = ~(np.abs(expected - amount) > allowed)
+    inconsistent_items = _segment_sums(~rate_consistent, offsets)
+
+    logger.info(f"Reconciled {bill_count} bills: {int(is_reconciled.sum())} within tolerance, "
+                f"{int(np.count_nonzero(inconsistent_items))} with rate x quantity mismatches")
+    return BatchReconciliation(calculated, extracted, discrepancy, is_reconciled, reconciled_amount,
+                               rate_consistent, inconsistent_items)
@@ -0,0 +1,141 @@
+import logging
+import math
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from rapidfuzz import fuzz, process
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+NAME_SIMILARITY = 0.9
+AMOUNT_SIMILARITY = 0.95
+
+
+def amount_similarity(a: float, b: float) -> float:
+    max_amount = max(abs(a), abs(b))
+    if max_amount > 0:
+        return 1 - abs(a - b) / max_amount
+    return 1.0
+
+
+class _Band:
+    __slots__ = ("names", "amounts", "items")
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.amounts: List[float] = []
+        self.items: List[Dict[str, Any]] = []
+
+
+class DuplicateIndex:
+    """Kept line items, searchable for fuzzy duplicates.
+
+    An item duplicates a kept one when their lowercased names have a
+    SequenceMatcher ratio above `name_threshold` and their amounts a
+    similarity above `amount_threshold`. Amounts that similar have the same
+    sign and a ratio within `amount_threshold`, and names that similar have
+    lengths within a ratio of t / (2 - t), so items are blocked by sign,
+    log-amount band and log-length band, and only the item's own and
+    adjacent blocks are searched, plus the rare items with non-finite
+    amounts. Within those, rapidfuzz scores all names in one call; its
+    Indel ratio is never below SequenceMatcher's, so it only discards pairs
+    that could not match, and the survivors are confirmed with
+    SequenceMatcher. Exact repeats (same name and finite amount) are found
+    by hash first.
+
+    With `max_candidates` set, each lookup compares against at most that
+    many (the most recent) items per block, so it costs O(1) however long
+    the document; a block only overflows when hundreds of kept items share
+    a sign, an amount within a few percent and a name length, and then its
+    older near-duplicates can be missed. Unset, the verdicts are always the
+    same as comparing against every kept item.
+    """
+
+    def __init__(self, name_threshold: float = NAME_SIMILARITY, amount_threshold: float = AMOUNT_SIMILARITY,
+                 max_candidates: Optional[int] = None):
+        if not 0 < amount_threshold < 1:
+            raise ValueError("amount_threshold must be between 0 and 1")
+        if not 0 < name_threshold < 1:
+            raise ValueError("name_threshold must be between 0 and 1")
+        self.name_threshold = name_threshold
+        self.amount_threshold = amount_threshold
+        self.max_candidates = max_candidates
+        # Slightly wider than the exact bounds, so float rounding never splits a match across two bands
+        self._band_width = -math.log(amount_threshold) * (1 + 1e-9)
+        self._length_band_width = -math.log(name_threshold / (2 - name_threshold)) * (1 + 1e-9)
+        self._score_cutoff = name_threshold * 100 - 1e-6
+        self._bands: Dict[Tuple[int, int, int], _Band] = {}
+        self._unbanded = _Band()  # kept items with non-finite amounts
+        self._exact: Dict[Tuple[str, float], Dict[str, Any]] = {}
+
+    def _band_key(self, amount: float, name: str) -> Optional[Tuple[int, int, int]]:
+        if not math.isfinite(amount):
+            return None
+        length_band = math.floor(math.log(len(name)) / self._length_band_width) if name else -1
+        if amount == 0:
+            return (0, 0, length_band)
+        return (1 if amount > 0 else -1, math.floor(math.log(abs(amount)) / self._band_width), length_band)
+
+    def _search_bands(self, key: Optional[Tuple[int, int, int]]) -> List[_Band]:
+        if key is None:
+            # NaN compares unlike any ordinary amount (a NaN item's amount similarity comes out as 1.0), so
+            # non-finite amounts are checked against everything
+            return list(self._bands.values()) + [self._unbanded]
+        sign, band, length_band = key
+        amount_bands = (band - 1, band, band + 1) if sign else (band,)
+        neighbours = [(sign, amount_band, length) for amount_band in amount_bands
+                      for length in (length_band - 1, length_band, length_band + 1)]
+        return [self._bands[neighbour] for neighbour in neighbours if neighbour in self._bands] + [self._unbanded]
+
+    def find(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The kept item that `item` duplicates, or None"""
+        amount = float(item['item_amount'])
+        name = item['item_name'].lower()
+        if math.isfinite(amount) and (name, amount) in self._exact:
+            return self._exact[(name, amount)]
+        for entries in self._search_bands(self._band_key(amount, name)):
+            if not entries.names:
+                continue
+            start = 0 if self.max_candidates is None else max(0, len(entries.names) - self.max_candidates)
+            for index in self._name_candidates(name, entries.names[start:]):
+                index += start
+                if not amount_similarity(amount, entries.amounts[index]) > self.amount_threshold:
+                    continue
+                name_similarity = SequenceMatcher(None, name, entries.names[index]).ratio()
+                if name_similarity > self.name_threshold:
+                    logger.debug(f"Found duplicate: {item['item_name']} (similarity: {name_similarity:.2f})")
+                    return entries.items[index]
+        return None
+
+    def _name_candidates(self, name: str, names: List[str]) -> List[int]:
+        if RAPIDFUZZ_AVAILABLE:
+            matches = process.extract(name, names, scorer=fuzz.ratio, processor=None,
+                                      score_cutoff=self._score_cutoff, limit=None)
+            return sorted(index for _, _, index in matches)
+        return list(range(len(names)))
+
+    def add(self, item: Dict[str, Any]) -> bool:
+        """Keep `item` unless it duplicates a kept item; returns whether it was kept"""
+        if self.find(item) is not None:
+            return False
+        amount = float(item['item_amount'])
+        name = item['item_name'].lower()
+        key = self._band_key(amount, name)
+        entries = self._unbanded if key is None else self._bands.setdefault(key, _Band())
+        entries.names.append(name)
+        entries.amounts.append(amount)
+        entries.items.append(item)
+        if key is not None:
+            self._exact.setdefault((name, amount), item)
+        return True
+
+
+def remove_duplicates(line_items: List[Dict[str, Any]], name_threshold: float = NAME_SIMILARITY,
+                      amount_threshold: float = AMOUNT_SIMILARITY) -> List[Dict[str, Any]]:
+    """Items in order, dropping each one that duplicates an earlier kept item"""
+    index = DuplicateIndex(name_threshold, amount_threshold)
+    return [item for item in line_items if index.add(item)]
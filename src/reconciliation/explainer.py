@@ -0,0 +1,164 @@
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Totals fields that adjust the line-item sum, with the sign they apply
+ADJUSTMENT_FIELDS = {"Tax": 1, "Discount": -1}
+
+
+class DiscrepancyExplainer:
+    """Finds the smallest sets of lines that account for a reconciliation gap.
+
+    Candidate lines are the kept line items (counted but perhaps not billed:
+    a repeated row, a subtotal read as an item), items dropped as duplicates
+    (perhaps billed twice after all) and tax/discount totals. Each changes
+    the calculated total by a signed amount in cents, and the search looks
+    for sets of 1, 2, ... `max_lines` lines whose changes add up to the gap
+    (within `tolerance_cents`). Sizes 1 to 3 are searched exactly with
+    sorted arrays and binary search; size 4 meets in the middle over sorted
+    pair sums, skipped when there are more than `max_pairs` pairs. The
+    search stops at the first size with a match, or when `time_budget`
+    seconds are used up.
+    """
+
+    def __init__(self, max_lines: int = 4, time_budget: float = 0.05, max_pairs: int = 250_000,
+                 max_candidates: int = 5, tolerance_cents: int = 1):
+        self.max_lines = min(max_lines, 4)
+        self.time_budget = time_budget
+        self.max_pairs = max_pairs
+        self.max_candidates = max_candidates
+        self.tolerance_cents = tolerance_cents
+
+    def explain(self, reconciliation_result: Dict[str, Any], document_totals: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Candidate explanations for an unreconciled result, smallest first"""
+        started = time.perf_counter()
+        kept = reconciliation_result.get("line_items", [])
+        lines = self._candidate_lines(kept, reconciliation_result.get("removed_duplicates", []), document_totals)
+        if not lines:
+            return []
+        deltas = np.array([delta for _, delta, _ in lines], dtype=np.int64)
+        target = _cents(reconciliation_result["extracted_total"]) - sum(_cents(item["item_amount"]) for item in kept)
+
+        candidates = []
+        for indices in self.search(deltas, target):
+            explained = int(deltas[list(indices)].sum())
+            candidates.append({
+                "lines": [lines[index][2] for index in indices],
+                "explained_amount": explained / 100,
+                "residual": (target - explained) / 100
+            })
+        logger.info(f"Discrepancy of ${target / 100:.2f} over {len(lines)} lines: {len(candidates)} candidate "
+                    f"explanations in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return candidates
+
+    def _candidate_lines(self, kept: List[Dict], removed: List[Dict], document_totals: Dict) -> List[Tuple]:
+        """(kind, delta in cents, description) for every line that could explain the gap"""
+        amount_counts: Dict[int, int] = {}
+        for item in kept:
+            amount_counts[_cents(item["item_amount"])] = amount_counts.get(_cents(item["item_amount"]), 0) + 1
+
+        lines = []
+        for item in kept:
+            amount = _cents(item["item_amount"])
+            kind = "duplicated_line" if amount_counts[amount] > 1 else "extra_line"
+            lines.append((kind, -amount, _describe(kind, item)))
+        for item in removed:
+            lines.append(("dropped_duplicate", _cents(item["item_amount"]), _describe("dropped_duplicate", item)))
+        for field, sign in ADJUSTMENT_FIELDS.items():
+            value = document_totals.get(field)
+            if value:
+                kind = field.lower()
+                lines.append((kind, sign * abs(_cents(value)), {"kind": kind, "amount": round(float(value), 2)}))
+        return [line for line in lines if line[1] != 0]
+
+    def search(self, deltas: np.ndarray, target: int) -> List[Tuple[int, ...]]:
+        """Index sets of the smallest size whose deltas sum to `target` (within tolerance)"""
+        deadline = time.perf_counter() + self.time_budget
+        order = np.argsort(deltas, kind="stable")
+        values = deltas[order]
+        searches = [self._singles, self._pairs, self._triples, self._quads]
+        for size, search in enumerate(searches[:self.max_lines], start=1):
+            if time.perf_counter() > deadline:
+                logger.info(f"Discrepancy search stopped at {size} lines (time budget)")
+                break
+            found = search(values, target, deadline)
+            if found:
+                return [tuple(sorted(int(order[position]) for position in positions))
+                        for positions in found[:self.max_candidates]]
+        return []
+
+    def _window(self, values: np.ndarray, wanted: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """[lo, hi) positions in sorted `values` within tolerance of each wanted value"""
+        return (np.searchsorted(values, wanted - self.tolerance_cents, side="left"),
+                np.searchsorted(values, wanted + self.tolerance_cents, side="right"))
+
+    def _singles(self, values: np.ndarray, target: int, deadline: float) -> List[Tuple[int, ...]]:
+        return [(int(i),) for i in np.flatnonzero(np.abs(values - target) <= self.tolerance_cents)]
+
+    def _pairs(self, values: np.ndarray, target: int, deadline: float) -> List[Tuple[int, ...]]:
+        lo, hi = self._window(values, target - values)
+        lo = np.maximum(lo, np.arange(1, len(values) + 1))
+        found = []
+        for i in np.flatnonzero(lo < hi):
+            found.extend((int(i), int(j)) for j in range(lo[i], min(hi[i], lo[i] + self.max_candidates)))
+            if len(found) >= self.max_candidates:
+                break
+        return found
+
+    def _triples(self, values: np.ndarray, target: int, deadline: float) -> List[Tuple[int, ...]]:
+        found = []
+        for i in range(len(values) - 2):
+            if time.perf_counter() > deadline:
+                break
+            j = np.arange(i + 1, len(values))
+            lo, hi = self._window(values, target - values[i] - values[j])
+            lo = np.maximum(lo, j + 1)
+            for hit in np.flatnonzero(lo < hi):
+                end = min(hi[hit], lo[hit] + self.max_candidates)
+                found.extend((i, int(j[hit]), int(k)) for k in range(lo[hit], end))
+            if len(found) >= self.max_candidates:
+                break
+        return found
+
+    def _quads(self, values: np.ndarray, target: int, deadline: float) -> List[Tuple[int, ...]]:
+        count = len(values)
+        if count * (count - 1) // 2 > self.max_pairs:
+            logger.info(f"Discrepancy search skips 4-line sets ({count} lines)")
+            return []
+        first, second = np.triu_indices(count, 1)
+        sums = values[first] + values[second]
+        order = np.argsort(sums, kind="stable")
+        sums, first, second = sums[order], first[order], second[order]
+        lo, hi = self._window(sums, target - sums)
+        lo = np.maximum(lo, np.arange(1, len(sums) + 1))
+        found = set()
+        for p in np.flatnonzero(lo < hi):
+            if time.perf_counter() > deadline:
+                break
+            # Cap the scan of each run of equal sums; most of a long run shares lines with pair p
+            for q in range(lo[p], min(hi[p], lo[p] + 64)):
+                members = {int(first[p]), int(second[p]), int(first[q]), int(second[q])}
+                if len(members) == 4:
+                    found.add(tuple(sorted(members)))
+            if len(found) >= self.max_candidates:
+                break
+        return sorted(found)
+
+
+def _cents(amount: Any) -> int:
+    return int(round(float(amount) * 100))
+
+
+def _describe(kind: str, item: Dict[str, Any]) -> Dict[str, Any]:
+    description = {"kind": kind, "item_name": item.get("item_name"), "amount": round(float(item["item_amount"]), 2)}
+    if "page_no" in item:
+        description["page_no"] = item["page_no"]
+    return description
+
+
+def create_discrepancy_explainer(**kwargs) -> DiscrepancyExplainer:
+    return DiscrepancyExplainer(**kwargs)
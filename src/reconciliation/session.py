@@ -0,0 +1,67 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from src.reconciliation.dedup import DuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+# Duplicate candidates per block for sessions fed while pages stream in (see DuplicateIndex)
+STREAMING_MAX_CANDIDATES = 256
+
+
+class ReconciliationSession:
+    """Reconciles one document page by page, while later pages are still
+    being extracted.
+
+    Each item is checked against a DuplicateIndex of the items kept so far
+    (the candidates in its own and adjacent blocks) and added to a running
+    total, so `finish` has nothing left to sum. Without `max_candidates` the
+    result is the same as ReconciliationEngine.reconcile_extraction over all
+    pages' items; with it, each lookup is O(1), but a near-duplicate of an
+    item that many newer items in its block have pushed out is kept.
+    """
+
+    def __init__(self, engine, max_candidates: Optional[int] = None):
+        self.engine = engine
+        self.line_items: List[Dict[str, Any]] = []
+        self.removed_duplicates: List[Dict[str, Any]] = []
+        self.totals: Dict[str, Any] = {}
+        self.calculated_total = 0
+        self.page_count = 0
+        self._index = DuplicateIndex(max_candidates=max_candidates)
+
+    def add_page(self, line_items: List[Dict[str, Any]], totals: Optional[Dict[str, Any]] = None,
+                 page_no: Optional[str] = None) -> Dict[str, Any]:
+        """Reconcile one page's items; returns the page's partial result"""
+        kept = []
+        for item in line_items:
+            if self._index.add(item):
+                kept.append(item)
+                self.calculated_total += item['item_amount']
+            else:
+                self.removed_duplicates.append(item)
+        self.line_items.extend(kept)
+        # Grand totals are printed last, so later pages override earlier ones
+        self.totals.update(totals or {})
+        self.page_count += 1
+
+        return {
+            "page_no": str(page_no or self.page_count),
+            "line_items": kept,
+            "duplicates_removed": len(line_items) - len(kept),
+            "item_count": len(self.line_items),
+            "running_total": self.calculated_total
+        }
+
+    def finish(self, document_totals: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Final reconciliation result, against `document_totals` or the totals seen on the pages"""
+        logger.info(f"Removed {len(self.removed_duplicates)} duplicates")
+        result = {
+            "line_items": self.line_items,
+            "removed_duplicates": self.removed_duplicates,
+            "calculated_total": self.calculated_total
+        }
+        result.update(self.engine._reconcile_totals(
+            self.calculated_total, self.totals if document_totals is None else document_totals
+        ))
+        return result
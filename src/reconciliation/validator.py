@@ -1,23 +1,32 @@
 import logging
-from typing import List, Dict, Any
-from difflib import SequenceMatcher
-import numpy as np
+from typing import TYPE_CHECKING, Dict, Any, Optional
+
+from src.reconciliation.session import ReconciliationSession
+
+if TYPE_CHECKING:
+    from src.reconciliation.columnar import BatchReconciliation
 
 logger = logging.getLogger(__name__)
 
+# Totals fields in order of preference
+TOTAL_FIELDS = ['Total', 'AmountDue', 'InvoiceTotal', 'FinalTotal', 'GrandTotal']
+
 class ReconciliationEngine:
     def __init__(self, tolerance: float = 0.01):
         self.tolerance = tolerance
     
     def reconcile_extraction(self, extracted_data: Dict, document_totals: Dict) -> Dict[str, Any]:
         """Reconcile extracted data with document totals"""
-        line_items = extracted_data.get("line_items", [])
-        
-        # Remove duplicates
-        unique_items = self._remove_duplicates(line_items)
-        
-        # Calculate totals
-        calculated_total = sum(item['item_amount'] for item in unique_items)
+        session = self.session()
+        session.add_page(extracted_data.get("line_items", []))
+        return session.finish(document_totals)
+    
+    def session(self, max_candidates: Optional[int] = None) -> ReconciliationSession:
+        """Start reconciling a document page by page (see ReconciliationSession)"""
+        return ReconciliationSession(self, max_candidates)
+    
+    def _reconcile_totals(self, calculated_total: float, document_totals: Dict) -> Dict[str, Any]:
+        """Compare the calculated total of the unique items with the document total"""
         extracted_total = self._get_extracted_total(document_totals)
         
         # Check reconciliation
@@ -31,54 +40,20 @@ class ReconciliationEngine:
                    f"Reconciled=${reconciled_amount:.2f}")
         
         return {
-            "line_items": unique_items,
-            "calculated_total": calculated_total,
             "extracted_total": extracted_total,
             "discrepancy": discrepancy,
             "is_reconciled": is_reconciled,
             "reconciled_amount": reconciled_amount
         }
     
-    def _remove_duplicates(self, line_items: List[Dict]) -> List[Dict]:
-        """Remove duplicate line items using fuzzy matching"""
-        unique_items = []
-        
-        for item in line_items:
-            if not self._is_duplicate(item, unique_items):
-                unique_items.append(item)
-        
-        logger.info(f"Removed {len(line_items) - len(unique_items)} duplicates")
-        return unique_items
-    
-    def _is_duplicate(self, item: Dict, existing_items: List[Dict]) -> bool:
-        """Check if item is duplicate using fuzzy matching"""
-        for existing in existing_items:
-            # Check name similarity
-            name_similarity = SequenceMatcher(
-                None, 
-                item['item_name'].lower(), 
-                existing['item_name'].lower()
-            ).ratio()
-            
-            # Check amount similarity (handle division by zero)
-            max_amount = max(abs(item['item_amount']), abs(existing['item_amount']))
-            if max_amount > 0:
-                amount_similarity = 1 - abs(item['item_amount'] - existing['item_amount']) / max_amount
-            else:
-                amount_similarity = 1.0
-            
-            # Consider duplicate if both name and amount are very similar
-            if name_similarity > 0.9 and amount_similarity > 0.95:
-                logger.debug(f"Found duplicate: {item['item_name']} (similarity: {name_similarity:.2f})")
-                return True
-        
-        return False
+    def reconcile_batch(self, columns) -> "BatchReconciliation":
+        """Reconcile many bills at once from a BillColumns batch (see src.reconciliation.columnar)"""
+        from src.reconciliation.columnar import reconcile_columns
+        return reconcile_columns(columns, self.tolerance)
     
     def _get_extracted_total(self, document_totals: Dict) -> float:
         """Extract the final total from document totals"""
-        total_fields = ['Total', 'AmountDue', 'InvoiceTotal', 'FinalTotal', 'GrandTotal']
-        
-        for field in total_fields:
+        for field in TOTAL_FIELDS:
             if field in document_totals:
                 total = document_totals[field]
                 logger.info(f"Found total in field '{field}': ${total:.2f}")
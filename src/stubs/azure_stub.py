@@ -0,0 +1,180 @@
+"""Local stand-in for the Form Recognizer (Document Intelligence) analyze API.
+
+Usage:
+    python -m src.stubs.azure_stub [--port 9325] [--latency-ms 50 | --latency SPEC] [--analyze-seconds 2]
+
+Point AzureFormRecognizerExtractor / AsyncAzureFormRecognizerExtractor at
+http://127.0.0.1:9325 with any key. It mimics the long-running operation
+protocol: POST .../documentModels/{model}:analyze answers 202 with an
+Operation-Location; GETs on that URL report "running" for
+`analyze_seconds` and then "succeeded" with a prebuilt-invoice
+AnalyzeResult (currency-valued prices and totals, like the real service).
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Union
+
+from src.stubs.latency import LatencyDistribution, parse_latency
+
+logger = logging.getLogger(__name__)
+
+API_VERSION = "2023-07-31"
+
+
+def _currency(amount: float) -> Dict[str, Any]:
+    return {"type": "currency", "valueCurrency": {"amount": amount, "currencySymbol": "₹", "currencyCode": "INR"},
+            "content": f"₹{amount:.2f}", "confidence": 0.95}
+
+
+def synthetic_invoice_result(model_id: str, items: int) -> Dict[str, Any]:
+    """A prebuilt-invoice analyzeResult with `items` medicine line items"""
+    rows = []
+    subtotal = 0.0
+    for index in range(1, items + 1):
+        quantity, rate = index % 3 + 1, 10.0 + index
+        subtotal += quantity * rate
+        rows.append({"type": "object", "confidence": 0.93, "valueObject": {
+            "Description": {"type": "string", "valueString": f"Medicine {index} Tab",
+                            "content": f"Medicine {index} Tab", "confidence": 0.94},
+            "Quantity": {"type": "number", "valueNumber": quantity, "content": str(quantity), "confidence": 0.95},
+            "UnitPrice": _currency(rate),
+            "Amount": _currency(quantity * rate),
+        }})
+    tax = round(subtotal * 0.05, 2)
+    return {
+        "apiVersion": API_VERSION,
+        "modelId": model_id,
+        "stringIndexType": "unicodeCodePoint",
+        "content": "",
+        "pages": [{"pageNumber": 1, "angle": 0, "width": 8.5, "height": 11, "unit": "inch",
+                   "words": [], "lines": [], "spans": [{"offset": 0, "length": 0}]}],
+        "documents": [{
+            "docType": "invoice",
+            "boundingRegions": [{"pageNumber": 1, "polygon": [0, 0, 8.5, 0, 8.5, 11, 0, 11]}],
+            "spans": [{"offset": 0, "length": 0}],
+            "confidence": 0.96,
+            "fields": {
+                "Items": {"type": "array", "valueArray": rows},
+                "SubTotal": _currency(round(subtotal, 2)),
+                "TotalTax": _currency(tax),
+                "InvoiceTotal": _currency(round(subtotal + tax, 2)),
+            }
+        }]
+    }
+
+
+class AzureStubState:
+    """Operations and behaviour knobs shared by all request handlers"""
+
+    def __init__(self, latency_ms: float = 50.0, analyze_seconds: float = 2.0, items: int = 10,
+                 latency: Optional[Union[str, LatencyDistribution]] = None):
+        self.latency_ms = latency_ms
+        # A distribution (see src/stubs/latency.py) replaces the constant delay
+        self.latency = parse_latency(latency if latency is not None else latency_ms)
+        self.analyze_seconds = analyze_seconds
+        self.items = items
+        self.operations: Dict[str, Dict[str, Any]] = {}
+        self.requests: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def count(self, operation: str):
+        with self.lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+
+class AzureStubHandler(BaseHTTPRequestHandler):
+    state: AzureStubState = None  # set by create_azure_stub
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling is exercised
+
+    def log_message(self, format, *args):
+        logger.debug("azure-stub: " + format % args)
+
+    def _reply(self, status: int, payload=None, headers: Dict[str, str] = None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("apim-request-id", str(uuid.uuid4()))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, code: str, message: str):
+        self._reply(status, {"error": {"code": code, "message": message}})
+
+    def do_POST(self):
+        time.sleep(self.state.latency.sample())
+        self.state.count("analyze")
+        path = self.path.split("?")[0]
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        prefix = "/formrecognizer/documentModels/"
+        if not (path.startswith(prefix) and path.endswith(":analyze")):
+            return self._error(404, "NotFound", path)
+
+        model_id = path[len(prefix):-len(":analyze")]
+        operation_id = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.operations[operation_id] = {"model_id": model_id, "started": time.monotonic()}
+        host = self.headers.get("Host")
+        location = f"http://{host}{prefix}{model_id}/analyzeResults/{operation_id}?api-version={API_VERSION}"
+        self._reply(202, headers={"Operation-Location": location})
+
+    def do_GET(self):
+        time.sleep(self.state.latency.sample())
+        self.state.count("poll")
+        operation_id = self.path.split("?")[0].rstrip("/").rpartition("/")[2]
+        operation = self.state.operations.get(operation_id)
+        if operation is None:
+            return self._error(404, "NotFound", "Unknown operation")
+
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        payload = {"status": "running", "createdDateTime": now, "lastUpdatedDateTime": now}
+        if time.monotonic() - operation["started"] >= self.state.analyze_seconds:
+            payload["status"] = "succeeded"
+            payload["analyzeResult"] = synthetic_invoice_result(operation["model_id"], self.state.items)
+        self._reply(200, payload)
+
+
+def create_azure_stub(host: str = "127.0.0.1", port: int = 9325, **options) -> ThreadingHTTPServer:
+    """Create (but do not start) a stub server; port 0 picks a free port"""
+    handler = type("BoundAzureStubHandler", (AzureStubHandler,), {"state": AzureStubState(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_azure_stub_thread(**options) -> ThreadingHTTPServer:
+    """Start a stub on a background thread (for tests and load runs); call shutdown() when done"""
+    server = create_azure_stub(**options)
+    threading.Thread(target=server.serve_forever, daemon=True, name="azure-stub").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9325)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency", help='per-request delay distribution, e.g. "lognormal:median_ms=300,sigma=0.6"')
+    parser.add_argument("--analyze-seconds", type=float, default=2.0)
+    parser.add_argument("--items", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_azure_stub(args.host, args.port, latency_ms=args.latency_ms,
+                               analyze_seconds=args.analyze_seconds, items=args.items, latency=args.latency)
+    logger.info(f"Form Recognizer stub listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
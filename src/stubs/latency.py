@@ -0,0 +1,125 @@
+"""Injectable latency distributions for the local stubs.
+
+A distribution is written as "kind:param=value,...", e.g.
+
+    constant:ms=50
+    lognormal:median_ms=300,sigma=0.6
+    bimodal:fast_ms=200,slow_ms=4000,slow_fraction=0.05
+
+`--latency` on the Azure and Textract stubs takes this syntax, and
+LatencyStubExtractor applies it in-process, so hedging, timeouts and
+tail-latency behaviour can be exercised offline.
+"""
+import asyncio
+import math
+import random
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Union
+
+
+class LatencyDistribution(ABC):
+    """Draws delays in seconds"""
+
+    def __init__(self, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+
+    @abstractmethod
+    def sample(self) -> float:
+        """One delay, in seconds"""
+
+
+class ConstantLatency(LatencyDistribution):
+    def __init__(self, ms: float = 50.0, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.ms = ms
+
+    def sample(self) -> float:
+        return self.ms / 1000
+
+
+class LognormalLatency(LatencyDistribution):
+    """Right-skewed latency: most requests near `median_ms`, a long slow tail"""
+
+    def __init__(self, median_ms: float = 300.0, sigma: float = 0.6, seed: Optional[int] = None):
+        super().__init__(seed)
+        self.median_ms = median_ms
+        self.sigma = sigma
+
+    def sample(self) -> float:
+        return self.random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+
+class BimodalLatency(LatencyDistribution):
+    """Mostly `fast_ms`, but a `slow_fraction` of requests take `slow_ms` (e.g. a stuck poll)"""
+
+    def __init__(self, fast_ms: float = 200.0, slow_ms: float = 4000.0, slow_fraction: float = 0.05,
+                 seed: Optional[int] = None):
+        super().__init__(seed)
+        self.fast_ms = fast_ms
+        self.slow_ms = slow_ms
+        self.slow_fraction = slow_fraction
+
+    def sample(self) -> float:
+        slow = self.random.random() < self.slow_fraction
+        return (self.slow_ms if slow else self.fast_ms) / 1000
+
+
+DISTRIBUTIONS = {
+    "constant": ConstantLatency,
+    "lognormal": LognormalLatency,
+    "bimodal": BimodalLatency,
+}
+
+
+def parse_latency(spec: Union[str, float, LatencyDistribution, None]) -> LatencyDistribution:
+    """Build a distribution from a spec string, a constant in ms, or pass one through"""
+    if isinstance(spec, LatencyDistribution):
+        return spec
+    if spec is None:
+        return ConstantLatency(0.0)
+    if isinstance(spec, (int, float)):
+        return ConstantLatency(float(spec))
+
+    kind, _, params = spec.partition(":")
+    if kind not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution: {kind}")
+    options: Dict[str, Any] = {}
+    for param in filter(None, params.split(",")):
+        name, _, value = param.partition("=")
+        options[name.strip()] = int(value) if name.strip() == "seed" else float(value)
+    return DISTRIBUTIONS[kind](**options)
+
+
+class LatencyStubExtractor:
+    """In-process extractor that answers a fixed result after a sampled delay"""
+
+    def __init__(self, latency: Union[str, float, LatencyDistribution] = 0.0, result: Optional[Dict] = None,
+                 name: str = "stub"):
+        self.latency = parse_latency(latency)
+        self.name = name
+        self.result = result or {
+            "line_items": [{"item_name": "Paracetamol 500mg Tab", "item_quantity": 2.0,
+                            "item_rate": 15.0, "item_amount": 30.0, "confidence": 0.95}],
+            "totals": {"Total": 30.0},
+            "confidence": 0.95
+        }
+        self.calls = 0
+        self.cancelled = 0
+
+    def _answer(self) -> Dict[str, Any]:
+        return {**self.result, "answered_by": self.name}
+
+    def analyze_document(self, document_content) -> Dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return self._answer()
+
+    async def analyze_document_async(self, document_content) -> Dict[str, Any]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.latency.sample())
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self._answer()
@@ -0,0 +1,253 @@
+"""Local stand-in for the Textract and S3 APIs used by AWSTextractExtractor.
+
+Usage:
+    python -m src.stubs.textract_stub [--port 9324] [--latency-ms 50 | --latency SPEC] [--job-seconds 2]
+
+Point the extractor at it with TEXTRACT_ENDPOINT_URL=http://127.0.0.1:9324
+(any AWS credentials work). It implements the JSON protocol for
+AnalyzeDocument, StartDocumentAnalysis and GetDocumentAnalysis, plus S3
+PutObject/DeleteObject with path-style URLs. Every response is delayed by
+`latency_ms` (or a sampled --latency distribution), and jobs stay IN_PROGRESS for `job_seconds`. Each page
+returns a synthetic item table and the last page a "Total" key/value
+pair, so results parse like real bills.
+"""
+import argparse
+import base64
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Union
+
+from src.preprocessing.decoded_document import DecodedDocument
+from src.preprocessing.pages import count_pages
+from src.stubs.latency import LatencyDistribution, parse_latency
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_page_blocks(page: int, rows: int, with_total: bool) -> List[Dict[str, Any]]:
+    """PAGE, TABLE, CELL and WORD blocks for one page of a bill"""
+    blocks: List[Dict[str, Any]] = []
+
+    def add(block_type: str, **fields) -> Dict[str, Any]:
+        block = {"Id": str(uuid.uuid4()), "BlockType": block_type, "Page": page, "Confidence": 99.0, **fields}
+        blocks.append(block)
+        return block
+
+    def words(text: str) -> List[Dict[str, Any]]:
+        return [{"Type": "CHILD", "Ids": [add("WORD", Text=word)["Id"] for word in text.split()]}]
+
+    page_block = add("PAGE", Relationships=[{"Type": "CHILD", "Ids": []}])
+    table = add("TABLE", Relationships=[{"Type": "CHILD", "Ids": []}])
+    page_block["Relationships"][0]["Ids"].append(table["Id"])
+    for row in range(1, rows + 2):
+        if row == 1:
+            texts = ["Item", "Qty", "Rate", "Amount"]
+        else:
+            rate = 10.0 * page + row
+            texts = [f"Medicine P{page}R{row} Tab", "1", f"{rate:.2f}", f"{rate:.2f}"]
+        for column, text in enumerate(texts, start=1):
+            cell = add("CELL", RowIndex=row, ColumnIndex=column, Relationships=words(text))
+            table["Relationships"][0]["Ids"].append(cell["Id"])
+
+    if with_total:
+        value = add("KEY_VALUE_SET", EntityTypes=["VALUE"], Relationships=words("999.00"))
+        add("KEY_VALUE_SET", EntityTypes=["KEY"],
+            Relationships=words("Total Amount") + [{"Type": "VALUE", "Ids": [value["Id"]]}])
+    return blocks
+
+
+class TextractStubState:
+    """Objects, jobs and behaviour knobs shared by all request handlers"""
+
+    def __init__(self, latency_ms: float = 50.0, job_seconds: float = 2.0, rows_per_page: int = 20,
+                 default_pages: int = 1, latency: Optional[Union[str, LatencyDistribution]] = None):
+        self.latency_ms = latency_ms
+        # A distribution (see src/stubs/latency.py) replaces the constant delay
+        self.latency = parse_latency(latency if latency is not None else latency_ms)
+        self.job_seconds = job_seconds
+        self.rows_per_page = rows_per_page
+        self.default_pages = default_pages
+        self.objects: Dict[str, bytes] = {}
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.requests: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def count(self, operation: str):
+        with self.lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+
+    def page_count(self, content: bytes) -> int:
+        document = DecodedDocument(content)
+        return (count_pages(document) or self.default_pages) if document.is_pdf else self.default_pages
+
+    def document_blocks(self, content: bytes) -> List[Dict[str, Any]]:
+        pages = self.page_count(content)
+        blocks: List[Dict[str, Any]] = []
+        for page in range(1, pages + 1):
+            blocks.extend(synthetic_page_blocks(page, self.rows_per_page, with_total=page == pages))
+        return blocks
+
+
+class TextractStubHandler(BaseHTTPRequestHandler):
+    state: TextractStubState = None  # set by create_textract_stub
+
+    def log_message(self, format, *args):
+        logger.debug("textract-stub: " + format % args)
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if "aws-chunked" in (self.headers.get("Content-Encoding") or ""):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def _reply(self, status: int, payload: Optional[Dict[str, Any]] = None,
+               content_type: str = "application/x-amz-json-1.1"):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("x-amzn-RequestId", str(uuid.uuid4()))
+        if status == 200 and self.command == "PUT":
+            self.send_header("ETag", '"stub"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, code: str, message: str):
+        self._reply(status, {"__type": code, "message": message})
+
+    # --- S3 (path-style) -------------------------------------------------
+
+    def do_PUT(self):
+        time.sleep(self.state.latency.sample())
+        self.state.count("PutObject")
+        body = self._body()
+        with self.state.lock:
+            self.state.objects[self.path.split("?")[0].lstrip("/")] = body
+        self._reply(200, content_type="application/xml")
+
+    def do_DELETE(self):
+        self.state.count("DeleteObject")
+        with self.state.lock:
+            self.state.objects.pop(self.path.split("?")[0].lstrip("/"), None)
+        self._reply(204, content_type="application/xml")
+
+    # --- Textract (JSON 1.1) -----------------------------------------------
+
+    def do_POST(self):
+        time.sleep(self.state.latency.sample())
+        operation = (self.headers.get("X-Amz-Target") or "").rpartition(".")[2]
+        self.state.count(operation)
+        try:
+            request = json.loads(self._body() or b"{}")
+        except ValueError:
+            return self._error(400, "ValidationException", "Malformed JSON")
+
+        handler = getattr(self, f"_op_{operation}", None)
+        if handler is None:
+            return self._error(400, "UnknownOperationException", operation)
+        handler(request)
+
+    def _op_AnalyzeDocument(self, request):
+        content = base64.b64decode(request.get("Document", {}).get("Bytes", ""))
+        if DecodedDocument(content).is_pdf and self.state.page_count(content) > 1:
+            return self._error(400, "UnsupportedDocumentException", "Multi-page documents need async jobs")
+        blocks = synthetic_page_blocks(1, self.state.rows_per_page, with_total=True)
+        self._reply(200, {"DocumentMetadata": {"Pages": 1}, "Blocks": blocks})
+
+    def _op_StartDocumentAnalysis(self, request):
+        location = request.get("DocumentLocation", {}).get("S3Object", {})
+        key = f"{location.get('Bucket')}/{location.get('Name')}"
+        token = request.get("ClientRequestToken")
+        with self.state.lock:
+            content = self.state.objects.get(key)
+            # Same ClientRequestToken -> same job, as in Textract
+            job_id = next((job_id for job_id, job in self.state.jobs.items()
+                           if token and job["token"] == token), None)
+            if content is not None and job_id is None:
+                job_id = uuid.uuid4().hex
+                self.state.jobs[job_id] = {"token": token, "started": time.monotonic(), "content": content,
+                                           "blocks": None}
+        if job_id is None:
+            return self._error(400, "InvalidS3ObjectException", f"No such object: {key}")
+        self._reply(200, {"JobId": job_id})
+
+    def _op_GetDocumentAnalysis(self, request):
+        job = self.state.jobs.get(request.get("JobId"))
+        if job is None:
+            return self._error(400, "InvalidJobIdException", "Unknown job")
+        if time.monotonic() - job["started"] < self.state.job_seconds:
+            return self._reply(200, {"JobStatus": "IN_PROGRESS"})
+
+        with self.state.lock:
+            if job["blocks"] is None:
+                job["blocks"] = self.state.document_blocks(job["content"])
+        blocks = job["blocks"]
+        start = int(request.get("NextToken") or 0)
+        stop = start + int(request.get("MaxResults") or 1000)
+        payload = {
+            "JobStatus": "SUCCEEDED",
+            "DocumentMetadata": {"Pages": max(block["Page"] for block in blocks)},
+            "Blocks": blocks[start:stop]
+        }
+        if stop < len(blocks):
+            payload["NextToken"] = str(stop)
+        self._reply(200, payload)
+
+
+def _decode_aws_chunked(body: bytes) -> bytes:
+    """Strip aws-chunked framing (size;ext\\r\\n data \\r\\n ... 0\\r\\n trailers)"""
+    decoded = bytearray()
+    position = 0
+    while position < len(body):
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            break
+        decoded += body[line_end + 2:line_end + 2 + size]
+        position = line_end + 2 + size + 2
+    return bytes(decoded)
+
+
+def create_textract_stub(host: str = "127.0.0.1", port: int = 9324, **options) -> ThreadingHTTPServer:
+    """Create (but do not start) a stub server; port 0 picks a free port"""
+    handler = type("BoundTextractStubHandler", (TextractStubHandler,), {"state": TextractStubState(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_textract_stub_thread(**options) -> ThreadingHTTPServer:
+    """Start a stub on a background thread (for tests and load runs); call shutdown() when done"""
+    server = create_textract_stub(**options)
+    threading.Thread(target=server.serve_forever, daemon=True, name="textract-stub").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9324)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency", help='per-request delay distribution, e.g. "lognormal:median_ms=300,sigma=0.6"')
+    parser.add_argument("--job-seconds", type=float, default=2.0)
+    parser.add_argument("--rows-per-page", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=1, help="pages reported for non-PDF documents")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_textract_stub(args.host, args.port, latency_ms=args.latency_ms, job_seconds=args.job_seconds,
+                                  rows_per_page=args.rows_per_page, default_pages=args.pages, latency=args.latency)
+    logger.info(f"Textract stub listening on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+import io
+
+from PIL import Image
+
+from src.preprocessing.document_processor import DocumentProcessor
+
+
+class FakeResponse:
+    """Minimal stand-in for a streamed requests.Response"""
+
+    def __init__(self, content: bytes, headers=None):
+        self.content = content
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+def make_png(width=300, height=200) -> bytes:
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_read_body_with_content_length_fills_preallocated_buffer():
+    content = make_png()
+    processor = DocumentProcessor(chunk_size=64)
+    body = processor._read_response_body(
+        FakeResponse(content, {'Content-Length': str(len(content))})
+    )
+    assert isinstance(body.obj, bytearray)
+    assert body.tobytes() == content
+
+
+def test_read_body_without_content_length_spills_to_disk():
+    content = bytes(range(256)) * 8192  # 2 MB
+    processor = DocumentProcessor(chunk_size=8192, spool_threshold_mb=1)
+    body = processor._read_response_body(FakeResponse(content))
+    assert body.tobytes() == content
+
+
+def test_read_body_enforces_max_file_size():
+    content = b'x' * (2 * 1024 * 1024)
+    processor = DocumentProcessor(max_file_size_mb=1)
+    assert processor._read_response_body(FakeResponse(content)) is None
+    assert processor._read_response_body(
+        FakeResponse(content, {'Content-Length': str(len(content))})
+    ) is None
+
+
+def test_document_cache_lru_eviction_and_pipeline_version(tmp_path):
+    from src.cache.document_cache import DocumentCache
+
+    cache = DocumentCache(str(tmp_path), max_size_mb=1)
+    for i in range(4):
+        cache.put(str(i), DocumentCache.RAW, b'x' * 300000)
+    assert cache.get('0', DocumentCache.RAW) is None
+    assert cache.get('3', DocumentCache.RAW)[0] == b'x' * 300000
+
+    cache.put_text('abc', 'Paracetamol Tab 2 10.00 20.00')
+    upgraded = DocumentCache(str(tmp_path), max_size_mb=1, pipeline_version='2')
+    assert cache.get_text('abc') == 'Paracetamol Tab 2 10.00 20.00'
+    assert upgraded.get_text('abc') is None
+
+    # Processors configured differently share the directory but not their derived artifacts
+    numpy_processor = DocumentProcessor(cache=cache)
+    assert numpy_processor.preprocess_image(make_png())[1].get("cache_hit") is None
+    assert numpy_processor.preprocess_image(make_png())[1]["cache_hit"]
+    for other in (DocumentProcessor(cache=cache, enhancement_mode="pil"), DocumentProcessor(cache=cache, target_dpi=200)):
+        assert other.preprocess_image(make_png())[1].get("cache_hit") is None
+
+
+def test_decoded_document_is_decoded_once_and_shared():
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    document = DecodedDocument(make_png(400, 300))
+    processor = DocumentProcessor()
+    assert processor.validate_document(document)
+    assert processor.get_document_info(document)['dimensions'] == (400, 300)
+
+    decoded = document.image
+    processed, metadata = processor.preprocess_image(document)
+    assert metadata['processed'] is True
+    assert document.image is decoded
+
+    # Integrity is checked without a decode, so a truncated upload fails validation, not extraction
+    noisy = io.BytesIO()
+    Image.effect_noise((300, 200), 64).save(noisy, format='PNG')
+    truncated = DecodedDocument(noisy.getvalue()[:200])
+    assert truncated.is_valid and not processor.validate_document(truncated)
+    assert truncated._image is None
+
+
+def test_numpy_enhancement_matches_pil_reference():
+    import numpy as np
+    from src.preprocessing.enhancement import ImageEnhancer
+
+    rng = np.random.default_rng(0)
+    for shape in [(120, 90), (97, 64, 3)]:
+        image = Image.fromarray(rng.integers(0, 256, shape, dtype=np.uint8))
+        settings = dict(contrast=1.8, sharpness=1.6, median_size=3, brightness=1.1)
+        fused = ImageEnhancer(mode='numpy', strip_bytes=1024, **settings).enhance(image)
+        reference = ImageEnhancer(mode='pil', **settings).enhance(image)
+        assert np.array_equal(np.asarray(fused), np.asarray(reference))
+
+
+def test_resolution_planner_drafts_large_jpegs_before_enhancement():
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (6000, 8000), 'white').save(buffer, format='JPEG')
+    document = DecodedDocument(buffer.getvalue())
+
+    processed, metadata = DocumentProcessor().preprocess_image(document)
+    assert metadata['resolution']['path'] == 'jpeg_draft'
+    assert metadata['resolution']['decoded_size'] == (3000, 4000)
+    assert processed.size == metadata['resolution']['target_size']
+    assert document.dimensions == (6000, 8000)
+
+
+def test_multi_page_tiff_is_iterated_and_extracted_page_by_page():
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    frames = [Image.new('L' if index == 1 else 'RGB', (400 + 10 * index, 300), 'white') for index in range(3)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:])
+    document = DecodedDocument(buffer.getvalue())
+
+    processor = DocumentProcessor()
+    assert processor.validate_document(document)
+    pages = list(processor.iter_pages(document))
+    assert [page.mode for page in pages] == ['RGB', 'L', 'RGB'] and pages[1].frame_count == 1
+    assert processor.get_document_info(pages[1])['page_count'] == 1
+    assert [page.page_no for page in pages] == [1, 2, 3]
+    assert pages[2].decode().size == (420, 300)
+
+    class PageExtractor:
+        def analyze_document(self, page):
+            return {"line_items": [{"item_name": f"Item {page.page_no}", "item_amount": 10.0}],
+                    "totals": {"Total": 10.0 * page.page_no}, "confidence": 0.9}
+
+    pipeline = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=PageExtractor())
+    result = pipeline.extract_pages(document)
+    assert result["page_count"] == 3
+    assert [item["page_no"] for item in result["line_items"]] == ["1", "2", "3"]
+    assert result["totals"] == {"Total": 30.0}
+
+
+def test_digital_pdf_pages_use_text_layer_instead_of_ocr():
+    import pytest
+    pymupdf = pytest.importorskip("pymupdf")
+    from src.extraction.tesseract_extractor import TesseractExtractor
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    pdf = pymupdf.open()
+    page = pdf.new_page()
+    # Cells written as separate text objects, like generated bill tables
+    for x, cell in [(72, "Paracetamol 500mg Tab"), (300, "2"), (360, "15.00"), (440, "30.00")]:
+        page.insert_text((x, 120), cell)
+    pdf.new_page().insert_image(pymupdf.Rect(0, 0, 200, 200), stream=make_png())
+    document = DecodedDocument(pdf.tobytes())
+
+    pages = list(DocumentProcessor().iter_pages(document))
+    assert pages[0].text_layer.text == "Paracetamol 500mg Tab 2 15.00 30.00"
+    assert pages[1].text_layer is None
+
+    result = TesseractExtractor().analyze_document(pages[0])
+    assert result["text_source"] == "pdf_text_layer"
+    assert result["line_items"][0]["item_amount"] == 30.0
+    assert pages[0]._image is None  # never rasterized
+
+
+def test_robust_ocr_exits_early_and_reports_config_stats(monkeypatch):
+    import time
+    import pytesseract
+    from src.extraction.tesseract_extractor import OCR_CONFIGS, TesseractExtractor
+
+    outputs = {
+        OCR_CONFIGS["psm11"]: (0.0, "Paracetamol Tab 2 15.00 30.00 Total 30.00 Rs 12 13 14 15 16"),
+        OCR_CONFIGS["psm6"]: (0.5, "Paracetamol Tab 2 15.00 30.00"),
+        OCR_CONFIGS["psm8"]: (0.5, "noise"),
+    }
+    started = []
+
+    def fake_image_to_string(image, config, **kwargs):
+        started.append(config)
+        delay, text = outputs[config]
+        time.sleep(delay)
+        return text
+
+    monkeypatch.setattr(pytesseract, "image_to_string", fake_image_to_string)
+    extractor = TesseractExtractor(ocr_config_order=("psm11", "psm6", "psm8"), ocr_workers=2,
+                                   early_exit_score=2.0, ocr_backend="pytesseract")
+    try:
+        text = extractor._robust_ocr(Image.new('L', (10, 10)))
+    finally:
+        extractor.close()
+
+    metadata = extractor._ocr_run.metadata
+    assert text.startswith("Paracetamol Tab 2 15.00 30.00 Total")
+    # Only two passes are in flight at a time, so psm8 was never started
+    assert OCR_CONFIGS["psm11"] in started and OCR_CONFIGS["psm8"] not in started
+    assert metadata["early_exit"] and metadata["winner"] == "psm11"
+    assert metadata["win_rates"]["psm11"] == {"runs": 1, "mean_time": metadata["timings"]["psm11"],
+                                              "win_rate": 1.0}
+
+
+def test_tesseract_cli_config_is_parsed_for_persistent_engine():
+    from src.extraction.ocr_backends import parse_tesseract_config
+    from src.extraction.tesseract_extractor import OCR_CONFIGS
+
+    oem, psm, lang, variables = parse_tesseract_config(OCR_CONFIGS["psm6"])
+    assert (oem, psm, lang) == (3, 6, None)
+    # Same tokenization as pytesseract: the unquoted space ends the whitelist
+    assert variables["tessedit_char_whitelist"].endswith("xyz.,$")
+
+
+def test_tesserocr_engines_from_every_pool_thread_are_ended_on_close(monkeypatch):
+    import types
+    from src.extraction import ocr_backends
+    from src.extraction.tesseract_extractor import TesseractExtractor
+
+    engines = []
+
+    class FakeEngine:
+        def __init__(self, **kwargs):
+            self.ended = False
+            engines.append(self)
+
+        def GetVariableAsString(self, key):
+            return ""
+
+        def SetVariable(self, key, value):
+            pass
+
+        def SetPageSegMode(self, psm):
+            pass
+
+        def SetImage(self, image):
+            pass
+
+        def GetUTF8Text(self):
+            return "Paracetamol Tab 2 15.00 30.00"
+
+        def Clear(self):
+            pass
+
+        def End(self):
+            self.ended = True
+
+    fake_tesserocr = types.SimpleNamespace(PyTessBaseAPI=FakeEngine, PSM=types.SimpleNamespace(AUTO=3))
+    monkeypatch.setattr(ocr_backends, "tesserocr", fake_tesserocr)
+    monkeypatch.setattr(ocr_backends, "TESSEROCR_AVAILABLE", True)
+
+    backend = ocr_backends.create_ocr_backend("auto")
+    assert isinstance(backend, ocr_backends.TesserocrBackend) and engines[0].ended  # the probe is not kept
+    other = ocr_backends.TesserocrBackend()
+    assert ocr_backends.worker_backend(other) is other is not ocr_backends.worker_backend(backend)
+
+    extractor = TesseractExtractor(ocr_backend=backend, ocr_workers=2, early_exit_score=None)
+    extractor._robust_ocr(Image.new('L', (10, 10)))
+    assert len(engines) > 1
+    extractor.close()
+    assert all(engine.ended for engine in engines)
+
+
+def test_layout_mode_uses_one_word_level_pass(monkeypatch):
+    import pytesseract
+    from src.extraction.tesseract_extractor import TesseractExtractor
+
+    rows = [
+        [("Pharmacy", 100, 90.0)],
+        [("Paracetamol", 100, 90.0), ("Tab", 250, 90.0), ("2", 400, 80.0), ("15.00", 500, 80.0), ("30.00", 600, 80.0)],
+        [("Amoxicillin", 100, 90.0), ("Cap", 250, 90.0), ("1", 400, 80.0), ("80.00", 500, 80.0), ("80.00", 600, 80.0)],
+        [("Cough", 100, 70.0), ("Syr", 200, 70.0), ("3", 400, 70.0), ("40.00", 500, 70.0), ("120.00", 600, 70.0)],
+        # A single-amount line outside the table is still an item
+        [("Crocin", 100, 90.0), ("Tab", 250, 90.0), ("45.00", 600, 90.0)],
+    ]
+    data = {key: [] for key in ("page_num", "block_num", "par_num", "line_num", "left", "top",
+                                "width", "height", "conf", "text")}
+    for line_no, row in enumerate(rows, start=1):
+        for text, right, conf in row:
+            for key, value in zip(data, (1, 1, 1, line_no, right - 10 * len(text), 40 * line_no,
+                                         10 * len(text), 20, conf, text)):
+                data[key].append(value)
+
+    calls = []
+    monkeypatch.setattr(pytesseract, "image_to_data", lambda *args, **kwargs: calls.append(1) or data)
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda *args, **kwargs: calls.append(2) or "")
+
+    extractor = TesseractExtractor(ocr_mode="layout", ocr_backend="pytesseract")
+    result = extractor.analyze_document(make_png(1200, 900))
+    assert calls == [1]
+    assert [item["item_amount"] for item in result["line_items"]] == [30.0, 80.0, 120.0, 45.0]
+    assert result["ocr"]["layout"]["table_lines"] == 3
+    # 0.5 + 4 items * 0.05 + 0.3 * mean line confidence
+    assert result["confidence"] == round(0.7 + 0.3 * (0.84 + 0.84 + 0.7 + 0.9) / 4, 4)
+
+
+def test_textract_parser_resolves_blocks_through_index():
+    from src.extraction.textract_parser import TextractBlockIndex, TextractResponseParser
+
+    def word(block_id, text):
+        return {"Id": block_id, "BlockType": "WORD", "Text": text}
+
+    def cell(block_id, row, *word_ids):
+        return {"Id": block_id, "BlockType": "CELL", "RowIndex": row,
+                "Relationships": [{"Type": "CHILD", "Ids": list(word_ids)}]}
+
+    blocks = [
+        {"Id": "t", "BlockType": "TABLE", "Relationships": [{"Type": "CHILD", "Ids": ["c1", "c2", "c3", "c4"]}]},
+        cell("c1", 1, "w1"), cell("c2", 1, "w2"), cell("c3", 2, "w3", "w4"), cell("c4", 2, "w5"),
+        word("w1", "Item"), word("w2", "Amount"), word("w3", "Paracetamol"), word("w4", "Tab"),
+        word("w5", "$30.00"),
+        {"Id": "k", "BlockType": "KEY_VALUE_SET", "EntityTypes": ["KEY"],
+         "Relationships": [{"Type": "CHILD", "Ids": ["w6"]}, {"Type": "VALUE", "Ids": ["v"]}]},
+        {"Id": "v", "BlockType": "KEY_VALUE_SET", "EntityTypes": ["VALUE"],
+         "Relationships": [{"Type": "CHILD", "Ids": ["w7"]}]},
+        word("w6", "Grand Total"), word("w7", "30.00"),
+    ]
+    index = TextractBlockIndex(blocks)
+    assert [block["Id"] for block in index.related_blocks(blocks[0], "CHILD", "CELL")] == ["c1", "c2", "c3", "c4"]
+
+    result = TextractResponseParser().parse({"Blocks": blocks})
+    assert result["line_items"] == [{"item_name": "Paracetamol Tab", "item_quantity": 1.0, "item_rate": 30.0,
+                                     "item_amount": 30.0, "confidence": 0.8}]
+    assert result["totals"] == {"Total": 30.0}
+
+
+def test_pipeline_reports_stage_timings_and_failing_stage():
+    import time
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    frames = [Image.new('RGB', (400, 300), 'white') for _ in range(2)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:])
+    processor = DocumentProcessor()
+    processor.fetch_document = lambda url: DecodedDocument(buffer.getvalue(), source_url=url)
+
+    class SlowExtractor:
+        def analyze_document(self, page):
+            time.sleep(0.05)
+            return {"line_items": [{"item_name": f"Item {page.page_no}", "item_amount": 10.0}],
+                    "totals": {"Total": 20.0}, "confidence": 0.9}
+
+    pipeline = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=SlowExtractor())
+    result = pipeline.process_document("https://bills/two-pages.tiff")
+    metadata = result["metadata"]
+    assert result["is_success"] and result["data"]["reconciled_amount"] == 20.0
+    assert list(metadata["stage_timings_ms"]) == ["fetch", "validate", "preprocess", "extract", "reconcile",
+                                                  "explain", "format"]
+    assert metadata["page_count"] == 2 and metadata["extractor"] == "SlowExtractor"
+    # Spans are exclusive, so the stages add up to (at most) the request time
+    assert metadata["stage_timings_ms"]["extract"] >= 100
+    assert sum(metadata["stage_timings_ms"].values()) <= metadata["total_ms"]
+
+    processor.fetch_document = lambda url: None
+    failed = pipeline.process_document("https://bills/missing.png")
+    assert not failed["is_success"] and failed["metadata"]["failed_stage"] == "fetch"
+
+    class BrokenExtractor:
+        def analyze_document(self, page):
+            raise RuntimeError("engine crashed")
+
+    processor.fetch_document = lambda url: DecodedDocument(buffer.getvalue(), source_url=url)
+    failed = BillExtractionPipeline(use_mock=False, document_processor=processor,
+                                    extractor=BrokenExtractor()).process_document("https://bills/two-pages.tiff")
+    assert failed["error"] == "Processing error in extract stage: engine crashed"
+    assert failed["metadata"]["failed_stage"] == "extract"
+
+
+def test_process_batch_yields_as_completed_with_bounded_in_flight_documents():
+    import threading
+    import time
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    content = make_png()
+    lock = threading.Lock()
+    state = {"fetching": 0, "peak_fetching": 0, "pulled": 0}
+
+    def fetch(url):
+        with lock:
+            state["fetching"] += 1
+            state["peak_fetching"] = max(state["peak_fetching"], state["fetching"])
+        time.sleep(0.01)
+        with lock:
+            state["fetching"] -= 1
+        return None if url.endswith("missing.png") else DecodedDocument(content, source_url=url)
+
+    def urls():
+        for index in range(40):
+            state["pulled"] += 1
+            yield f"https://bills/{index}.png" if index % 10 else f"https://bills/{index}-missing.png"
+
+    processor = DocumentProcessor()
+    processor.fetch_document = fetch
+    pipeline = BillExtractionPipeline(use_mock=True, document_processor=processor)
+
+    results = {}
+    for url, result in pipeline.process_batch(urls(), concurrency=4, cpu_workers=2, max_in_flight=6):
+        # Backpressure: the URL generator never runs more than max_in_flight ahead
+        assert state["pulled"] - len(results) <= 6
+        results[url] = result
+
+    assert len(results) == 40 and state["peak_fetching"] <= 4
+    failed = [url for url, result in results.items() if not result["is_success"]]
+    assert sorted(failed) == sorted(f"https://bills/{index}-missing.png" for index in range(0, 40, 10))
+    assert all(results[url]["metadata"]["failed_stage"] == "fetch" for url in failed)
+    succeeded = results["https://bills/1.png"]
+    assert succeeded["data"]["total_item_count"] >= 3
+    assert list(succeeded["metadata"]["stage_timings_ms"])[:3] == ["fetch", "validate", "preprocess"]
+
+
+def test_process_batch_keeps_cloud_extraction_in_this_process_under_its_own_limit():
+    import os
+    import threading
+    import time
+    from src.extraction.cascade import CascadeTier, ExtractorCascade
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    class CloudExtractor:
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.active, self.peak, self.pids = 0, 0, set()
+
+        def analyze_document(self, page):
+            with self.lock:
+                self.active += 1
+                self.peak = max(self.peak, self.active)
+                self.pids.add(os.getpid())
+            time.sleep(0.01)
+            with self.lock:
+                self.active -= 1
+            return {"line_items": [{"item_name": "Consultation fee", "item_amount": 500.0}],
+                    "totals": {"Total": 500.0}, "confidence": 0.95}
+
+    content = make_png()
+    processor = DocumentProcessor()
+    processor.fetch_document = lambda url: DecodedDocument(content, source_url=url)
+    cloud = CloudExtractor()
+    cascade = ExtractorCascade([CascadeTier("azure", cloud, cost=1.0)], confidence_threshold=0.7)
+    pipeline = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=cascade)
+
+    urls = [f"https://bills/{index}.png" for index in range(12)]
+    results = list(pipeline.process_batch(urls, concurrency=8, cpu_workers=4, cloud_concurrency=2))
+
+    # One process, so one provider quota, breaker and hedge budget; the cloud stage has its own limit
+    assert len(results) == 12 and all(result["is_success"] for _, result in results)
+    assert cloud.pids == {os.getpid()} and cloud.peak <= 2
+
+
+def test_bill_index_flags_resubmissions_and_short_circuits_after_first_page(tmp_path):
+    from src.cache.bill_index import FIRST_PAGE, BillSignatureIndex
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+
+    def scan(width):
+        frames = [Image.new('RGB', (width, 150), 'white') for _ in range(3)]
+        buffer = io.BytesIO()
+        frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:])
+        return buffer.getvalue()
+
+    scans = {"https://bills/original.tiff": scan(200), "https://bills/photo.tiff": scan(210),
+             "https://bills/rescan.tiff": scan(220)}
+    processor = DocumentProcessor()
+    processor.fetch_document = lambda url: DecodedDocument(scans[url], source_url=url)
+    pages_extracted = []
+
+    class PageExtractor:
+        def __init__(self, noisy=False):
+            self.noisy = noisy
+
+        def analyze_document(self, page):
+            pages_extracted.append(page.page_no)
+            items = [{"item_name": f"Medicine {page.page_no}-{index} Tab", "item_amount": 10.0 * page.page_no + index}
+                     for index in range(4)]
+            if self.noisy:
+                items[0]["item_name"] = items[0]["item_name"].upper().replace(" ", " .")
+            return {"line_items": items, "totals": {"Total": 126.0}, "confidence": 0.9}
+
+    index = BillSignatureIndex(str(tmp_path / "bills.sqlite3"))
+    original = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=PageExtractor(),
+                                      bill_index=index).process_document("https://bills/original.tiff")
+    assert "resubmission_of" not in original["metadata"]
+    assert original["metadata"]["stage_timings_ms"]["resubmission"] >= 0
+
+    photo = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=PageExtractor(noisy=True),
+                                   bill_index=index).process_document("https://bills/photo.tiff")
+    assert photo["metadata"]["resubmission_of"]["source_url"] == "https://bills/original.tiff"
+
+    # A new worker opens the same file; after one page the rescan is served from the index
+    reopened = BillSignatureIndex(str(tmp_path / "bills.sqlite3"), short_circuit=True)
+    assert reopened.stats()["bills"] == 2
+    assert reopened.lookup([{"item_name": "Something else", "item_amount": 3.5}], FIRST_PAGE) is None
+    pages_extracted.clear()
+    rescan = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=PageExtractor(),
+                                    bill_index=reopened).process_document("https://bills/rescan.tiff")
+    assert pages_extracted == [1]
+    assert rescan["data"] == original["data"] and rescan["metadata"]["resubmission_of"]["similarity"] == 1.0
+    assert "reconcile" not in rescan["metadata"]["stage_timings_ms"]
+
+    # Behind a cascade the cheap tier's first page short-circuits too, and nothing escalates
+    from src.extraction.cascade import CascadeTier, ExtractorCascade
+
+    class CloudExtractor:
+        def analyze_document(self, page):
+            pages_extracted.append(("cloud", page.page_no))
+            return {"line_items": [], "totals": {}, "confidence": 0.0}
+
+    cascade = ExtractorCascade([CascadeTier("cloud", CloudExtractor(), cost=1.0),
+                                CascadeTier("local", PageExtractor(), cost=0.0)], confidence_threshold=0.5)
+    pages_extracted.clear()
+    cascaded = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=cascade,
+                                      bill_index=reopened).process_document("https://bills/rescan.tiff")
+    assert pages_extracted == [1]
+    assert cascaded["data"] == original["data"] and cascaded["metadata"]["resubmission_of"]["similarity"] == 1.0
+
+    # A first page alone is not evidence enough: too few items, or a different page count, is only flagged
+    class SparseExtractor:
+        def analyze_document(self, page):
+            pages_extracted.append(page.page_no)
+            return {"line_items": [{"item_name": "Consultation fee", "item_amount": 500.0}],
+                    "totals": {}, "confidence": 0.9}
+
+    guarded = BillSignatureIndex(str(tmp_path / "guarded.sqlite3"), short_circuit=True)
+    consultation = [{"item_name": "Consultation fee", "item_amount": 500.0}]
+    bill_a = consultation + [{"item_name": f"Ward day {day}", "item_amount": 1000.0 + day} for day in range(8)]
+    guarded.add("bill-a", bill_a, consultation, {"is_success": True, "data": {"bill": "A"}}, page_count=3,
+                printed_total=9528.0)
+    pages_extracted.clear()
+    new_bill = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=SparseExtractor(),
+                                      bill_index=guarded).process_document("https://bills/rescan.tiff")
+    assert pages_extracted == [1, 2, 3] and new_bill["data"] != {"bill": "A"}
+    assert new_bill["metadata"]["resubmission_of"] == {"document_key": "bill-a", "source_url": None,
+                                                       "similarity": 1.0, "first_page_only": True}
+
+    first_page = [{"item_name": f"Medicine 1-{index} Tab", "item_amount": 10.0 + index} for index in range(4)]
+    later_pages = [{"item_name": "Dressing", "item_amount": 80.0}]
+    assert guarded.add("bill-b", first_page + later_pages, first_page, {"is_success": True, "data": {"bill": "B"}},
+                       page_count=5, printed_total=126.0)
+    assert guarded.first_page_match(first_page, 5, 126.0)[1]
+    assert not guarded.first_page_match(first_page, 5, 99.0)[1]
+    pages_extracted.clear()
+    other = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=PageExtractor(),
+                                   bill_index=guarded).process_document("https://bills/rescan.tiff")
+    assert pages_extracted == [1, 2, 3] and other["data"] != {"bill": "B"}
+
+
+def test_document_cache_setting_serves_resubmitted_url_without_download_or_ocr(tmp_path, monkeypatch):
+    from config.settings import settings
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.extraction.tesseract_extractor import TesseractExtractor
+
+    monkeypatch.setattr(settings, "DOCUMENT_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "EXTRACTORS", "tesseract")
+    ocr_runs = []
+
+    def fake_ocr(self, document):
+        ocr_runs.append(document)
+        return "Paracetamol 500mg Tab 2 15.00 30.00\nConsultation Fee 1 500.00 500.00"
+
+    monkeypatch.setattr(TesseractExtractor, "extract_text_from_content", fake_ocr)
+    pipeline = BillExtractionPipeline(use_mock=False)
+    assert pipeline.document_processor.cache is pipeline.cache is not None
+    content = make_png()
+    pipeline.document_processor.session.get = lambda url, **kwargs: FakeResponse(content)
+    first = pipeline.process_document("https://bills/cached.png")
+
+    def offline(url, **kwargs):
+        raise AssertionError("resubmitted URL was downloaded again")
+
+    pipeline.document_processor.session.get = offline
+    second = pipeline.process_document("https://bills/cached.png")
+    assert first["is_success"] and second["data"] == first["data"]
+    assert len(ocr_runs) == 1
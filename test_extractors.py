@@ -0,0 +1,330 @@
+import pytest
+
+from src.extraction.textract_async import TextractJobRunner, run_blocking
+from src.extraction.textract_parser import TextractResponseParser
+from src.stubs.textract_stub import start_textract_stub_thread
+
+
+def test_async_textract_job_against_local_stub():
+    boto3 = pytest.importorskip("boto3")
+    pymupdf = pytest.importorskip("pymupdf")
+    from botocore.config import Config
+
+    server = start_textract_stub_thread(port=0, latency_ms=0, job_seconds=0.2, rows_per_page=12)
+    try:
+        options = dict(endpoint_url=f"http://127.0.0.1:{server.server_port}", region_name="us-east-1",
+                       aws_access_key_id="stub", aws_secret_access_key="stub")
+        runner = TextractJobRunner(
+            boto3.client("textract", **options),
+            boto3.client("s3", config=Config(s3={"addressing_style": "path"}), **options),
+            bucket="bills", poll_interval=0.05, max_results=50
+        )
+        pdf = pymupdf.open()
+        for _ in range(3):
+            pdf.new_page()
+
+        job = run_blocking(runner.run(pdf.tobytes()))
+        result = TextractResponseParser().parse_index(job["index"])
+        # Resubmitting the same bytes (e.g. after a FAILED job) starts a fresh job
+        retry = run_blocking(runner.run(pdf.tobytes()))
+    finally:
+        server.shutdown()
+
+    state = server.RequestHandlerClass.state
+    assert job["job"]["status"] == "SUCCEEDED" and job["job"]["pages"] == 3
+    assert job["job"]["result_pages"] > 1 and job["job"]["polls"] > 1
+    assert len(result["line_items"]) == 36
+    assert result["totals"] == {"Total": 999.0}
+    assert retry["job"]["job_id"] != job["job"]["job_id"] and retry["job"]["status"] == "SUCCEEDED"
+    assert state.objects == {}  # the uploaded input is cleaned up
+
+
+def test_async_azure_extractor_against_local_stub_honours_deadline():
+    import asyncio
+    import time
+    pytest.importorskip("aiohttp")
+    pytest.importorskip("azure.ai.formrecognizer")
+    from src.extraction.azure_async_extractor import AsyncAzureFormRecognizerExtractor
+    from src.stubs.azure_stub import start_azure_stub_thread
+
+    server = start_azure_stub_thread(port=0, latency_ms=0, analyze_seconds=0.3, items=3)
+    extractor = AsyncAzureFormRecognizerExtractor(endpoint=f"http://127.0.0.1:{server.server_port}",
+                                                  key="stub", polling_interval=0.05)
+
+    async def run():
+        try:
+            results = await asyncio.gather(*[extractor.analyze_document_async(b"bill") for _ in range(5)])
+            late = await extractor.analyze_document_async(b"bill", deadline=time.monotonic() + 0.1)
+            return results, late
+        finally:
+            await extractor.aclose()
+
+    async def run_without_aclose():
+        await extractor.analyze_document_async(b"bill")
+        return extractor._clients[asyncio.get_running_loop()][1]
+
+    try:
+        results, late = asyncio.run(run())
+        # The loop's shutdown closes the client and session left open
+        session = asyncio.run(run_without_aclose())
+    finally:
+        server.shutdown()
+    assert session.closed and extractor._clients == {}
+
+    for result in results:
+        # Currency-valued prices and totals are unwrapped
+        assert [item["item_amount"] for item in result["line_items"]] == [22.0, 36.0, 13.0]
+        assert result["totals"] == {"Total": 74.55, "Subtotal": 71.0, "Tax": 3.55}
+    assert late["error"] == "deadline exceeded" and late["line_items"] == []
+
+
+def test_scheduler_retries_throttled_documents_and_backs_off():
+    import threading
+    pytest.importorskip("botocore")
+    from botocore.exceptions import ClientError
+    from src.extraction.scheduler import ProviderLimiter, ScheduledExtractor
+
+    class FlakyExtractor:
+        def __init__(self):
+            self.calls = 0
+            self.lock = threading.Lock()
+
+        def analyze_document_strict(self, document):
+            with self.lock:
+                self.calls += 1
+                throttle = self.calls <= 3
+            if throttle:
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+                                  "AnalyzeDocument")
+            if document == "broken":
+                raise ValueError("unsupported document")
+            return {"line_items": [{"item_name": document}], "totals": {}, "confidence": 0.9}
+
+    limiter = ProviderLimiter("textract", rate=100.0, burst=4, max_concurrency=2, increase_step=0.0)
+    scheduler = ScheduledExtractor(FlakyExtractor(), "textract", limiter=limiter, backoff_base=0.01)
+
+    results = scheduler.analyze_many([f"bill-{n}" for n in range(6)] + ["broken"])
+
+    # Throttled documents are retried, not turned into empty results
+    assert [r["line_items"][0]["item_name"] for r in results[:6]] == [f"bill-{n}" for n in range(6)]
+    assert results[6]["error"] == "unsupported document" and results[6]["throttled"] is False
+    metrics = scheduler.metrics()
+    assert metrics["submitted"] == 7 and metrics["completed"] == 6 and metrics["failed"] == 1
+    assert metrics["throttled"] == 3 and metrics["retries"] == 3
+    assert metrics["current_rate"] == 12.5  # halved once per throttle
+    assert metrics["queue_depth"] == 0 and metrics["in_flight"] == 0
+
+    from src.extraction.scheduler import get_provider_limiter, retry_after
+    # botocore keeps response headers under ResponseMetadata
+    throttled = ClientError({"Error": {"Code": "ThrottlingException"},
+                             "ResponseMetadata": {"HTTPHeaders": {"retry-after": "2"}}}, "AnalyzeDocument")
+    assert retry_after(throttled) == 2.0
+    shared = get_provider_limiter("test-shared", rate=5.0)
+    assert get_provider_limiter("test-shared") is shared and get_provider_limiter("test-shared", rate=5.0) is shared
+    with pytest.raises(ValueError):
+        get_provider_limiter("test-shared", rate=10.0)
+
+
+def test_cascade_escalates_only_when_local_result_is_not_good_enough():
+    import io
+    import time
+    from PIL import Image
+    from src.extraction.cascade import CascadeTier, ExtractorCascade
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+    from src.preprocessing.document_processor import DocumentProcessor
+
+    class FixedExtractor:
+        def __init__(self, confidence, total):
+            self.confidence, self.total, self.calls = confidence, total, 0
+
+        def analyze_document(self, page):
+            self.calls += 1
+            return {"line_items": [{"item_name": "Paracetamol 500mg Tab", "item_amount": 30.0}],
+                    "totals": {"Total": self.total}, "confidence": self.confidence}
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 200), "white").save(buffer, format="PNG")
+    processor = DocumentProcessor()
+    processor.fetch_document = lambda url: DecodedDocument(buffer.getvalue(), source_url=url)
+
+    def pipeline_for(local, cloud):
+        cascade = ExtractorCascade([CascadeTier("tesseract", local), CascadeTier("azure", cloud, cost=1.0)],
+                                   confidence_threshold=0.7)
+        return BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=cascade), cascade
+
+    # Clean receipt: the local tier answers and the cloud is never called
+    local, cloud = FixedExtractor(0.9, 30.0), FixedExtractor(0.95, 30.0)
+    pipeline, cascade = pipeline_for(local, cloud)
+    assert pipeline.process_document("https://bills/clean.png")["data"]["reconciled_amount"] == 30.0
+    assert (local.calls, cloud.calls) == (1, 0)
+
+    # Low confidence, then a total that does not reconcile: both escalate
+    for local in (FixedExtractor(0.5, 30.0), FixedExtractor(0.9, 99.0)):
+        cloud = FixedExtractor(0.95, 30.0)
+        pipeline, cascade = pipeline_for(local, cloud)
+        assert pipeline.process_document("https://bills/noisy.png")["is_success"]
+        assert (local.calls, cloud.calls) == (1, 1)
+        assert cascade.get_stats()["azure"]["answered"] == 1
+
+    result = cascade.analyze_document(b"bill")
+    assert result["cascade"]["tier"] == "azure" and result["cascade"]["escalations"] == 1
+
+    # Pages stream from every tier tried, marked provisional until the cascade has chosen
+    partials = []
+    pipeline, cascade = pipeline_for(FixedExtractor(0.5, 30.0), FixedExtractor(0.95, 30.0))
+    assert pipeline.process_document("https://bills/noisy.png", on_page=partials.append)["is_success"]
+    assert [(partial["tier"], partial["provisional"], partial["running_total"]) for partial in partials] == \
+        [("tesseract", True, 30.0), ("azure", True, 30.0)]
+    assert [attempt["reason"] for attempt in result["cascade"]["attempts"]] == ["not reconciled", "accepted"]
+
+    # The request deadline reaches a cloud extractor that takes one, through its breaker and scheduler
+    class DeadlineExtractor(FixedExtractor):
+        def analyze_document(self, page, deadline=None):
+            self.deadline = deadline
+            return super().analyze_document(page)
+
+    from src.extraction.circuit_breaker import BreakerExtractor, CircuitBreaker
+    from src.extraction.scheduler import ProviderLimiter, ScheduledExtractor
+    cloud = DeadlineExtractor(0.95, 30.0)
+    wrapped = BreakerExtractor(ScheduledExtractor(cloud, "azure", limiter=ProviderLimiter("azure", 10.0, 10, 10)),
+                               "azure", CircuitBreaker("azure"))
+    pipeline, cascade = pipeline_for(FixedExtractor(0.5, 30.0), wrapped)
+    deadline = time.monotonic() + 30
+    assert pipeline.process_document("https://bills/noisy.png", deadline=deadline)["is_success"]
+    assert cloud.deadline == deadline
+
+
+def test_hedged_extractor_cuts_slow_primary_within_hedge_budget():
+    from src.extraction.hedging import HedgedExtractor
+    from src.stubs.latency import LatencyStubExtractor
+
+    # Every 4th primary request is stuck on a slow poll
+    primary = LatencyStubExtractor("bimodal:fast_ms=10,slow_ms=2000,slow_fraction=0.25,seed=7", name="azure")
+    secondary = LatencyStubExtractor("constant:ms=20", name="textract")
+    hedger = HedgedExtractor(primary, secondary, delay_percentile=50, initial_delay=0.1,
+                             max_hedge_ratio=0.5, min_samples=5)
+    try:
+        results = [hedger.analyze_document(b"bill") for _ in range(20)]
+    finally:
+        hedger.close()
+
+    metrics = hedger.metrics()
+    slow = [result for result in results if result["hedge"]["hedged"]]
+    assert slow and all(result["answered_by"] == "textract" for result in slow)
+    assert all(result["hedge"]["elapsed"] < 1.0 for result in results)
+    assert metrics["hedged"] == len(slow) and metrics["hedge_wins"] == len(slow)
+    assert metrics["hedge_rate"] <= 0.5 and metrics["latency_saved"] > 0
+    assert primary.cancelled == len(slow)  # the loser is cancelled, not left running
+
+
+def test_hedge_cancels_wrapped_primary_and_keeps_failovers_out_of_its_latencies():
+    import time
+    from src.extraction.circuit_breaker import BreakerExtractor, CircuitBreaker
+    from src.extraction.hedging import HedgedExtractor, hedge_metrics
+    from src.extraction.scheduler import ProviderLimiter, ScheduledExtractor
+    from src.stubs.latency import LatencyStubExtractor
+
+    def production_wrapped(stub):
+        limiter = ProviderLimiter(stub.name, rate=100.0, burst=10, max_concurrency=4)
+        return BreakerExtractor(ScheduledExtractor(stub, stub.name, limiter=limiter), stub.name,
+                                CircuitBreaker(stub.name)), limiter
+
+    # Breaker and scheduler are awaited too, so the slow primary is really cancelled and frees its slot
+    primary = LatencyStubExtractor("constant:ms=2000", name="azure")
+    (azure, azure_limiter), (textract, _) = production_wrapped(primary), production_wrapped(
+        LatencyStubExtractor("constant:ms=20", name="textract"))
+    hedger = HedgedExtractor(azure, textract, "slow-azure", "textract", initial_delay=0.05, max_hedge_ratio=1.0)
+    try:
+        result = hedger.analyze_document(b"bill")
+        time.sleep(0.05)
+        assert result["answered_by"] == "textract" and result["hedge"]["hedged"]
+        assert primary.cancelled == 1
+        assert azure_limiter.metrics()["in_flight"] == 0 and azure_limiter.metrics()["cancelled"] == 1
+        assert hedge_metrics()["slow-azure+textract"]["hedge_wins"] == 1
+    finally:
+        hedger.close()
+    assert "slow-azure+textract" not in hedge_metrics()
+
+    # A failed primary's failover is not a primary latency; a good primary answer is
+    failing = LatencyStubExtractor("constant:ms=10", name="azure",
+                                   result={"line_items": [], "totals": {}, "confidence": 0.0, "error": "HTTP 500"})
+    hedger = HedgedExtractor(failing, LatencyStubExtractor("constant:ms=300", name="textract"), initial_delay=1.0)
+    try:
+        assert hedger.analyze_document(b"bill")["hedge"]["failover"]
+        assert len(hedger._latencies) == 0
+        hedger.extractors["azure"] = LatencyStubExtractor("constant:ms=10", name="azure")
+        hedger.analyze_document(b"bill")
+        assert len(hedger._latencies) == 1 and hedger._latencies[0] < 0.3
+    finally:
+        hedger.close()
+
+
+def test_circuit_breaker_opens_routes_around_backend_and_probes_back():
+    import time
+    from src.extraction.cascade import CascadeTier, ExtractorCascade
+    from src.extraction.circuit_breaker import BreakerExtractor, CircuitBreaker
+
+    class Backend:
+        def __init__(self, name):
+            self.name, self.down, self.calls = name, False, 0
+
+        def analyze_document_strict(self, document):
+            self.calls += 1
+            if self.down:
+                raise ConnectionError(f"{self.name} unavailable")
+            return {"line_items": [{"item_name": "Paracetamol 500mg Tab", "item_amount": 30.0}],
+                    "totals": {"Total": 30.0}, "confidence": 0.95, "answered_by": self.name}
+
+    azure, textract = Backend("azure"), Backend("textract")
+    breaker = CircuitBreaker("azure", window=10, min_calls=4, open_seconds=0.2)
+    cascade = ExtractorCascade([CascadeTier("azure", BreakerExtractor(azure, "azure", breaker), cost=1.0),
+                                CascadeTier("textract", BreakerExtractor(textract, "textract", CircuitBreaker("textract")),
+                                            cost=1.5)], confidence_threshold=0.7)
+
+    # One failure already drops Azure behind Textract (cost 1.0 / health 0.1)
+    azure.down = True
+    assert [cascade.analyze_document(b"bill")["answered_by"] for _ in range(3)] == ["textract"] * 3
+    assert azure.calls == 1 and [tier.name for tier in cascade.route()] == ["textract", "azure"]
+
+    guarded = BreakerExtractor(azure, "azure", breaker)
+    for _ in range(3):
+        guarded.analyze_document(b"bill")
+    assert breaker.state == "open" and azure.calls == 4
+    started = time.monotonic()
+    result = guarded.analyze_document(b"bill")
+    assert result["circuit_open"] and azure.calls == 4 and time.monotonic() - started < 0.01
+
+    # After open_seconds one probe goes through; its success closes the breaker
+    azure.down = False
+    time.sleep(0.25)
+    assert guarded.analyze_document(b"bill")["answered_by"] == "azure"
+    assert breaker.state == "closed"
+    assert cascade.analyze_document(b"bill")["answered_by"] == "azure"
+
+
+def test_backends_are_imported_only_when_selected():
+    import subprocess
+    import sys
+    from config.settings import Settings
+
+    pytest.importorskip("fastapi")
+    probe = ("import sys, src.api.main; "
+             "print(sorted(m for m in ('boto3', 'azure.ai.formrecognizer', 'pytesseract', 'pymupdf') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+    from src.extraction.registry import create_extractor, loaded_backends
+    assert create_extractor("mock").analyze_document.__self__.__class__.__name__ == "MockExtractor"
+    assert "mock" in loaded_backends()
+
+    # Only enabled backends are validated
+    settings = Settings()
+    settings.AZURE_FORM_RECOGNIZER_ENDPOINT = settings.AZURE_FORM_RECOGNIZER_KEY = None
+    settings.AWS_ACCESS_KEY_ID, settings.AWS_SECRET_ACCESS_KEY = "key", "secret"
+    settings.EXTRACTORS = None
+    assert settings.enabled_extractors == ["tesseract", "textract"]
+    settings.validate()
+    settings.EXTRACTORS = "tesseract,azure"
+    with pytest.raises(ValueError, match="AZURE_FORM_RECOGNIZER_ENDPOINT"):
+        settings.validate()
@@ -0,0 +1,171 @@
+import random
+
+
+def test_blocked_duplicate_removal_matches_pairwise_comparison():
+    from benchmarks.bench_dedup import legacy_remove_duplicates, synthetic_items
+    from src.reconciliation.validator import ReconciliationEngine
+
+    rng = random.Random(3)
+    names = ["Dolo 650 Tab", "DOLO 650 TAB", "Dolo 65 Tab", "Dolo 650 Tabs", "Consultation Fee", "Consultation Fees"]
+    # Amounts around the 5% boundary, zero, negative (discounts) and non-finite ones
+    amounts = [100.0, 95.0, 95.01, 104.99, 105.27, 105.26, 0.0, -0.0, -100.0, -96.0, 1e-9, float("nan"), float("inf")]
+    tricky = [{"item_name": rng.choice(names), "item_amount": rng.choice(amounts)} for _ in range(400)]
+
+    for items in [tricky, synthetic_items(300, duplicate_rate=0.3)]:
+        expected = legacy_remove_duplicates(items)
+        unique_items = ReconciliationEngine().reconcile_extraction({"line_items": items}, {})["line_items"]
+        assert [id(item) for item in unique_items] == [id(item) for item in expected]
+
+
+def test_duplicate_index_lookups_stay_bounded_on_long_documents():
+    from src.reconciliation.dedup import DuplicateIndex
+
+    rng = random.Random(5)
+    index = DuplicateIndex(max_candidates=50)
+    compared = []
+    name_candidates = index._name_candidates
+    index._name_candidates = lambda name, names: compared.append(len(names)) or name_candidates(name, names)
+
+    # One block: same amount, same name length, names too different to be duplicates
+    items = [{"item_name": "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(12)),
+              "item_amount": 1000.0} for _ in range(2000)]
+    assert all(index.add(item) for item in items)
+    assert max(compared) == 50
+    # Exact repeats are found by hash, however far back
+    assert index.find(dict(items[0])) is items[0]
+
+
+def test_whole_document_reconciliation_is_uncapped():
+    from benchmarks.bench_dedup import legacy_remove_duplicates
+    from src.reconciliation.session import STREAMING_MAX_CANDIDATES
+    from src.reconciliation.validator import ReconciliationEngine
+
+    rng = random.Random(7)
+    # More items in one block than a streaming session compares against, then a near-duplicate of the oldest
+    items = [{"item_name": "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(12)),
+              "item_amount": 100.0} for _ in range(STREAMING_MAX_CANDIDATES + 44)]
+    items.append({"item_name": "x" + items[0]["item_name"][1:], "item_amount": 100.0})
+
+    expected = legacy_remove_duplicates(items)
+    unique_items = ReconciliationEngine().reconcile_extraction({"line_items": items}, {})["line_items"]
+    assert len(expected) == len(items) - 1
+    assert [id(item) for item in unique_items] == [id(item) for item in expected]
+
+
+def test_batch_reconciliation_matches_per_bill_reconciliation():
+    import numpy as np
+    import pytest
+    from src.reconciliation.columnar import BillColumns, bill_columns
+    from src.reconciliation.validator import ReconciliationEngine
+
+    def item(name, amount, rate, quantity):
+        return {"item_name": name, "item_amount": amount, "item_rate": rate, "item_quantity": quantity}
+
+    extractions = [
+        {"line_items": [item("Dolo 650 Tab", 30.1, 15.05, 2), item("Consultation Fee", 500.0, 500.0, 1)],
+         "totals": {"Total": 530.1}},
+        {"line_items": [item("Room Charges", 1200.0, 1200.0, 1), item("CBC Blood Test", 700.0, 100.0, 3)],
+         "totals": {"AmountDue": 1500.0}},
+        {"line_items": [], "totals": {"Total": 99.0}},
+        {"line_items": [item("Syringe 5ml", 0.1, 0.1, 1), item("Gloves", 0.2, 0.2, 1), {"item_name": "Misc",
+                                                                                          "item_amount": 0.3}],
+         "totals": {}},
+    ]
+    engine = ReconciliationEngine()
+    expected = [engine.reconcile_extraction(extraction, extraction["totals"]) for extraction in extractions]
+
+    batch = engine.reconcile_batch(bill_columns(extractions))
+    assert batch.calculated_total.tolist() == [result["calculated_total"] for result in expected]
+    assert batch.is_reconciled.tolist() == [result["is_reconciled"] for result in expected]
+    assert batch.reconciled_amount.tolist() == [result["reconciled_amount"] for result in expected]
+    assert batch.rate_consistent.tolist() == [True, True, True, False, True, True, True]
+    assert batch.inconsistent_items.tolist() == [0, 1, 0, 0]
+
+    cents = engine.reconcile_batch(bill_columns(extractions, cents=True))
+    assert cents.calculated_total.dtype == np.int64
+    assert cents.calculated_total.tolist() == [53010, 190000, 0, 60]
+    assert cents.is_reconciled.tolist() == batch.is_reconciled.tolist()
+    assert cents.inconsistent_items.tolist() == [0, 1, 0, 0]
+
+    with pytest.raises(ValueError):
+        engine.reconcile_batch(BillColumns(np.zeros(3), np.array([0, 2]), np.zeros(1)))
+
+
+def test_explain_stage_finds_smallest_set_of_lines_behind_a_gap():
+    import numpy as np
+    from src.extraction.stages import ExplainStage, PipelineContext
+    from src.reconciliation.explainer import DiscrepancyExplainer
+    from src.reconciliation.validator import ReconciliationEngine
+
+    def explain(line_items, totals):
+        context = PipelineContext("https://bills/1.png")
+        context.extraction_result = {"line_items": line_items, "totals": totals}
+        context.reconciliation_result = ReconciliationEngine().reconcile_extraction(context.extraction_result, totals)
+        ExplainStage().run(context)
+        return context.reconciliation_result.get("discrepancy_candidates")
+
+    items = [{"item_name": "Room Charges", "item_amount": 120.0}, {"item_name": "Subtotal", "item_amount": 45.5},
+             {"item_name": "CBC Blood Test", "item_amount": 30.0}, {"item_name": "Gloves", "item_amount": 12.25}]
+    candidates = explain(items, {"Total": 162.25})
+    assert candidates[0]["lines"] == [{"kind": "extra_line", "item_name": "Subtotal", "amount": 45.5}]
+    assert candidates[0]["residual"] == 0.0
+
+    candidates = explain(items, {"Total": 249.3, "Tax": 41.55})
+    assert [line["kind"] for line in candidates[0]["lines"]] == ["tax"]
+
+    doubled = [{"item_name": "Dolo 650 Tab", "item_amount": 30.0}, {"item_name": "Dolo 650 Tab", "item_amount": 30.0},
+               {"item_name": "Consultation Fee", "item_amount": 70.0}]
+    candidates = explain(doubled, {"Total": 130.0})
+    assert candidates[0]["lines"][0]["kind"] == "dropped_duplicate"
+    assert explain(doubled, {"Total": 100.0}) is None  # reconciled, nothing to explain
+
+    rng = np.random.default_rng(2)
+    deltas = -rng.integers(100, 100000, 500)
+    target = int(deltas[[7, 99, 250, 401]].sum())
+    found = DiscrepancyExplainer().search(deltas, target)
+    assert found and len(found[0]) <= 4 and abs(int(deltas[list(found[0])].sum()) - target) <= 1
+
+
+def test_reconciliation_session_streams_pages_and_matches_whole_document():
+    import io
+    from PIL import Image
+    from benchmarks.bench_dedup import synthetic_items
+    from src.extraction.pipeline import BillExtractionPipeline
+    from src.preprocessing.decoded_document import DecodedDocument
+    from src.preprocessing.document_processor import DocumentProcessor
+    from src.reconciliation.validator import ReconciliationEngine
+
+    engine = ReconciliationEngine()
+    items = synthetic_items(120, duplicate_rate=0.3)
+    totals = {"Total": 5000.0}
+    session = engine.session()
+    partials = [session.add_page(items[start:start + 25], page_no=str(start // 25 + 1)) for start in range(0, 120, 25)]
+    streamed = session.finish(totals)
+    whole = engine.reconcile_extraction({"line_items": items}, totals)
+    assert [id(item) for item in streamed["line_items"]] == [id(item) for item in whole["line_items"]]
+    assert {key: streamed[key] for key in whole if key not in ("line_items", "removed_duplicates")} == \
+        {key: whole[key] for key in whole if key not in ("line_items", "removed_duplicates")}
+    assert partials[-1]["running_total"] == whole["calculated_total"]
+    assert sum(partial["duplicates_removed"] for partial in partials) == len(whole["removed_duplicates"])
+
+    frames = [Image.new('RGB', (200, 150), 'white') for _ in range(3)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format='TIFF', save_all=True, append_images=frames[1:])
+    processor = DocumentProcessor()
+    processor.fetch_document = lambda url: DecodedDocument(buffer.getvalue(), source_url=url)
+    events = []
+
+    class PageExtractor:
+        def analyze_document(self, page):
+            events.append(("extracted", page.page_no))
+            # Page 3 repeats page 1's line (a carried-over row)
+            name = "Consultation Fee" if page.page_no in (1, 3) else f"Item {page.page_no}"
+            return {"line_items": [{"item_name": name, "item_amount": 100.0}], "totals": {"Total": 200.0},
+                    "confidence": 0.9}
+
+    pipeline = BillExtractionPipeline(use_mock=False, document_processor=processor, extractor=PageExtractor())
+    result = pipeline.process_document("https://bills/three-pages.tiff",
+                                       on_page=lambda partial: events.append(("partial", partial["page_no"])))
+    assert events == [("extracted", 1), ("partial", "1"), ("extracted", 2), ("partial", "2"),
+                      ("extracted", 3), ("partial", "3")]
+    assert result["data"]["total_item_count"] == 2 and result["data"]["reconciled_amount"] == 200.0